@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Startup time of lax: import statements timed in fresh interpreters
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --max-seconds 0.5 --repeat 10
+
+Each statement runs in a new Python process, --repeat times, and the fastest
+time is reported with the heavy modules it imported. With --max-seconds, the
+exit status is 1 if 'import lax' takes longer, or imports a heavy module.
+"""
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import subprocess
+import sys
+
+STATEMENTS = ('import lax',
+              'import lax.lichen',
+              'from lax.lichens import sciencerun0',
+              'from lax.lichens import sciencerun1',
+              'from lax.lichens import postsr1',
+              'from lax.lichens import sciencerun2')
+
+# Modules lax should only import when a lichen needs them
+HEAVY_MODULES = ('lax.lichens', 'pax', 'scipy', 'sklearn', 'matplotlib', 'seaborn', 'hax')
+
+_SCRIPT = """
+import json, sys, time
+start = time.time()
+%s
+seconds = time.time() - start
+print(json.dumps([seconds, [m for m in %r if m in sys.modules]]))
+"""
+
+
+def time_import(statement):
+    """Return the time (s) statement takes in a new interpreter, and the heavy modules it imported"""
+    output = subprocess.check_output([sys.executable, '-c', _SCRIPT % (statement, HEAVY_MODULES)])
+    seconds, modules = json.loads(output.decode().strip().splitlines()[-1])
+    return seconds, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the imports of lax')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float,
+                        help="Fail if 'import lax' takes longer than this")
+    args = parser.parse_args(argv)
+
+    status = 0
+    for statement in STATEMENTS:
+        results = [time_import(statement) for _ in range(args.repeat)]
+        seconds, modules = min(results)
+        print('%-40s %7.3f s  %s' % (statement, seconds, ', '.join(modules)))
+        if statement == 'import lax' and args.max_seconds is not None:
+            if seconds > args.max_seconds or modules:
+                status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
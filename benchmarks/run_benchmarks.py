@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""Throughput benchmarks of the lax cut sets and their lichens
+
+Cut sets are processed on synthetic minitree events (see lax.synthetic)
+under lax.profiling, which gives the time of the set and of each lichen in
+it. Sizes above --chunksize are generated and processed one chunk at a
+time, so 1e8 events only need the memory of one chunk. Peak memory is
+measured on the first chunk, in a separate pass (tracing allocations slows
+processing down).
+
+    python benchmarks/run_benchmarks.py --sizes 1e3 1e5 1e6
+    python benchmarks/run_benchmarks.py --sizes 1e6 --save-baseline baseline.json
+    python benchmarks/run_benchmarks.py --sizes 1e6 --baseline baseline.json
+
+With --baseline, the exit status is 1 if a benchmark processes fewer events
+per second than its baseline by more than --tolerance. Baselines depend on
+the machine; save them where the comparison runs.
+"""
+# -*- coding: utf-8 -*-
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from lax import profiling, synthetic
+
+MODULES = ('sciencerun0', 'sciencerun1', 'postsr1', 'sciencerun2')
+CUT_SETS = ('AllEnergy', 'LowEnergyRn220', 'LowEnergyBackground', 'LowEnergyAmBe',
+            'LowEnergyNG')
+
+
+def get_cut_sets(modules, names, exclude=()):
+    """Return {benchmark name: cut set} of the cut sets of modules"""
+    cut_sets = {}
+    for module_name in modules:
+        module = importlib.import_module('lax.lichens.' + module_name)
+        for name in names:
+            if not hasattr(module, name):
+                continue
+            cuts = getattr(module, name)()
+            cuts.lichen_list = [lichen for lichen in cuts.lichen_list
+                                if lichen.name() not in exclude]
+            cut_sets['%s.%s' % (module_name, name)] = cuts
+    return cut_sets
+
+
+def run(cuts, n, chunksize, seed=0, memory=True):
+    """Process n synthetic events with cuts
+
+    :return: {lichen name or '': (seconds, peak memory)}, '' for the whole set
+    """
+    columns = [column for column in cuts.required_columns() if column in synthetic.COLUMNS]
+    # Warm up: parse cut strings, load models
+    cuts.process(synthetic.make_events(1000, seed=seed, columns=columns))
+
+    seconds = {}
+    peaks = {}
+    for i, chunk in enumerate(synthetic.iter_events(n, chunksize, seed=seed, columns=columns)):
+        if i == 0 and memory:
+            with profiling.profile(memory=True) as profiler:
+                cuts.process(chunk.copy())
+            for record in profiler.records:
+                if record['depth'] <= 1:
+                    name = '' if record['depth'] == 0 else record['lichen']
+                    peaks[name] = record['peak_memory']
+        with profiling.profile() as profiler:
+            cuts.process(chunk)
+        for record in profiler.records:
+            if record['depth'] <= 1:
+                name = '' if record['depth'] == 0 else record['lichen']
+                seconds[name] = seconds.get(name, 0.) + record['wall_time']
+    return dict((name, (seconds[name], peaks.get(name))) for name in seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark lax cut sets on synthetic events')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e3, 1e5, 1e6],
+                        help='Numbers of events (1e3 to 1e8)')
+    parser.add_argument('--modules', nargs='+', default=list(MODULES), choices=MODULES)
+    parser.add_argument('--sets', nargs='+', default=list(CUT_SETS),
+                        help='Names of the cut sets to run')
+    parser.add_argument('--exclude', nargs='*', default=[],
+                        help='Cut names of lichens to leave out, e.g. if their '
+                             'resource files are not available')
+    parser.add_argument('--chunksize', type=float, default=1e6)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Do not measure peak memory')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with the baseline in this JSON file')
+    parser.add_argument('--save-baseline', help='Write the results as a baseline to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction of events per second one may lose before failing')
+    args = parser.parse_args(argv)
+
+    cut_sets = get_cut_sets(args.modules, args.sets, args.exclude)
+    rows = []
+    for size in args.sizes:
+        n = int(size)
+        for benchmark, cuts in sorted(cut_sets.items()):
+            start = time.time()
+            results = run(cuts, n, int(args.chunksize), args.seed, args.memory)
+            print('%s on %d events: %.1f s' % (benchmark, n, time.time() - start))
+            for name, (seconds, peak_memory) in results.items():
+                rows.append({'size': n,
+                             'benchmark': benchmark + ('/' + name if name else ''),
+                             'seconds': seconds,
+                             'events_per_second': n / seconds if seconds else float('inf'),
+                             'peak_memory': peak_memory})
+    result = pd.DataFrame(rows, columns=['size', 'benchmark', 'seconds',
+                                         'events_per_second', 'peak_memory'])
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        result['baseline'] = [baseline.get(str(size), {}).get(benchmark)
+                              for size, benchmark in zip(result['size'], result['benchmark'])]
+        result['ratio'] = result['events_per_second'] / result['baseline'].astype(float)
+        slower = result[result['ratio'] < 1 - args.tolerance]
+        if len(slower):
+            print('Slower than the baseline:')
+            print(slower.to_string(index=False))
+            status = 1
+
+    pd.set_option('display.width', 200)
+    print(result.to_string(index=False))
+
+    if args.output:
+        result.to_json(args.output, orient='records', indent=2)
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as f:
+                baseline = json.load(f)
+        for size, benchmark, rate in zip(result['size'], result['benchmark'],
+                                         result['events_per_second']):
+            baseline.setdefault(str(size), {})[benchmark] = rate
+        with open(args.save_baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
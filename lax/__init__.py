@@ -2,4 +2,10 @@
 
 __version__ = '1.7.2'
 
-from . import lichens
+
+def __getattr__(name):
+    # lax.lichens is imported on first use, so that importing lax is quick
+    if name == 'lichens':
+        import importlib
+        return importlib.import_module('lax.lichens')
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
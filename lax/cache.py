@@ -0,0 +1,229 @@
+"""In-memory cache of lichen results
+
+When enabled, Lichen.process first looks up the columns a lichen produces
+(see Lichen.produced_columns) under a key made of
+
+  * a fingerprint of the lichen: its class, the code of its methods, version,
+    string and other parameters (for cut sets, those of all lichens in it),
+  * a hash of the index and the input columns of the DataFrame (all columns
+    for lichens that do not declare their input_columns), and
+  * the run-level inputs of the lichen for the runs in the DataFrame (see
+    Lichen.run_state), such as the run end times used by DAQVeto.
+
+Results also depend on the files the lichen loaded through lax.resources
+(models, tables). These are recorded when a result is stored, and the
+result is used only while the same versions of the files are in use (see
+resources.state).
+
+Applying a lichen to data it has already seen, e.g. LowEnergyBackground after
+LowEnergyRn220 (which share most lichens), then only copies columns.
+Least recently used results are dropped once the cache exceeds its size.
+
+    from lax import cache
+    cache.enable(max_bytes=4e9)
+"""
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lax import resources
+
+_active = None
+
+
+class ResultCache(object):
+    """Least recently used store of lichen results
+
+    :param max_bytes: Maximum total size of the stored columns
+    """
+
+    def __init__(self, max_bytes=1e9):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (column names, arrays, nbytes, files used)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return 'ResultCache(%d results, %d bytes, %d hits, %d misses)' % (
+            len(self), self.nbytes, self.hits, self.misses)
+
+    def key(self, lichen, df):
+        if declares_inputs(lichen):
+            columns = lichen.required_columns()
+        else:
+            columns = list(df.columns)
+        return fingerprint(lichen), frame_hash(df, columns), run_state(lichen, df)
+
+    def restore(self, key, df):
+        """Add the columns stored under key to df, return False if there are none"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and any(resources.state(path) != mtime
+                                         for path, mtime in entry[3].items()):
+                # Made with other versions of the files it used
+                self.nbytes -= entry[2]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False
+            self._entries[key] = entry    # Now most recently used
+            self.hits += 1
+        for column, values in zip(entry[0], entry[1]):
+            df.loc[:, column] = values
+        return True
+
+    def store(self, key, lichen, df, files=None):
+        """Store the columns lichen added to df under key
+
+        :param files: {path: resources.state(path)} of the files lichen used
+        """
+        produced = set(lichen.produced_columns())
+        columns = [column for column in df.columns if column in produced]
+        arrays = [df[column].values.copy() for column in columns]
+        nbytes = sum(array.nbytes for array in arrays)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[2]
+            self._entries[key] = (columns, arrays, nbytes, dict(files or {}))
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+def enable(max_bytes=1e9):
+    """Cache lichen results from now on, return the cache"""
+    global _active
+    _active = ResultCache(max_bytes)
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def get_cache():
+    """Return the active ResultCache, or None if caching is disabled"""
+    return _active
+
+
+def fingerprint(lichen):
+    """Return a hashable description of what lichen computes
+
+    This covers the class, the code of the methods that compute the cut (see
+    method_code), and all public non-method attributes of the class and the
+    instance: version, string, parameter values, the lichens of a cut set, etc.
+    """
+    # Local import, lax.lichen imports this module
+    from lax.lichen import Lichen
+
+    attributes = {}
+    for klass in reversed(type(lichen).__mro__):
+        attributes.update(vars(klass))
+    attributes.update(vars(lichen))
+
+    items = []
+    for name in sorted(attributes):
+        value = attributes[name]
+        if name.startswith('_') or callable(value) or isinstance(
+                value, (staticmethod, classmethod, property)):
+            continue
+        if isinstance(value, (list, tuple)) and any(isinstance(x, Lichen) for x in value):
+            value = tuple(fingerprint(x) if isinstance(x, Lichen) else repr(x) for x in value)
+        elif isinstance(value, np.ndarray):
+            value = hashlib.sha1(np.ascontiguousarray(value).view(np.uint8)).hexdigest()
+        else:
+            value = repr(value)
+        items.append((name, value))
+    return (type(lichen).__module__, type(lichen).__name__, method_code(type(lichen)),
+            tuple(items))
+
+
+def method_code(klass, methods=('pre', '_process', '_evaluate', 'post')):
+    """Return a hash of the code of the given methods of klass and its base classes
+
+    Editing e.g. _process of a lichen in a notebook session then gives new results
+    rather than those cached for the old code.
+    """
+    h = hashlib.sha1()
+    for base in klass.__mro__:
+        for name in methods:
+            function = vars(base).get(name)
+            code = getattr(function, '__code__', None)
+            if code is not None:
+                h.update(('%s.%s' % (base.__name__, name)).encode())
+                _update_code(h, code)
+    return h.hexdigest()
+
+
+def _update_code(h, code):
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            # Nested function, lambda or comprehension
+            _update_code(h, const)
+        elif isinstance(const, frozenset):
+            # Same hash in every session, for incremental results kept in files
+            h.update(repr(sorted(repr(x) for x in const)).encode())
+        else:
+            h.update(repr(const).encode())
+    h.update(repr(code.co_names).encode())
+
+
+def declares_inputs(lichen):
+    """Return whether lichen (and every lichen in it) declares its input_columns
+
+    A lichen without input_columns may read any column of the DataFrame, so
+    its results are keyed on all columns.
+    """
+    # Local import, lax.lichen imports this module
+    from lax.lichen import ManyLichen
+
+    if isinstance(lichen, ManyLichen):
+        return all(declares_inputs(x) for x in lichen.lichen_list)
+    return bool(lichen.required_columns())
+
+
+def run_state(lichen, df):
+    """Return a hashable description of the run-level inputs of lichen for the runs in df"""
+    # Local import, lax.lichen imports this module
+    from lax.lichen import Lichen, ManyLichen
+
+    def uses_run_state(x):
+        if isinstance(x, ManyLichen):
+            return any(uses_run_state(y) for y in x.lichen_list)
+        return type(x).run_state is not Lichen.run_state
+
+    if 'run_number' not in df.columns or not uses_run_state(lichen):
+        return ()
+    states = lichen.run_state(np.unique(df['run_number'].values))
+    return tuple((run_number, repr(states[run_number])) for run_number in sorted(states))
+
+
+def frame_hash(df, columns):
+    """Return a hash of the index and the given columns of df"""
+    h = hashlib.sha1()
+    for name, values in [('__index__', df.index.values)] + [(c, df[c].values) for c in columns]:
+        h.update(str((name, str(values.dtype), values.shape)).encode())
+        if values.dtype.kind in 'biufcmM':
+            h.update(np.ascontiguousarray(values).view(np.uint8))
+        else:
+            h.update(pd.util.hash_array(np.asarray(values, dtype=object)).view(np.uint8))
+    return h.hexdigest()
@@ -0,0 +1,299 @@
+"""Apply cut sets to Polars LazyFrames and Arrow tables
+
+StringLichen and RangeLichen cuts are translated into native polars
+expressions, so polars can fuse, parallelise and stream the selection, e.g.
+over Parquet copies of the minitrees:
+
+    import polars as pl
+    from lax import columnar
+    lf = columnar.apply(sciencerun1.LowEnergyBackground(),
+                        pl.scan_parquet('sr1_background/*.parquet'))
+    lf.filter(pl.col('CutLowEnergyBackground')).sink_parquet('selected.parquet')
+
+Lichens that cannot be translated (imperative ones, or strings reading
+registered derived variables or helper columns of other lichens) are
+evaluated together by one NumPy function per batch, with Lichen._evaluate.
+
+Cut strings keep their numpy meaning: comparisons with NaN are False (polars
+orders NaN above all numbers), and nulls in float columns are read as NaN.
+polars (and pyarrow, for Arrow tables) is only needed when this module is used.
+"""
+# -*- coding: utf-8 -*-
+
+import ast
+from collections import OrderedDict
+
+import numpy as np
+
+from lax.expression import LOCAL_PREFIX, constant_value, is_constant
+from lax.lichen import (ManyLichen, RangeLichen, StringLichen, columns_read,
+                        evaluate_lichens, is_declarative)
+
+# Name of the temporary struct column holding the results of the NumPy fallback
+FALLBACK_COLUMN = '_lax_fallback'
+
+# Functions of cut strings that are methods of polars expressions
+METHODS = ('sin', 'cos', 'tan', 'exp', 'log', 'log10', 'log1p', 'sqrt',
+           'sinh', 'cosh', 'tanh', 'arcsin', 'arccos', 'arctan', 'arccosh',
+           'arcsinh', 'arctanh', 'abs')
+
+
+def _polars():
+    import polars  # pylint: disable=import-error
+    return polars
+
+
+class _Translator(object):
+    """Translate the normalised tree of an Expression into a polars expression
+
+    :param columns: {name: polars expression} of the columns the string can read
+    :param parameters: {name: value} of '@' parameters
+    """
+
+    def __init__(self, columns, parameters=None):
+        self.pl = _polars()
+        self.columns = columns
+        self.parameters = parameters or {}
+
+    def translate(self, node):
+        if isinstance(node, ast.Expression):
+            node = node.body
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None and is_constant(node):
+            method = self.visit_Constant
+        if method is None:
+            raise ValueError('Cannot translate %s' % node.__class__.__name__)
+        return method(node)
+
+    def is_nan(self, node, expr):
+        """Return an expression True where expr is NaN, None if it cannot be"""
+        if is_constant(node):
+            value = constant_value(node)
+            return self.pl.lit(True) if value != value else None
+        return expr.cast(self.pl.Float64).is_nan()
+
+    def visit_Constant(self, node):
+        return self.pl.lit(constant_value(node))
+
+    def visit_Name(self, node):
+        if node.id.startswith(LOCAL_PREFIX):
+            name = node.id[len(LOCAL_PREFIX):]
+            if name not in self.parameters:
+                raise ValueError('No value given for parameter @%s' % name)
+            value = self.parameters[name]
+            if not np.isscalar(value):
+                raise ValueError('Parameter @%s is not a scalar' % name)
+            return self.pl.lit(value.item() if isinstance(value, np.generic) else value)
+        if node.id not in self.columns:
+            raise ValueError('Column %s is not available' % node.id)
+        return self.columns[node.id]
+
+    def visit_BinOp(self, node):
+        left, right = self.translate(node.left), self.translate(node.right)
+        op = type(node.op)
+        if op is ast.Add:
+            return left + right
+        if op is ast.Sub:
+            return left - right
+        if op is ast.Mult:
+            return left * right
+        if op is ast.Div:
+            return left / right
+        if op is ast.Mod:
+            return left % right
+        if op is ast.FloorDiv:
+            return left // right
+        if op is ast.Pow:
+            exponent = constant_value(node.right) if is_constant(node.right) else None
+            if not (isinstance(exponent, int) and exponent >= 0):
+                # polars refuses negative integer powers of integers
+                left = left.cast(self.pl.Float64)
+            return left.pow(right)
+        if op is ast.BitAnd:
+            return left & right
+        if op is ast.BitOr:
+            return left | right
+        raise ValueError('Cannot translate operator %s' % op.__name__)
+
+    def visit_UnaryOp(self, node):
+        operand = self.translate(node.operand)
+        op = type(node.op)
+        if op is ast.USub:
+            return -operand
+        if op is ast.UAdd:
+            return operand
+        return ~operand
+
+    def visit_Compare(self, node):
+        left_node, right_node = node.left, node.comparators[0]
+        left, right = self.translate(left_node), self.translate(right_node)
+        op = type(node.ops[0])
+        result = {ast.Lt: lambda: left < right,
+                  ast.LtE: lambda: left <= right,
+                  ast.Gt: lambda: left > right,
+                  ast.GtE: lambda: left >= right,
+                  ast.Eq: lambda: left == right,
+                  ast.NotEq: lambda: left != right}[op]()
+        for nan in (self.is_nan(left_node, left), self.is_nan(right_node, right)):
+            if nan is None:
+                continue
+            # As in numpy: NaN is unequal to everything, and not ordered
+            result = (result | nan) if op is ast.NotEq else (result & ~nan)
+        return result
+
+    def visit_Call(self, node):
+        name = node.func.id
+        args = [self.translate(arg) for arg in node.args]
+        if name == 'arctan2' and len(args) == 2:
+            return self.pl.arctan2(args[0], args[1])
+        if name in METHODS and len(args) == 1:
+            return getattr(args[0], name)()
+        # expm1 has no polars equivalent of the same precision
+        raise ValueError('Cannot translate function %s' % name)
+
+
+def to_polars(expression, columns, parameters=None):
+    """Translate an Expression (see lax.expression) into a polars expression
+
+    :param columns: {name: polars expression} of the columns the string can read
+    :param parameters: {name: value} of '@' parameters
+    :raises ValueError: if the expression cannot be translated
+    """
+    return _Translator(columns, parameters).translate(expression.tree)
+
+
+def lichen_expression(lichen, columns):
+    """Return a polars expression of the cut of lichen, None if it cannot be translated
+
+    :param columns: {name: polars expression} of the available columns
+    """
+    pl = _polars()
+    if not is_declarative(lichen):
+        return None
+    if isinstance(lichen, StringLichen):
+        try:
+            expr = to_polars(lichen.expression(), columns, lichen.get_parameters())
+        except ValueError:
+            return None
+    elif isinstance(lichen, RangeLichen):
+        if lichen.variable not in columns:
+            return None
+        values = columns[lichen.variable]
+        low, high = lichen.allowed_range
+        # NaN fails one of the bounds in numpy
+        expr = (values > low) & (values < high) & ~values.cast(pl.Float64).is_nan()
+    else:
+        scope = dict(columns)
+        for each in lichen.get_evaluation_list():
+            cut = lichen_expression(each, scope)
+            if cut is None:
+                return None
+            scope[each.name()] = cut
+        expr = pl.all_horizontal([scope[name] for name in lichen.get_cut_names()]
+                                 or [pl.lit(True)])
+    return expr.fill_null(False).alias(lichen.name())
+
+
+def translate(lichen, schema):
+    """Split a lichen or cut set into polars expressions and a NumPy fallback
+
+    :param lichen: Lichen, usually a ManyLichen
+    :param schema: {column name: polars dtype} of the data
+    :return: OrderedDict {cut name: polars expression} of the translated
+             lichens, and the list of the other lichens, in evaluation order
+    """
+    pl = _polars()
+    columns = {}
+    for name, dtype in schema.items():
+        column = pl.col(name)
+        if dtype in (pl.Float32, pl.Float64):
+            column = column.fill_null(float('nan'))
+        columns[name] = column
+
+    if not isinstance(lichen, ManyLichen):
+        lichens = [lichen]
+    elif is_declarative(lichen):
+        lichens = lichen.get_evaluation_list()
+    else:
+        # Helper columns of the set are made by the set itself
+        return OrderedDict(), [lichen]
+
+    expressions = OrderedDict()
+    fallback = []
+    for each in lichens:
+        expr = lichen_expression(each, columns)
+        if expr is None:
+            fallback.append(each)
+        else:
+            expressions[each.name()] = columns[each.name()] = expr
+    return expressions, fallback
+
+
+def _fallback_function(lichens, names):
+    """Return the function computing the cuts of lichens on a batch (struct Series)"""
+    pl = _polars()
+
+    def evaluate(batch):
+        data = OrderedDict((name, batch.struct.field(name).to_numpy()) for name in names)
+        return pl.DataFrame(evaluate_lichens(lichens, data)).to_struct(batch.name)
+
+    return evaluate
+
+
+def apply(lichen, data):
+    """Add the cut columns of lichen to data
+
+    The columns are those of ManyLichen.evaluate_cuts: one per lichen of the
+    set and the combined cut. Helper columns are not added.
+
+    :param lichen: Lichen, usually a ManyLichen
+    :param data: polars LazyFrame or DataFrame, or pyarrow Table
+    :return: data with the cut columns, of the same type
+    """
+    pl = _polars()
+    if isinstance(data, pl.LazyFrame):
+        lf = data
+    elif isinstance(data, pl.DataFrame):
+        lf = data.lazy()
+    elif type(data).__module__.startswith('pyarrow'):
+        lf = pl.from_arrow(data).lazy()
+    else:
+        raise TypeError('Cannot apply lichens to %s, expected a polars frame '
+                        'or pyarrow Table' % type(data).__name__)
+
+    schema = lf.collect_schema()
+    lichen.check_columns(list(schema.names()))
+    expressions, fallback = translate(lichen, schema)
+
+    result = lf
+    if expressions:
+        result = result.with_columns(list(expressions.values()))
+    if fallback:
+        # Columns the fallback lichens read from data or from translated cuts
+        available = set(schema.names()) | set(expressions)
+        names = [column for column in columns_read(fallback) if column in available]
+        names = names or list(schema.names())[:1]
+        cut_names = [each.name() for each in fallback]
+        udf = pl.struct(names).map_batches(
+            _fallback_function(fallback, names),
+            return_dtype=pl.Struct([pl.Field(name, pl.Boolean) for name in cut_names]),
+            is_elementwise=True)
+        result = result.with_columns(udf.alias(FALLBACK_COLUMN)).unnest(FALLBACK_COLUMN)
+
+    if isinstance(lichen, ManyLichen):
+        cut_names = lichen.get_cut_names()
+        result = result.with_columns(
+            pl.all_horizontal([pl.col(name) for name in cut_names] or [pl.lit(True)])
+            .alias(lichen.name()))
+        cut_names = cut_names + [lichen.name()]
+    else:
+        cut_names = [lichen.name()]
+    result = result.select([name for name in schema.names() if name not in cut_names] +
+                           cut_names)
+
+    if isinstance(data, pl.LazyFrame):
+        return result
+    result = result.collect()
+    if isinstance(data, pl.DataFrame):
+        return result
+    return result.to_arrow()
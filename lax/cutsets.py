@@ -0,0 +1,79 @@
+"""Apply several cut sets to the same DataFrame
+
+The cut sets of a science run (AllEnergy, LowEnergyRn220, LowEnergyBackground,
+...) share most of their lichens. process_cut_sets evaluates each distinct
+lichen (same class, version and parameters, see lax.cache.fingerprint) only
+once, and derives the combined cut of every set from the shared columns.
+"""
+# -*- coding: utf-8 -*-
+
+from lax.cache import fingerprint
+from lax.lichen import _aligned
+
+
+class SharedResults(object):
+    """Track which lichen last wrote each column of a DataFrame
+
+    A lichen is evaluated again only if one of the columns it reads or
+    produces was written by something else since it was last evaluated.
+    """
+
+    def __init__(self):
+        self.writers = {}     # Column -> key of what wrote it last
+        self.evaluated = {}   # Lichen key -> writers of its columns after it was evaluated
+
+    def _state(self, lichen):
+        columns = lichen.required_columns() + lichen.produced_columns()
+        return tuple(self.writers.get(column) for column in columns)
+
+    def mark(self, columns, key=None):
+        """Record that columns were written by key (None if unknown)"""
+        for column in columns:
+            self.writers[column] = key
+
+    def apply(self, df, lichen):
+        """Process df with lichen unless its columns are still up to date
+
+        :return: df and the cut column of lichen as an array (as ManyLichen._apply)
+        """
+        key = fingerprint(lichen)
+        index = df.index
+        if self.evaluated.get(key) != self._state(lichen):
+            df = lichen.process(df)
+            self.mark([column for column in lichen.produced_columns()
+                       if column in df.columns], key)
+            self.evaluated[key] = self._state(lichen)
+        # Rows the lichen dropped fail
+        return df, _aligned(df[lichen.name()], index, False)
+
+
+def process_cut_sets(cut_sets, df):
+    """Process df with each cut set, evaluating lichens shared between sets once
+
+    The result is the same as that of
+
+        for cuts in cut_sets:
+            df = cuts.process(df)
+
+    Sets evaluated with short_circuit or n_threads are processed as usual,
+    without sharing.
+
+    :param cut_sets: List of ManyLichens
+    :param df: DataFrame of events
+    :return: df with the columns of all cut sets
+    """
+    shared = SharedResults()
+    for cuts in cut_sets:
+        if cuts.short_circuit or (cuts.n_threads or 1) > 1:
+            df = cuts.process(df)
+            shared.mark(cuts.produced_columns())
+            continue
+
+        shared.mark(cuts.derived_columns, fingerprint(cuts))
+        cuts._shared_results = shared
+        try:
+            df = cuts.process(df)
+        finally:
+            cuts._shared_results = None
+        shared.mark([cuts.name()])
+    return df
@@ -0,0 +1,269 @@
+"""Derived quantities shared by several lichens
+
+Many lichens compute the same helper quantity (the radius, the corrected S2
+area fraction top, ...) in their pre() method. Each such quantity is defined
+once here, by name. Within a processing call (see memoize) it is computed
+once per dataset and reused by every lichen asking for it.
+"""
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+REGISTRY = OrderedDict()   # Name -> DerivedVariable
+
+_memo = {}                 # (name, id(key)) -> (key, values), see memoize
+_memo_depth = 0
+_memo_lock = threading.Lock()
+
+
+class DerivedVariable(object):
+    """A named quantity computed from DataFrame columns
+
+    :param name: Name of the variable (and of the column lichens store it in)
+    :param inputs: Columns (or other derived variables) it is computed from
+    :param function: Function taking a Columns object, returning an array
+    """
+
+    def __init__(self, name, inputs, function):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.function = function
+        self.__doc__ = function.__doc__
+
+    def __repr__(self):
+        return 'DerivedVariable(%s from %s)' % (self.name, ', '.join(self.inputs))
+
+    def compute(self, columns):
+        return np.asarray(self.function(columns))
+
+
+def register(name, inputs):
+    """Decorator adding a derived variable to the registry"""
+    def decorator(function):
+        REGISTRY[name] = DerivedVariable(name, inputs, function)
+        return function
+    return decorator
+
+
+def get_variable(name):
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise KeyError('No derived variable named %s' % name)
+
+
+class Columns(object):
+    """Lazy view of the columns of a dataset, extended with the registry
+
+    The dataset is a DataFrame, a mapping of column name to array, or a numpy
+    structured array. A name is looked up in the helper arrays stored by
+    lichens (see __setitem__), in the memo of the current processing call,
+    then in the dataset, and is otherwise computed from its registered
+    definition. Both c['cs2_top'] and c.cs2_top give a numpy array.
+
+    :param float32: Give float64 columns of the dataset as float32 copies
+                    (made once per Columns), so derived variables are
+                    computed in single precision too. Columns that already
+                    are float32 are not copied.
+    """
+
+    def __init__(self, data, float32=False):
+        self.data = data
+        self.float32 = float32
+        self.added = OrderedDict()   # Helper arrays stored by lichens, by name
+        self._key = data.index if isinstance(data, pd.DataFrame) else data
+        if float32:
+            # Do not share memoized values with double precision evaluation
+            self._key = (self._key, 'float32')
+        self._fields = {}
+        self._single = None
+
+    def __getitem__(self, name):
+        if name in self.added:
+            return self.added[name]
+        values = _recall(self._key, name)
+        if values is not None:
+            return values
+        if name in self._names():
+            if isinstance(self.data, np.ndarray) or self.float32:
+                return self._field(name)
+            return np.asarray(self.data[name])
+        return self.compute(name)
+
+    def __setitem__(self, name, values):
+        """Store a helper array, e.g. one of the derived_columns of a lichen"""
+        self.added[name] = np.asarray(values)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in ('data', 'added', 'float32'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(str(e))
+
+    def __contains__(self, name):
+        return name in self.added or name in self._names() or name in REGISTRY
+
+    def __len__(self):
+        if isinstance(self.data, (pd.DataFrame, np.ndarray)):
+            return len(self.data)
+        for values in self.data.values():
+            return len(values)
+        return 0
+
+    @property
+    def index(self):
+        """Index of the DataFrame, or a RangeIndex for other datasets"""
+        if isinstance(self.data, pd.DataFrame):
+            return self.data.index
+        return pd.RangeIndex(len(self))
+
+    def single(self):
+        """Return a float32 view of these columns (see float32), sharing their helper arrays"""
+        if self.float32:
+            return self
+        if self._single is None:
+            self._single = Columns(self.data, float32=True)
+            self._single.added = self.added
+        return self._single
+
+    def _field(self, name):
+        # Fields of a structured array are strided, and float32 columns are
+        # converted: make each copy once
+        if name not in self._fields:
+            values = np.ascontiguousarray(self.data[name])
+            if self.float32 and values.dtype == np.float64:
+                values = values.astype(np.float32)
+            self._fields[name] = values
+        return self._fields[name]
+
+    def _names(self):
+        if isinstance(self.data, pd.DataFrame):
+            return self.data.columns
+        if isinstance(self.data, np.ndarray):
+            return column_names(self.data)
+        return self.data
+
+    def compute(self, name):
+        """Return variable name from its registered definition, ignoring any column with that name"""
+        values = _recall(self._key, name)
+        if values is None:
+            values = get_variable(name).compute(self)
+            _remember(self._key, name, values)
+        return values
+
+
+def column_names(data):
+    """Return the column names of a DataFrame, structured array or mapping of arrays"""
+    if isinstance(data, pd.DataFrame):
+        return list(data.columns)
+    if isinstance(data, np.ndarray):
+        if data.dtype.names is None:
+            raise TypeError('Expected a structured array, got one of dtype %s' % data.dtype)
+        return list(data.dtype.names)
+    return list(data)
+
+
+def compute(df, name):
+    """Return derived variable name for the events in df"""
+    return Columns(df).compute(name)
+
+
+def add(df, *names):
+    """Store derived variables as columns of df, and return df"""
+    columns = Columns(df)
+    for name in names:
+        df.loc[:, name] = columns.compute(name)
+    return df
+
+
+@contextmanager
+def memoize():
+    """Keep derived variables computed inside this block
+
+    Values are remembered per DataFrame index (or per mapping or structured
+    array), so lichens working on the same rows share them. The columns they
+    are computed from should not change within the block. Blocks can be
+    nested; the memo is cleared when the outermost one exits.
+    """
+    global _memo_depth
+    with _memo_lock:
+        _memo_depth += 1
+    try:
+        yield
+    finally:
+        with _memo_lock:
+            _memo_depth -= 1
+            if not _memo_depth:
+                _memo.clear()
+
+
+def _recall(key, name):
+    entry = _memo.get((name, id(key)))
+    if entry is None or entry[0] is not key:
+        return None
+    return entry[1]
+
+
+def _remember(key, name, values):
+    if _memo_depth:
+        # Keep the key alive, so its id is not reused during the block
+        _memo[(name, id(key))] = (key, values)
+
+
+##
+# Definitions
+##
+
+@register('r', ('x', 'y'))
+def _r(c):
+    """Radius of the TPF 2D FDC position"""
+    return np.sqrt(c.x * c.x + c.y * c.y)
+
+
+@register('r_3d_nn', ('x_3d_nn', 'y_3d_nn'))
+def _r_3d_nn(c):
+    """Radius of the NN 3D FDC position"""
+    return np.sqrt(c.x_3d_nn ** 2 + c.y_3d_nn ** 2)
+
+
+@register('phi_3d_nn_tf', ('x_3d_nn_tf', 'y_3d_nn_tf', 'r_3d_nn_tf'))
+def _phi_3d_nn_tf(c):
+    """Azimuth of the TensorFlow NN 3D FDC position"""
+    return np.arccos(c.x_3d_nn_tf / c.r_3d_nn_tf) * np.sign(c.y_3d_nn_tf)
+
+
+@register('cxys2', ('cs2_top', 'cs2_bottom', 's2_lifetime_correction'))
+def _cxys2(c):
+    """S2 corrected for position only (not electron lifetime)"""
+    return (c.cs2_top + c.cs2_bottom) / c.s2_lifetime_correction
+
+
+@register('cs2_aft', ('cs2_top', 'cs2_bottom'))
+def _cs2_aft(c):
+    """Corrected S2 area fraction top
+
+    The SR0 CS2AreaFractionTop cut uses cs2_top / cs2 instead, and keeps its own pre().
+    """
+    return c.cs2_top / (c.cs2_top + c.cs2_bottom)
+
+
+@register('ces', ('cs1_nn_tf', 'cs2_bottom_nn_tf', 'z_3d_nn_tf'))
+def _ces(c):
+    """Combined energy scale (keV) for the SR1 high energy analyses"""
+    w = 13.7e-3
+    g1 = 0.14798 + (0.00007 * c.z_3d_nn_tf)
+    g2 = 10.504 - (0.015 * c.z_3d_nn_tf)
+    return w * (c.cs1_nn_tf / g1 + c.cs2_bottom_nn_tf / g2)
+
+
+@register('log_cs_ratio', ('cs1', 'cs2'))
+def _log_cs_ratio(c):
+    """log10(cs2 / cs1)"""
+    return np.log10(c.cs2 / c.cs1)
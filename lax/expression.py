@@ -0,0 +1,296 @@
+"""Compiled cut expressions
+
+StringLichen cut strings are written in the ``DataFrame.eval`` dialect of
+pandas.  Instead of handing the string to ``df.eval`` on every call, it is
+parsed once into an Expression: the columns it reads are resolved, the syntax
+tree is normalised and compiled, and later calls only bind arrays and execute.
+numexpr is used when it is installed (as pandas does), otherwise numpy.
+
+Strings using syntax beyond elementwise arithmetic (attribute access such as
+``.str.contains``, string literals, ``in``, keyword arguments) are handed to
+``df.eval`` as before, see FrameExpression.
+"""
+# -*- coding: utf-8 -*-
+
+import ast
+import io
+import tokenize
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:  # pragma: no cover
+    numexpr = None
+
+# Prefix given to '@name' local variables (parameters) in the compiled tree
+LOCAL_PREFIX = '_lax_local_'
+
+# Functions allowed in cut strings (same set as pandas.eval)
+FUNCTIONS = ('sin', 'cos', 'tan', 'exp', 'log', 'log10', 'expm1', 'log1p',
+             'sqrt', 'sinh', 'cosh', 'tanh', 'arcsin', 'arccos', 'arctan',
+             'arccosh', 'arcsinh', 'arctanh', 'abs', 'arctan2')
+
+BINARY_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+                    ast.Pow: '**', ast.Mod: '%', ast.FloorDiv: '//',
+                    ast.BitAnd: '&', ast.BitOr: '|'}
+UNARY_OPERATORS = {ast.USub: '-', ast.UAdd: '+', ast.Invert: '~'}
+COMPARISONS = {ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+               ast.Eq: '==', ast.NotEq: '!='}
+
+_PLANS = {}
+
+
+class UnsupportedSyntax(ValueError):
+    """The cut string is valid, but not only elementwise operations"""
+
+
+def get_expression(string):
+    """Return the (cached) Expression for a cut string
+
+    A FrameExpression is returned for strings with syntax Expression does
+    not support.
+    """
+    plan = _PLANS.get(string)
+    if plan is None:
+        try:
+            plan = Expression(string)
+        except UnsupportedSyntax as error:
+            plan = FrameExpression(string, str(error))
+        _PLANS[string] = plan
+    return plan
+
+
+def clear_cache():
+    """Forget all compiled expressions"""
+    _PLANS.clear()
+
+
+def _preprocess(string):
+    """Rewrite pandas.eval syntax into plain python syntax
+
+    Like pandas, '&' and '|' get the precedence of 'and' and 'or', so
+    "a < 1 | b > 2" means "(a < 1) | (b > 2)". '@name' becomes a local name.
+    """
+    result = []
+    is_local = False
+    tokens = tokenize.generate_tokens(io.StringIO(string.strip()).readline)
+    for toknum, tokval, _, _, _ in tokens:
+        if toknum == tokenize.OP and tokval == '&':
+            toknum, tokval = tokenize.NAME, 'and'
+        elif toknum == tokenize.OP and tokval == '|':
+            toknum, tokval = tokenize.NAME, 'or'
+        elif toknum == tokenize.OP and tokval == '@':
+            is_local = True
+            continue
+        elif toknum == tokenize.NAME and is_local:
+            tokval = LOCAL_PREFIX + tokval
+            is_local = False
+        elif toknum in (tokenize.NL, tokenize.NEWLINE):
+            continue
+        result.append((toknum, tokval))
+    return tokenize.untokenize(result).strip()
+
+
+class _Normalizer(ast.NodeTransformer):
+    """Turn a parsed cut string into a tree of elementwise operations only"""
+
+    def generic_visit(self, node):
+        raise UnsupportedSyntax('Unsupported syntax in cut string: %s' %
+                         node.__class__.__name__)
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in BINARY_OPERATORS:
+            return self.generic_visit(node)
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            node.op = ast.Invert()
+        if type(node.op) not in UNARY_OPERATORS:
+            return self.generic_visit(node)
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        # Chained comparisons a < b < c become (a < b) & (b < c)
+        operands = [self.visit(node.left)] + [self.visit(x) for x in node.comparators]
+        result = None
+        for i, op in enumerate(node.ops):
+            if type(op) not in COMPARISONS:
+                return self.generic_visit(node)
+            comparison = ast.Compare(left=operands[i], ops=[op],
+                                     comparators=[operands[i + 1]])
+            if result is None:
+                result = comparison
+            else:
+                result = ast.BinOp(left=result, op=ast.BitAnd(), right=comparison)
+        return result
+
+    def visit_Call(self, node):
+        if (not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or
+                node.keywords):
+            raise UnsupportedSyntax('Unsupported function call in cut string')
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_Name(self, node):
+        if node.id in ('True', 'False'):
+            return ast.copy_location(ast.Constant(value=node.id == 'True'), node)
+        return node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (bool, int, float)):
+            return self.generic_visit(node)
+        return node
+
+
+def constant_value(node):
+    """Return the python value of a constant node"""
+    return node.value
+
+
+def is_constant(node):
+    return isinstance(node, ast.Constant)
+
+
+def to_string(node):
+    """Render a normalised tree as a fully parenthesised expression string"""
+    if isinstance(node, ast.Expression):
+        return to_string(node.body)
+    if isinstance(node, ast.BinOp):
+        return '(%s %s %s)' % (to_string(node.left), BINARY_OPERATORS[type(node.op)],
+                               to_string(node.right))
+    if isinstance(node, ast.UnaryOp):
+        return '(%s%s)' % (UNARY_OPERATORS[type(node.op)], to_string(node.operand))
+    if isinstance(node, ast.Compare):
+        return '(%s %s %s)' % (to_string(node.left), COMPARISONS[type(node.ops[0])],
+                               to_string(node.comparators[0]))
+    if isinstance(node, ast.Call):
+        return '%s(%s)' % (node.func.id, ', '.join(to_string(x) for x in node.args))
+    if isinstance(node, ast.Name):
+        return node.id
+    return repr(constant_value(node))
+
+
+class Expression(object):
+    """A cut string parsed, normalised and compiled once
+
+    :param string: Cut string in the pandas.eval dialect
+    """
+
+    def __init__(self, string):
+        self.string = string
+        try:
+            tree = ast.parse(_preprocess(string), mode='eval')
+        except SyntaxError as error:
+            raise ValueError('Cannot parse cut string %r: %s' % (string, error))
+        self.tree = ast.fix_missing_locations(_Normalizer().visit(tree))
+
+        self.columns = []      # Column names read, in order of appearance
+        self.parameters = []   # '@' local variable names, without the '@'
+        for node in _walk(self.tree):
+            if isinstance(node, ast.Name):
+                if node.id.startswith(LOCAL_PREFIX):
+                    name = node.id[len(LOCAL_PREFIX):]
+                    if name not in self.parameters:
+                        self.parameters.append(name)
+                elif node.id not in self.columns:
+                    self.columns.append(node.id)
+
+        self.source = to_string(self.tree)
+        self.code = compile(self.tree, '<lax: %s>' % self.source, 'eval')
+        self.functions = {name: getattr(np, name) for name in FUNCTIONS}
+        self.use_numexpr = numexpr is not None
+
+    def bind(self, data, parameters=None):
+        """Return the namespace of arrays and parameters the expression needs
+
+        :param data: DataFrame or mapping of column name to array
+        :param parameters: dict of values for '@' local variables
+        """
+        namespace = {}
+        for column in self.columns:
+            namespace[column] = np.asarray(data[column])
+        parameters = parameters or {}
+        for name in self.parameters:
+            if name not in parameters:
+                raise ValueError('No value given for parameter @%s' % name)
+            namespace[LOCAL_PREFIX + name] = parameters[name]
+        return namespace
+
+    def evaluate(self, data, parameters=None):
+        """Evaluate on a DataFrame or mapping of arrays, return an array"""
+        namespace = self.bind(data, parameters)
+        result = None
+        if self.use_numexpr:
+            try:
+                result = numexpr.evaluate(self.source, local_dict=namespace,
+                                          global_dict={})
+            except (TypeError, ValueError, KeyError, NotImplementedError, ZeroDivisionError):
+                result = None
+        if result is None:
+            namespace.update(self.functions)
+            with np.errstate(all='ignore'):
+                result = eval(self.code, {'__builtins__': {}}, namespace)  # pylint: disable=eval-used
+        if np.ndim(result) == 0:
+            length = len(namespace[self.columns[0]]) if self.columns else 1
+            result = np.full(length, result)
+        return result
+
+    def __repr__(self):
+        return 'Expression(%r)' % self.string
+
+
+class FrameExpression(object):
+    """A cut string evaluated by DataFrame.eval on every call
+
+    The columns it reads are not known, so lichens using it get all columns
+    (see Lichen.required_columns), and other engines (lax.sql, lax.columnar)
+    do not translate it.
+
+    :param string: Cut string in the pandas.eval dialect
+    :param reason: Why Expression does not support it
+    """
+    tree = None
+    source = None
+
+    def __init__(self, string, reason=''):
+        self.string = string
+        self.reason = reason
+        self.columns = []
+        self.parameters = []
+
+    def evaluate(self, data, parameters=None):
+        """Evaluate on a DataFrame, return an array"""
+        if not isinstance(data, pd.DataFrame):
+            raise TypeError('%r can only be evaluated on a DataFrame' % self)
+        return np.asarray(data.eval(self.string, local_dict=dict(parameters or {})))
+
+    def __repr__(self):
+        return 'FrameExpression(%r)' % self.string
+
+
+def _walk(node):
+    """Depth-first walk of a tree, left to right, skipping function names"""
+    yield node
+    for child in ast.iter_child_nodes(node):
+        if isinstance(node, ast.Call) and child is node.func:
+            continue
+        for each in _walk(child):
+            yield each
@@ -0,0 +1,108 @@
+"""Incremental processing of growing datasets
+
+An IncrementalProcessor remembers the cut columns of every event it has seen,
+by (run_number, event_number). When the dataset grows, only the new events are
+processed. Events of a run are processed again when a run-level input of the
+lichen (see Lichen.run_state), such as the run end time used by
+DAQVeto.EndOfRunCheck, has changed.
+
+    processor = IncrementalProcessor(sciencerun1.LowEnergyBackground(), 'sr1_background.pkl')
+    cuts = processor.update(df)
+    processor.save()
+"""
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from lax import cache
+
+
+class IncrementalProcessor(object):
+    """Process only events not seen before by a lichen or cut set
+
+    :param lichen: Lichen (usually a ManyLichen) to apply
+    :param filename: Pickle file to keep results in between sessions. Results
+                     stored for a different lichen (see fingerprint) are ignored.
+    """
+    keys = ('run_number', 'event_number')
+
+    def __init__(self, lichen, filename=None):
+        self.lichen = lichen
+        self.filename = filename
+        self.fingerprint = hashlib.sha1(repr(cache.fingerprint(lichen)).encode()).hexdigest()
+        self.results = None     # DataFrame of cut columns, indexed by keys
+        self.run_states = {}    # Run number -> value of lichen.run_state used
+        if filename is not None and os.path.exists(filename):
+            self.load(filename)
+
+    def __len__(self):
+        return 0 if self.results is None else len(self.results)
+
+    def update(self, df):
+        """Process the events of df not seen before and return the cut columns for df
+
+        :param df: DataFrame of events, with the key columns
+        :return: DataFrame of cut columns (see Lichen.cut_columns) with the index of df
+        """
+        missing = [key for key in self.keys if key not in df.columns]
+        if missing:
+            raise KeyError('Incremental processing needs columns: %s' % ', '.join(missing))
+        keys = pd.MultiIndex.from_arrays([df[key].values for key in self.keys],
+                                         names=self.keys)
+        if keys.has_duplicates:
+            raise ValueError('Events of df are not unique by %s' % ', '.join(self.keys))
+
+        # Forget runs whose run-level inputs changed
+        run_numbers = np.unique(df['run_number'].values)
+        states = self.lichen.run_state(run_numbers)
+        changed = [run_number for run_number in run_numbers
+                   if run_number in self.run_states and
+                   self.run_states[run_number] != states.get(run_number)]
+        if changed and self.results is not None:
+            self.results = self.results[
+                ~self.results.index.get_level_values('run_number').isin(changed)]
+
+        if self.results is None:
+            new = np.ones(len(df), dtype=bool)
+        else:
+            new = ~keys.isin(self.results.index)
+        if new.any():
+            processed = self.lichen.process(df[new].copy())
+            cuts = processed[self.lichen.cut_columns()]
+            if not cuts.index.equals(df.index[new]):
+                # Rows dropped by a lichen fail its cut
+                cuts = cuts.reindex(df.index[new], fill_value=False)
+            cuts.index = keys[new]
+            self.results = cuts if self.results is None else pd.concat([self.results, cuts])
+
+        for run_number in run_numbers:
+            self.run_states[run_number] = states.get(run_number)
+
+        result = self.results.reindex(keys)
+        result.index = df.index
+        return result
+
+    def save(self, filename=None):
+        """Store the results in a pickle file (by default the one given on creation)"""
+        filename = filename or self.filename
+        if filename is None:
+            raise ValueError('No file to save incremental results of %s to' % self.lichen.name())
+        pd.to_pickle({'fingerprint': self.fingerprint,
+                      'results': self.results,
+                      'run_states': self.run_states}, filename)
+
+    def load(self, filename):
+        """Load results stored by save
+
+        :return: False if the file holds results of a different lichen (these are ignored)
+        """
+        stored = pd.read_pickle(filename)
+        if stored['fingerprint'] != self.fingerprint:
+            return False
+        self.results = stored['results']
+        self.run_states = stored['run_states']
+        return True
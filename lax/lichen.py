@@ -1,15 +1,24 @@
 """Lichens grows on trees
 
 Extend the Minitree produced DataFrames with derivative values.
+
+Lichens compute their cut on numpy arrays (see Lichen._evaluate), so
+Lichen.evaluate also accepts a dict of arrays or a numpy structured array.
+process() adds the result to a DataFrame.
 """
 # -*- coding: utf-8 -*-
 
+import json
+import os
+import time
 from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
 
-from lax.plotting import plot
+from lax import cache, derived, profiling, resources
+from lax.expression import FrameExpression, get_expression
+from lax.results import CutResults
 from lax.variables import check_variable_list
 
 pd.set_option('display.expand_frame_repr', False)
@@ -17,22 +26,151 @@ pd.set_option('display.expand_frame_repr', False)
 
 class Lichen(object):
     version = np.NaN
+    input_columns = ()    # Columns read by pre() and _process()
+    derived_columns = ()  # Helper columns added to the DataFrame by pre() and _process()
+    float32_safe = False  # Same cut when evaluated in single precision, see lax.precision
 
     def describe(self):
         print(self.__doc__)
 
+    def required_columns(self):
+        """Return the columns this lichen needs in the DataFrame"""
+        return _unique([column for column in self.input_columns
+                        if column not in self.derived_columns])
+
+    def produced_columns(self):
+        """Return the columns this lichen adds to the DataFrame"""
+        return _unique(list(self.derived_columns) + [self.name()])
+
+    def check_columns(self, df):
+        """Raise a KeyError if columns needed by this lichen are missing
+
+        :param df: DataFrame, dict of arrays, structured array or list of column names
+        """
+        columns = set(derived.column_names(df))
+        missing = [column for column in self.required_columns()
+                   if column not in columns]
+        if missing:
+            raise KeyError('%s needs missing columns: %s' % (self.name(),
+                                                             ', '.join(missing)))
+
+    def run_state(self, run_numbers):
+        """Return {run number: value} of run-level inputs used besides the DataFrame
+
+        For example the run end times used by DAQVeto.EndOfRunCheck. Results
+        for a run must be recomputed when its value changes (see
+        lax.incremental). Most lichens use only the DataFrame: {}.
+        """
+        return {}
+
+    def load_resources(self):
+        """Load the models or files this lichen uses (see lax.resources)
+
+        They are otherwise loaded on first use. Most lichens use none.
+        """
+        pass
+
     def pre(self, df):
         return df
 
     def process(self, df):
-        df = self.pre(df)
-        df = self._process(df)
-        df = self.post(df)
-
+        profiler = profiling.get_profiler()
+        if profiler is not None:
+            return profiler.measure(self, df, self._run)
+        return self._run(df)
+
+    def _run(self, df):
+        """pre(), _process and post(), unless the result cache has the result"""
+        result_cache = cache.get_cache()
+        if result_cache is not None:
+            key = result_cache.key(self, df)
+            if result_cache.restore(key, df):
+                return df
+            index = df.index
+
+        # Results depend on the files used too
+        with derived.memoize(), resources.record_use() as used:
+            df = self.pre(df)
+            df = self._process(df)
+            df = self.post(df)
+
+        if result_cache is not None and df.index.equals(index):
+            result_cache.store(key, self, df, used)
         return df
 
     def _process(self, df):
-        raise NotImplementedError()
+        """Add the cut column, and helper columns (see derived_columns), from _evaluate"""
+        columns = derived.Columns(df)
+        with np.errstate(all='ignore'):
+            passed = self._evaluate(columns)
+        for column in self.derived_columns:
+            if column in columns.added:
+                df.loc[:, column] = columns.added[column]
+        df.loc[:, self.name()] = passed
+        return df
+
+    def _evaluate(self, columns):
+        """Return a boolean array, True for events passing this lichen
+
+        :param columns: derived.Columns of the events. Helper arrays (see
+                        derived_columns) are stored in it, e.g.
+                        columns['r'] = ..., for process to add to the DataFrame.
+
+        Lichens implemented only on DataFrames (a _process of their own) are
+        processed on a new DataFrame with the columns they read.
+        """
+        if type(self)._process is Lichen._process:
+            raise NotImplementedError('%s defines neither _evaluate nor _process' % self.name())
+        return _evaluate_frame(self, columns)
+
+    def evaluate(self, data):
+        """Return a boolean array, True for events passing this lichen
+
+        data is left untouched.
+
+        :param data: DataFrame, dict of column name to array, or numpy structured array
+        """
+        self.check_columns(data)
+        with derived.memoize(), np.errstate(all='ignore'):
+            return _evaluated(self, derived.Columns(data))
+
+    def process_iter(self, chunks, cuts_only=False):
+        """Process DataFrames one at a time, yielding each result
+
+        Only one chunk is annotated at a time, so the full dataset never has
+        to be in memory.
+
+        :param chunks: Iterable of DataFrames, e.g. pd.read_hdf(..., chunksize=...)
+        :param cuts_only: Yield only the cut columns (see cut_columns)
+        """
+        for chunk in chunks:
+            chunk = self.process(chunk)
+            if cuts_only:
+                chunk = chunk[self.cut_columns()]
+            yield chunk
+
+    def process_chunked(self, df, chunksize=100000, cuts_only=True):
+        """Process df chunksize rows at a time and concatenate the results
+
+        Lichens work event by event, so the result is the same as process(df),
+        but the helper columns of only one chunk exist at any time. df is not
+        modified.
+
+        :param df: DataFrame of events
+        :param chunksize: Number of rows per chunk
+        :param cuts_only: Keep only the cut columns (see cut_columns)
+        :return: DataFrame with the same index as df
+        """
+        if chunksize < 1:
+            raise ValueError('chunksize must be positive, got %s' % chunksize)
+        # An empty df still gives one (empty) chunk, for the columns
+        starts = range(0, len(df), chunksize) if len(df) else [0]
+        chunks = (df.iloc[start:start + chunksize].copy() for start in starts)
+        return pd.concat(list(self.process_iter(chunks, cuts_only)))
+
+    def cut_columns(self):
+        """Return the names of the boolean cut columns this lichen adds"""
+        return [self.name()]
 
     def post(self, df):
         if 'temp' in df.columns:
@@ -48,10 +186,44 @@ class StringLichen(Lichen):
     """
     string = ""
 
+    def expression(self):
+        """Return the compiled expression of the cut string
+
+        The string is parsed and compiled once, then shared by all instances.
+        """
+        return get_expression(self.string)
+
+    def get_parameters(self):
+        """Return {name: value} for the '@name' parameters of the cut string"""
+        return {}
+
+    def required_columns(self):
+        """Columns read by the cut string and by pre(), minus those pre() adds"""
+        columns = list(self.input_columns)
+        if self.string:
+            columns += self.expression().columns
+        return _unique([column for column in columns
+                        if column not in self.derived_columns])
+
     def _process(self, df):
-        df.loc[:, self.name()] = df.eval(self.string)
+        if type(self)._evaluate is not StringLichen._evaluate:
+            return Lichen._process(self, df)
+        if type(self).pre is Lichen.pre:
+            derived.add(df, *[column for column in self.derived_columns
+                              if column in derived.REGISTRY])
+        df.loc[:, self.name()] = self.expression().evaluate(df, self.get_parameters())
         return df
 
+    def _evaluate(self, columns):
+        if (type(self).pre is not Lichen.pre or type(self)._process is not StringLichen._process or
+                isinstance(self.expression(), FrameExpression)):
+            return _evaluate_frame(self, columns)
+        # Helper columns of the string that are registered derived variables
+        for column in self.derived_columns:
+            if column in derived.REGISTRY:
+                columns[column] = columns.compute(column)
+        return self.expression().evaluate(columns, self.get_parameters())
+
     def describe(self):
         print(self.name())
         print(self.string)
@@ -76,10 +248,12 @@ class RangeLichen(Lichen):
             raise ValueError()
         return self.allowed_range[0]
 
-    def _process(self, df):
-        df.loc[:, self.name()] = (df[self.variable] > self.allowed_range[0]) & (
-            df[self.variable] < self.allowed_range[1])
-        return df
+    def required_columns(self):
+        return [self.variable]
+
+    def _evaluate(self, columns):
+        values = columns[self.variable]
+        return (values > self.allowed_range[0]) & (values < self.allowed_range[1])
 
 
 class ManyLichen(Lichen):
@@ -87,19 +261,140 @@ class ManyLichen(Lichen):
     plots = False
     variables = None
 
+    # Evaluate each lichen only on events passing all lichens before it.
+    # The combined cut is unchanged; the column of each lichen is False for
+    # events that were already rejected (and so not evaluated).
+    short_circuit = False
+
+    # Order (list of cut names) in which to evaluate the lichens, if not the
+    # order of lichen_list. With auto_order, it is measured on the first
+    # DataFrame processed (see profile_order).
+    evaluation_order = None
+    auto_order = False
+
+    # Number of threads used by process to run lichens concurrently. Each
+    # lichen gets its own copy of the columns it reads and starts once the
+    # lichens whose output it reads are done. Not combined with short_circuit.
+    n_threads = None
+
+    # Evaluate lichens declaring float32_safe on float32 copies of the float64
+    # columns. Used by evaluate and evaluate_cuts; check the lichens with
+    # lax.precision first. Copies are made on each evaluation: to save memory
+    # traffic, cast the columns once with lax.precision.cast_float32.
+    float32 = False
+
+    # SharedResults of lax.cutsets, while processing several cut sets
+    _shared_results = None
+
     def get_cut_names(self):
         return [lichen.name() for lichen in self.lichen_list]
 
+    def cut_columns(self):
+        columns = []
+        for lichen in self.lichen_list:
+            columns += lichen.cut_columns()
+        return _unique(columns + [self.name()])
+
+    def required_columns(self):
+        """Columns needed by pre() and any lichen, except those made by earlier lichens"""
+        produced = set(self.derived_columns)
+        columns = [column for column in self.input_columns if column not in produced]
+        for lichen in self.lichen_list:
+            columns += [column for column in lichen.required_columns()
+                        if column not in produced]
+            produced.update(lichen.produced_columns())
+        return _unique(columns)
+
+    def produced_columns(self):
+        columns = list(self.derived_columns)
+        for lichen in self.lichen_list:
+            columns += lichen.produced_columns()
+        return _unique(columns + [self.name()])
+
+    def run_state(self, run_numbers):
+        states = {}
+        for lichen in self.lichen_list:
+            for run_number, value in lichen.run_state(run_numbers).items():
+                states.setdefault(run_number, ())
+                states[run_number] += ((lichen.name(), value),)
+        return states
+
+    def load_resources(self):
+        for lichen in self.lichen_list:
+            lichen.load_resources()
+
+    def get_dependencies(self):
+        """Return {cut name: set of cut names of lichens it needs output from}"""
+        producers = {}
+        for lichen in self.lichen_list:
+            for column in lichen.produced_columns():
+                producers.setdefault(column, lichen.name())
+        dependencies = {}
+        for lichen in self.lichen_list:
+            dependencies[lichen.name()] = set(
+                producers[column] for column in lichen.required_columns()
+                if column in producers and producers[column] != lichen.name())
+        return dependencies
+
+    def get_evaluation_list(self):
+        """Return lichen_list sorted in evaluation order
+
+        A lichen always comes after the lichens whose output columns it reads.
+        """
+        if self.evaluation_order is None:
+            return list(self.lichen_list)
+        rank = {name: i for i, name in enumerate(self.evaluation_order)}
+        remaining = sorted(self.lichen_list,
+                           key=lambda lichen: rank.get(lichen.name(), len(rank)))
+        dependencies = self.get_dependencies()
+        done = set()
+        result = []
+        while remaining:
+            for lichen in remaining:
+                if dependencies[lichen.name()] <= done:
+                    break
+            else:
+                # Circular dependency: keep the requested order
+                lichen = remaining[0]
+            remaining.remove(lichen)
+            result.append(lichen)
+            done.add(lichen.name())
+        return result
+
+    def process(self, df):
+        # Fail before any (expensive) lichen runs if inputs are missing
+        self.check_columns(df)
+        return Lichen.process(self, df)
+
     def _process(self, df):
+        if self.auto_order and self.evaluation_order is None:
+            # pre() was applied to df already
+            self._profile_sample(_sample(df))
+
         df.loc[:, (self.name())] = True
 
-        for lichen in self.lichen_list:
-            # Heavy lifting here
-            df = lichen.process(df)
+        lichens = self.get_evaluation_list()
+        if lichens != self.lichen_list:
+            # Keep the column order of lichen_list
+            for cut_name in self.get_cut_names():
+                if cut_name not in df.columns:
+                    df.loc[:, cut_name] = False
+
+        parallel = self.n_threads is not None and self.n_threads > 1 and not self.short_circuit
+        if parallel:
+            df = self._process_parallel(df, lichens)
+
+        for lichen in lichens:
+            if not parallel:
+                # Heavy lifting here
+                survivors = df[self.name()].values if self.short_circuit else None
+                df, _ = self._apply(df, lichen, survivors)
 
             cut_name = lichen.name()
 
             if self.plots:
+                # Matplotlib and seaborn take long to import
+                from lax.plotting import plot
                 plot(df[df[self.name()]],
                      cut_name, self.variables)
 
@@ -107,6 +402,315 @@ class ManyLichen(Lichen):
 
         return df
 
+    def _evaluate(self, columns):
+        passed = np.ones(len(columns), dtype=bool)
+        for outcome in self._evaluate_cuts(columns).values():
+            passed &= outcome
+        return passed
+
+    def evaluate_cuts(self, data):
+        """Return a DataFrame with the cut columns of process, leaving data untouched
+
+        Helper columns are not kept, and the result is built once at the end
+        instead of inserting a column into a DataFrame per lichen.
+        short_circuit is not used here.
+
+        :param data: DataFrame, dict of column name to array, or numpy structured array
+        :return: DataFrame with one column per lichen and the combined cut
+        """
+        self.check_columns(data)
+        columns = derived.Columns(data)
+        cuts = OrderedDict()
+
+        def evaluate(columns):
+            cuts.update(self._evaluate_cuts(columns))
+            passed = np.ones(len(columns), dtype=bool)
+            for outcome in cuts.values():
+                passed &= outcome
+            return passed
+
+        with derived.memoize(), np.errstate(all='ignore'):
+            cuts[self.name()] = _measured(self, columns, evaluate)
+        return pd.DataFrame(cuts, index=columns.index)
+
+    def _evaluate_cuts(self, columns):
+        """Return {cut name: boolean array} in the order of lichen_list
+
+        Lichens share columns, so helper and cut arrays of one lichen are
+        seen by those evaluated after it, as in process.
+        """
+        if type(self).pre is not Lichen.pre and type(self)._evaluate_cuts is ManyLichen._evaluate_cuts:
+            # Helper columns of the set are made by pre(), on a DataFrame
+            _evaluate_frame(self, columns)
+            return OrderedDict((cut_name, columns[cut_name]) for cut_name in self.get_cut_names())
+
+        if (self.auto_order and self.evaluation_order is None and
+                isinstance(columns.data, pd.DataFrame)):
+            self.profile_order(columns.data)
+
+        for lichen in self.get_evaluation_list():
+            source = columns.single() if self.float32 and lichen.float32_safe else columns
+            columns[lichen.name()] = _evaluated(lichen, source)
+
+        return OrderedDict((cut_name, columns[cut_name]) for cut_name in self.get_cut_names())
+
+    def _process_parallel(self, df, lichens):
+        """Process lichens on a pool of n_threads threads, return df with their output
+
+        Lichens never see df itself, only a new frame with their required
+        columns, so nothing is inserted into df while the pool runs. Outputs
+        are merged afterwards in the order of lichens, as sequential
+        processing would.
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        dependencies = self.get_dependencies()
+        outputs = {}
+        remaining = list(lichens)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            while remaining or pending:
+                ready = [lichen for lichen in remaining
+                         if dependencies[lichen.name()] <= set(outputs)]
+                if not ready and not pending:
+                    # Circular dependency: keep the requested order
+                    ready = remaining[:1]
+                for lichen in ready:
+                    remaining.remove(lichen)
+                    sources = [outputs[x.name()] for x in lichens
+                               if x.name() in dependencies[lichen.name()] and x.name() in outputs]
+                    frame = _input_frame(df, lichen, sources)
+                    pending[executor.submit(lichen.process, frame)] = lichen
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    outputs[pending.pop(future).name()] = future.result()
+
+        for lichen in lichens:
+            cut_name = lichen.name()
+            result = outputs[cut_name]
+            for column in lichen.produced_columns():
+                if column in result.columns:
+                    df.loc[:, column] = _aligned(result[column], df.index,
+                                                 False if column == cut_name else np.nan)
+        return df
+
+    def _apply(self, df, lichen, survivors=None):
+        """Process df with lichen, return df and the lichen's outcome as an array
+
+        The outcome has one value per row of df as given; rows the lichen
+        drops fail. If survivors (boolean array) is given, only those events
+        are evaluated and the others are marked as failing. Helper columns
+        the lichen adds are copied back, NaN for events not evaluated.
+        """
+        cut_name = lichen.name()
+        if survivors is None and self._shared_results is not None:
+            return self._shared_results.apply(df, lichen)
+        if survivors is None or survivors.all():
+            index = df.index
+            df = lichen.process(df)
+            return df, _aligned(df[cut_name], index, False)
+
+        passed = np.zeros(len(df), dtype=bool)
+        if survivors.any():
+            selected = df[survivors].copy()
+            result = lichen.process(selected)
+            passed[survivors] = _aligned(result[cut_name], selected.index, False)
+            for column in result.columns:
+                if column not in df.columns and column != cut_name:
+                    df.loc[survivors, column] = _aligned(result[column], selected.index)
+        df.loc[:, cut_name] = passed
+        return df, passed
+
+    def cut_results(self, df, helper_columns=()):
+        """Evaluate all lichens, keeping the outcomes as packed bits
+
+        Lichens are evaluated as in evaluate_cuts, so df is left untouched:
+        no cut or helper columns are inserted into it, except those named in
+        helper_columns. Nested cut sets are stored as one bit.
+
+        :param df: DataFrame of events
+        :param helper_columns: Helper columns (see derived_columns) to add to df,
+                               NaN for events not evaluated with short_circuit
+        :return: CutResults with one bit per lichen in lichen_list
+        """
+        self.check_columns(df)
+        results = []
+
+        def evaluate(columns):
+            results.append(self._cut_results(df, helper_columns))
+            return results[0].passed()
+
+        with derived.memoize(), np.errstate(all='ignore'):
+            _measured(self, derived.Columns(df), evaluate)
+        return results[0]
+
+    def _cut_results(self, df, helper_columns=()):
+
+        frame = df
+        if type(self).pre is not Lichen.pre:
+            # Helper columns of the set are made by pre(), on a copy
+            frame = self.post(self.pre(df.copy(deep=False)))
+        if self.auto_order and self.evaluation_order is None:
+            self._profile_sample(_sample(frame))
+
+        columns = derived.Columns(frame)
+        results = CutResults(len(frame), name=self.name(), index=frame.index)
+        for cut_name in self.get_cut_names():
+            results.add(cut_name, np.zeros(len(frame), dtype=bool))
+
+        evaluated = []
+        for lichen in self.get_evaluation_list():
+            cut_name = lichen.name()
+            source = columns.single() if self.float32 and lichen.float32_safe else columns
+            survivors = results.passed(evaluated) if self.short_circuit else None
+            evaluated.append(cut_name)
+
+            if survivors is None or survivors.all():
+                passed = _evaluated(lichen, source)
+            else:
+                passed = np.zeros(len(frame), dtype=bool)
+                if survivors.any():
+                    selected = _selected(source, lichen, survivors)
+                    passed[survivors] = _evaluated(lichen, selected)
+                    for column, values in selected.added.items():
+                        if column not in columns.added and column != cut_name:
+                            full = np.full(len(frame), np.nan)
+                            full[survivors] = values
+                            columns[column] = full
+            columns[cut_name] = passed
+            results.add(cut_name, passed)
+
+        for column in helper_columns:
+            df.loc[:, column] = _aligned(pd.Series(columns[column], index=frame.index), df.index)
+        return results
+
+    def cutflow(self, data, by=None, bins=None, efficiency=False):
+        """Return the number of events passing each lichen and all lichens before it
+
+        Cuts are evaluated as in evaluate_cuts, in the order of lichen_list.
+
+        :param data: DataFrame, dict of column name to array, numpy structured
+                     array, or an iterable of these (chunks are counted one at
+                     a time, so any number of events fits in memory)
+        :param by: Column to group events by, e.g. 'run_number'
+        :param bins: Bin edges for the values of by, e.g. of 'cs1'
+        :param efficiency: Return fractions of the total instead of counts
+        :return: DataFrame indexed by 'Total' and the cut names, with one column
+                 per group ('events' without by)
+        """
+        table = self._count_table(data, CutResults.cutflow, by, bins)
+        if efficiency:
+            table = table.div(table.loc['Total'], axis=1)
+        return table
+
+    def n_minus_one(self, data, by=None, bins=None, efficiency=False):
+        """Return the number of events passing all lichens except one
+
+        :param data, by, bins: See cutflow
+        :param efficiency: Return the fraction of these events passing the
+                           lichen left out instead of counts
+        :return: DataFrame indexed by the cut left out and 'All' (events passing
+                 every lichen), with one column per group ('events' without by)
+        """
+        table = self._count_table(data, CutResults.n_minus_one, by, bins)
+        if efficiency:
+            table = table.rdiv(table.loc['All'], axis=1)
+        return table
+
+    def overlap(self, data):
+        """Return the number of events failing both lichens of each pair of lichens
+
+        :param data: See cutflow
+        :return: DataFrame with cut names as index and columns (see CutResults.overlap)
+        """
+        return self._count_table(data, CutResults.overlap)
+
+    def _count_table(self, data, count, by=None, bins=None):
+        """Sum the tables count(CutResults[, groups]) over the chunks of data"""
+        if isinstance(data, (pd.DataFrame, dict, np.ndarray)):
+            data = [data]
+        table = None
+        for chunk in data:
+            results = CutResults.from_frame(self.evaluate_cuts(chunk), self.get_cut_names(),
+                                            name=self.name())
+            if by is None:
+                counts = count(results)
+            else:
+                groups = np.asarray(chunk[by])
+                if bins is not None:
+                    groups = pd.cut(groups, bins)
+                counts = count(results, groups=groups)
+            table = counts if table is None else table.add(counts, fill_value=0).astype(np.int64)
+        if table is None:
+            raise ValueError('No data to count events of %s in' % self.name())
+        return table
+
+    def profile_order(self, df, sample_size=10000, random_state=0):
+        """Measure cost and selectivity of each lichen and set evaluation_order
+
+        The lichens process a random sample of df (after pre() of the cut set)
+        in turn, each seeing the output of those before it. With
+        short-circuiting, the expected total work is smallest if lichens are
+        evaluated in order of increasing cost per event / fraction of events
+        rejected.
+
+        :param df: DataFrame of events to sample from
+        :param sample_size: Number of events to use
+        :param random_state: Seed for drawing the sample
+        :return: DataFrame with cost per event (s), pass fraction and rank per lichen
+        """
+        return self._profile_sample(self.pre(_sample(df, sample_size, random_state)))
+
+    def _profile_sample(self, sample):
+        """profile_order on a sample pre() was already applied to"""
+        statistics = []
+        for lichen in self.get_evaluation_list():
+            cut_name = lichen.name()
+            rows = len(sample)
+            start = time.time()
+            sample = lichen.process(sample)
+            cost = (time.time() - start) / max(rows, 1)
+            pass_fraction = sample[cut_name].mean() if len(sample) else 1.
+            rejected = 1. - pass_fraction
+            statistics.append((cut_name, cost, pass_fraction,
+                               cost / rejected if rejected > 0 else np.inf))
+
+        statistics = pd.DataFrame(statistics,
+                                  columns=['cut_name', 'cost_per_event',
+                                           'pass_fraction', 'rank'])
+        statistics = statistics.set_index('cut_name')
+        self.evaluation_order = list(statistics.sort_values('rank', kind='mergesort').index)
+        return statistics
+
+    def save_order(self, filename):
+        """Store evaluation_order in a JSON file, under the name of this cut set
+
+        Orders of other cut sets in the same file are kept.
+        """
+        if self.evaluation_order is None:
+            raise ValueError('No evaluation order to save for %s' % self.name())
+        orders = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                orders = json.load(f)
+        orders[self.name()] = {'version': str(self.version),
+                               'order': list(self.evaluation_order)}
+        with open(filename, 'w') as f:
+            json.dump(orders, f, indent=2, sort_keys=True)
+
+    def load_order(self, filename):
+        """Set evaluation_order from a JSON file written by save_order
+
+        :return: True if an order for this cut set (and version) was found
+        """
+        with open(filename) as f:
+            orders = json.load(f)
+        entry = orders.get(self.name())
+        if entry is None or entry['version'] != str(self.version):
+            return False
+        self.evaluation_order = entry['order']
+        return True
+
     def debug(self,
               plots=True,
               variables=None):
@@ -125,3 +729,164 @@ class ManyLichen(Lichen):
             pass
         else:
             self.variables = OrderedDict(check_variable_list(variables))
+
+
+def is_declarative(lichen):
+    """Return True if the cut of lichen follows from its string, range or lichens only
+
+    These are StringLichens and RangeLichens without pre(), _process or
+    _evaluate of their own (and no registered derived variables to compute),
+    and ManyLichens combining their lichens as usual. Other engines (see
+    lax.columnar, lax.sql) can translate them; for a ManyLichen, each of its
+    lichens must be checked too.
+    """
+    klass = type(lichen)
+    if isinstance(lichen, StringLichen):
+        return (klass.pre is Lichen.pre and
+                klass._process is StringLichen._process and
+                not isinstance(lichen.expression(), FrameExpression) and
+                klass._evaluate is StringLichen._evaluate and
+                not any(column in derived.REGISTRY for column in lichen.derived_columns))
+    if isinstance(lichen, RangeLichen):
+        return klass._evaluate is RangeLichen._evaluate
+    if isinstance(lichen, ManyLichen):
+        return (klass.pre is Lichen.pre and
+                klass._evaluate is ManyLichen._evaluate and
+                klass._evaluate_cuts is ManyLichen._evaluate_cuts)
+    return False
+
+
+def columns_read(lichens):
+    """Return the columns lichens, evaluated in turn, read that none of them produce before"""
+    produced = set()
+    columns = []
+    for lichen in lichens:
+        columns += [column for column in lichen.required_columns()
+                    if column not in produced]
+        produced.update(lichen.produced_columns())
+    return _unique(columns)
+
+
+def evaluate_lichens(lichens, data):
+    """Evaluate lichens in turn, return {cut name: boolean array}
+
+    As in a cut set, each lichen sees the helper and cut arrays of those
+    evaluated before it.
+
+    :param data: DataFrame, dict of column name to array, or numpy structured array
+    """
+    columns = derived.Columns(data)
+    results = OrderedDict()
+    with derived.memoize(), np.errstate(all='ignore'):
+        for lichen in lichens:
+            results[lichen.name()] = columns[lichen.name()] = _evaluated(lichen, columns)
+    return results
+
+
+def _evaluated(lichen, columns):
+    """Return lichen._evaluate(columns) as a boolean array"""
+    return _measured(lichen, columns,
+                     lambda columns: np.asarray(lichen._evaluate(columns), dtype=bool))
+
+
+def _measured(lichen, columns, function):
+    """Return function(columns), measured as a call of lichen when profiling"""
+    profiler = profiling.get_profiler()
+    if profiler is not None:
+        return profiler.measure_evaluate(lichen, columns, function)
+    return function(columns)
+
+
+def _unique(columns):
+    """Remove duplicates, keeping the first occurrence"""
+    result = []
+    for column in columns:
+        if column not in result:
+            result.append(column)
+    return result
+
+
+def _sample(df, sample_size=10000, random_state=0):
+    """Copy of a random sample of the rows of df"""
+    return df.sample(n=min(sample_size, len(df)), random_state=random_state).copy()
+
+
+def _input_frame(df, lichen, sources=()):
+    """New DataFrame with the columns lichen reads
+
+    Columns are taken from the last of sources (outputs of other lichens)
+    that has them, else from df. Lichens declaring no input columns get all
+    columns (df copied shallowly).
+    """
+    if not lichen.required_columns():
+        frame = df.copy(deep=False)
+        for source in sources:
+            for column in source.columns:
+                frame[column] = _aligned(source[column], df.index)
+        return frame
+    columns = OrderedDict()
+    for column in lichen.required_columns():
+        source = df
+        for frame in sources:
+            if column in frame.columns:
+                source = frame
+        columns[column] = _aligned(source[column], df.index)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _all_columns(columns):
+    """New DataFrame with every column of columns (derived.Columns), for lichens
+    declaring no input columns
+
+    A DataFrame dataset is copied shallowly, then the helper arrays stored
+    so far are added.
+    """
+    if isinstance(columns.data, pd.DataFrame):
+        frame = columns.data.copy(deep=False)
+    else:
+        frame = pd.DataFrame(OrderedDict((column, columns[column])
+                                         for column in derived.column_names(columns.data)),
+                             index=columns.index)
+    for column, values in columns.added.items():
+        frame[column] = values
+    return frame
+
+
+def _selected(columns, lichen, mask):
+    """derived.Columns of the events in mask (boolean array), with the columns lichen reads"""
+    if cache.declares_inputs(lichen):
+        names = lichen.required_columns()
+    else:
+        names = _unique(derived.column_names(columns.data) + list(columns.added))
+    return derived.Columns(pd.DataFrame(OrderedDict((name, columns[name][mask]) for name in names),
+                                        index=columns.index[mask]))
+
+
+def _evaluate_frame(lichen, columns):
+    """Process a new DataFrame with the columns lichen reads, return its cut as an array
+
+    The columns lichen produces (helper and cut columns) are stored in columns.
+    """
+    index = columns.index
+    if lichen.required_columns():
+        frame = pd.DataFrame(OrderedDict((column, columns[column])
+                                         for column in lichen.required_columns()), index=index)
+    else:
+        frame = _all_columns(columns)
+    result = lichen.process(frame)
+    cut_columns = lichen.cut_columns()
+    for column in lichen.produced_columns():
+        if column in result.columns:
+            columns[column] = _aligned(result[column], index,
+                                       False if column in cut_columns else np.nan)
+    return columns[lichen.name()]
+
+
+def _aligned(series, index, fill_value=np.nan):
+    """Values of series in the order of index
+
+    Some lichens reorder or drop rows; realign those on the index.
+    """
+    if series.index.equals(index):
+        return series.values
+    return series.reindex(index, fill_value=fill_value).values
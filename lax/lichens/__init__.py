@@ -1,2 +1,18 @@
-"""Module containing all lichen definitions"""
-from . import sciencerun0, sciencerun1, postsr1, sciencerun2
+"""Module containing all lichen definitions
+
+Each science run module is imported on first use, e.g. lax.lichens.sciencerun1.
+"""
+import importlib
+
+__all__ = ['sciencerun0', 'sciencerun1', 'postsr1', 'sciencerun2']
+
+
+def __getattr__(name):
+    # Module __getattr__ (PEP 562) is why lax needs Python 3.7 or later
+    if name in __all__:
+        return importlib.import_module('%s.%s' % (__name__, name))
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
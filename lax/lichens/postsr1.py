@@ -6,18 +6,16 @@ import inspect
 
 import numpy as np
 import pandas as pd
-import pickle
 import os
 
 import lax
+from lax import derived, resources
 from lax.lichen import Lichen, ManyLichen, StringLichen  # pylint: disable=unused-import
 from lax import __version__ as lax_version
 
 from lax.lichens import sciencerun1 as sr1
 DATA_DIR = sr1.DATA_DIR
 
-from scipy import stats
-
 # Import all lichens from sciencerun1
 for x in dir(sr1):
     y = getattr(sr1, x)
@@ -42,6 +40,7 @@ class Volume_DBD(StringLichen):
     
     Contact: Chiara Capelli <chiara@physik.uzh.ch>
     """
+    input_columns = ('z_3d_nn_tf', 'r_3d_nn_tf')
 
     def SuperEllipseUpperZs(self, x, zloc, zscale, r2scale, power_const):
         Zs = np.power(
@@ -67,11 +66,9 @@ class Volume_DBD(StringLichen):
     par_up = [-213.6148297920783, 188.07255694010047, 1347.1771882218404, 6.491616457942884]
     par_low = [-7.955115883403868, 86.62520910736373, 1317.2991340021406, 8.338709398342486]
         
-    def _process(self, df):
-        df.loc[:, self.name()] = ( (df.z_3d_nn_tf > self.SuperEllipseLowerZs(df.r_3d_nn_tf**2, *self.par_low)) 
-                                  & (df.z_3d_nn_tf < self.SuperEllipseUpperZs(df.r_3d_nn_tf**2, *self.par_up)) )
-            
-        return df
+    def _evaluate(self, c):
+        return ( (c.z_3d_nn_tf > self.SuperEllipseLowerZs(c.r_3d_nn_tf**2, *self.par_low))
+                 & (c.z_3d_nn_tf < self.SuperEllipseUpperZs(c.r_3d_nn_tf**2, *self.par_up)) )
 
 
 class ERband_HE(StringLichen):
@@ -88,7 +85,7 @@ class ERband_HE(StringLichen):
     The ERband definition uses data between 50—3020 keV with a precut z>-50.
     Below 50 keV events will pass the cut. From 2 MeV to infinity (including the blinded region) the ERband is defined as the  average 1st and 99th percentile between 2-2.4 MeV.   
     The text file with the cut (ces value, Q50, Q99, Q1) can be found in /dali/lgrandi/manenti/cuts/ERband_HE/
-    and in ../data/. 
+    and in ../data/; it is looked up on lax.resources.search_path. 
     
     Required minitrees: Corrections
     Defined with pax version: 6.10.1
@@ -96,11 +93,13 @@ class ERband_HE(StringLichen):
     Contact: Laura Manenti <laura.manenti@nyu.edu>"""
 
     version = 1  
+    input_columns = ('cs1_nn_tf', 'cs2_bottom_nn_tf', 'z_3d_nn_tf', 'cs1', 'cs2_bottom')
+    derived_columns = ('ces_ERband_HE',)
 
-    def _process(self, df):
+    def _evaluate(self, c):
         
         #load mean, sigma values
-        ERband = np.genfromtxt('/dali/lgrandi/manenti/cuts/ERband_HE/ERband_Q50_Q99_Q1_50toInf_gapAs2to2.4MeV.txt',skip_header=1)
+        ERband = resources.load_table('ERband_Q50_Q99_Q1_50toInf_gapAs2to2.4MeV.txt', skiprows=1)
         Q99 = ERband[:,2]
         Q1 = ERband[:,3]
         
@@ -108,20 +107,16 @@ class ERband_HE(StringLichen):
         ces_bin = ERband[:,0]
         
         #define ces
-        w=13.7e-3
-        df.loc[:, 'ces_ERband_HE'] = w*(df.cs1_nn_tf/self.g1_sr1_he_ap(df.z_3d_nn_tf) +
-                                  df.cs2_bottom_nn_tf/self.g2_sr1_he_ap(df.z_3d_nn_tf))
-        x = df['ces_ERband_HE'] 
+        c['ces_ERband_HE'] = c.compute('ces')
+        x = c['ces_ERband_HE']
         inds = np.digitize(x, ces_bin) #indices of the bins to which each value in x belongs. 
         
         #get corresponding cut values
-        cut_top = [Q99[i-1] for i in inds]
-        cut_bottom = [Q1[i-1] for i in inds]
+        cut_top = Q99[inds - 1]
+        cut_bottom = Q1[inds - 1]
         
-        df.loc[:, self.name()] = True # default is True 
-        df.loc[:, self.name()] = ( ( np.log10(df['cs2_bottom']/df['cs1']) < cut_top ) \
-                                       & ( np.log10(df['cs2_bottom']/df['cs1']) > cut_bottom ) )       
-        return df
+        return ( ( np.log10(c['cs2_bottom']/c['cs1']) < cut_top )
+                 & ( np.log10(c['cs2_bottom']/c['cs1']) > cut_bottom ) )
 
     def g1_sr1_he_ap(self, z):
         return 0.14798+(0.00007*z)
@@ -138,10 +133,8 @@ class ERBandDEC(StringLichen):
     """
     version = 1
     string = "1 < log_cs_ratio < 2"
-
-    def pre(self, df):
-        df.loc[:, 'log_cs_ratio'] = np.log10(df['cs2']/df['cs1'])
-        return df
+    input_columns = ('cs1', 'cs2')
+    derived_columns = ('log_cs_ratio',)
 
 class S2PatternLikelihood(StringLichen):
     """
@@ -153,8 +146,17 @@ class S2PatternLikelihood(StringLichen):
     
     Long to process, applied it after all other cuts
     Requires S2PatternReducedAP minitrees (hax PR:https://github.com/XENON1T/hax/pull/259)
+    The parameter file (in /dali/lgrandi/ctherreau/cuts/S2PatternHE/) is looked up on
+    lax.resources.search_path.
     Contact: Chloe Therreau <chloe.therreau@subatech.in2p3.fr>
     """
+    input_columns = ('x_3d_nn_tf', 'y_3d_nn_tf', 'r_3d_nn_tf', 's2_pattern_fit_top_reduced_ap',
+                     's2')
+    derived_columns = ('phi_3d_nn_tf', 'CutS2PatternLikelihoodHE_a', 'CutS2PatternLikelihoodHE_b',
+                       'CutS2PatternLikelihoodHE_c', 'CutS2PatternLikelihoodHE_d',
+                       'CutS2PatternLikelihoodHE_e', 'log10_s2_pattern_fit_top_reduced_ap',
+                       'log10_s2')
+
     def pre(self, df):
         def powerlaw(x,amp0,power0,amp1,power1,cte):
             return amp0*x**power0+amp1*x**power1+cte   
@@ -165,14 +167,14 @@ class S2PatternLikelihood(StringLichen):
         phi4=22
 
         # Load parameters
-        params_load = np.loadtxt('/dali/lgrandi/ctherreau/cuts/S2PatternHE/s2patternlikelihoodcut_he_r_phi_params_v2.txt')
+        params_load = resources.load_table('s2patternlikelihoodcut_he_r_phi_params_v2.txt')
         # Reshape parameters
         params=[params_load[:phi1], params_load[phi1:phi1+phi2],
                 params_load[phi1+phi2:phi1+phi2+phi3],params_load[phi1+phi2+phi3:phi1+phi2+phi3+phi4]]
         
         r_here = 'r_3d_nn_tf'
         phi_here = 'phi_3d_nn_tf'
-        df.loc[:,phi_here] = np.arccos(df.x_3d_nn_tf/df.r_3d_nn_tf)*np.sign(df.y_3d_nn_tf)
+        df.loc[:,phi_here] = derived.compute(df, phi_here)
         df_list=[]
         R = np.linspace(0, 47, 5) 
         for i in range(len(R)-1):
@@ -234,6 +236,7 @@ class CS2AreaFractionTopExtended(Lichen):
     Contact: Dominick Cichon <dominick.cichon@mpi-hd.mpg.de>"""
 
     version = 3
+    input_columns = ('cs2_aft_no_ap_pmts', 's2_no_ap_pmts')
 
     # define cut line function
     top_params = [-2.754897E+06, -1.579777E+06, 1.475401E-05, 4.299098E-32,
@@ -249,13 +252,11 @@ class CS2AreaFractionTopExtended(Lichen):
     def aft_cut_line(self, x, *args):
         return self.inv_sqrt(x, args[0], args[1]) + args[2] * np.sqrt(x) + np.polyval(args[3:], x)
 
-    def _process(self, df):
-        df.loc[:, self.name()] = (((df.cs2_aft_no_ap_pmts < self.aft_cut_line(df.s2_no_ap_pmts, *self.top_params)) &
-                                   (df.cs2_aft_no_ap_pmts > self.aft_cut_line(df.s2_no_ap_pmts, *self.bot_params))) |
-                                  (df.s2_no_ap_pmts > 1427769.230769) |
-                                  (df.s2_no_ap_pmts < 71.428571))
-
-        return df
+    def _evaluate(self, c):
+        return (((c.cs2_aft_no_ap_pmts < self.aft_cut_line(c.s2_no_ap_pmts, *self.top_params)) &
+                 (c.cs2_aft_no_ap_pmts > self.aft_cut_line(c.s2_no_ap_pmts, *self.bot_params))) |
+                (c.s2_no_ap_pmts > 1427769.230769) |
+                (c.s2_no_ap_pmts < 71.428571))
 
 
 class CS2AreaFractionTopExtendedOldDesat(StringLichen):
@@ -278,6 +279,8 @@ class CS2AreaFractionTopExtendedOldDesat(StringLichen):
     Contact: Dominick Cichon <dominick.cichon@mpi-hd.mpg.de>"""
 
     version = 1
+    input_columns = ('cs2_top', 'cs2_bottom', 's2_lifetime_correction')
+    derived_columns = ('cxys2', 'cs2_aft')
 
     top_bound_string = ('(6.499452E-01 + 1.473286E-07 * cxys2 +'
                         ' -4.273597E-13 * cxys2**2 + 4.922129E-19 * cxys2**3 +'
@@ -291,13 +294,6 @@ class CS2AreaFractionTopExtendedOldDesat(StringLichen):
     string = ('((' + top_bound_string + ' > cs2_aft) & (' + bot_bound_string +
               ' < cs2_aft)) | (cxys2 > 2113500) | (cxys2 < 90)')
 
-    def pre(self, df):
-        df.loc[:, 'cxys2'] = ((df['cs2_top'] + df['cs2_bottom']) /
-                                df['s2_lifetime_correction'])
-        df.loc[:, 'cs2_aft'] = df['cs2_top'] / (df['cs2_top'] +
-                                                df['cs2_bottom'])
-        return df
-
 
 class MisIdS1SingleScatter(Lichen):
     """Cut to target the shoulder on Kr83m data due to mis-identified krypton events.
@@ -312,6 +308,7 @@ class MisIdS1SingleScatter(Lichen):
     """
 
     version = 1.1
+    input_columns = ('largest_s2_before_main_s2_area', 'cs1')
     
     pars = [60, 1.04, 4]  # from a fit to target only mis-Id Kr83m events
     s1_thresh = 155  # cs1 PE. Up to this value the cut will be a straight line
@@ -325,10 +322,9 @@ class MisIdS1SingleScatter(Lichen):
     def cutline(self, x):
         return np.nan_to_num(self.cutval * (x < self.s1_thresh)) + np.nan_to_num((x >= self.s1_thresh) * self._cutline(x))
     
-    def _process(self, df):
-        df.loc[:, self.name()] = (np.nan_to_num(df.largest_s2_before_main_s2_area) < self.cutline(df.cs1)) | \
-                                 (df.cs1 < self.min_s1)
-        return df
+    def _evaluate(self, c):
+        return (np.nan_to_num(c.largest_s2_before_main_s2_area) < self.cutline(c.cs1)) | \
+               (c.cs1 < self.min_s1)
 
 
 class S1AreaFractionTop_he(Lichen):
@@ -343,6 +339,7 @@ class S1AreaFractionTop_he(Lichen):
 
 
     version = 2
+    input_columns = ('z_3d_nn_tf', 's1_area_fraction_top')
     pars1 = [654.9, -754, 522.9, -151-8]  
     pars2 = [2548, -2182,  848.3, - 122]
 
@@ -353,10 +350,9 @@ class S1AreaFractionTop_he(Lichen):
         return self.pars2[0]*(x**3) + self.pars2[1]  *(x**2) + self.pars2[2] * x + self.pars2[3]
 
 
-    def _process(self, df):
-        df.loc[:, self.name()] = ( (df.z_3d_nn_tf>self.cutline1(df.s1_area_fraction_top) ) & 
-                                (df.z_3d_nn_tf<self.cutline2(df.s1_area_fraction_top)  ) )
-        return df
+    def _evaluate(self, c):
+        return ( (c.z_3d_nn_tf>self.cutline1(c.s1_area_fraction_top) ) &
+                 (c.z_3d_nn_tf<self.cutline2(c.s1_area_fraction_top)  ) )
    
 class PosDiff_HE(Lichen):
     """
@@ -366,11 +362,12 @@ class PosDiff_HE(Lichen):
     Contact: Chiara Capelli <chiara@physik.uzh.ch>
     """
     version = 0.1
+    input_columns = ('x_observed_nn_tf', 'x_observed_tpf', 'y_observed_nn_tf', 'y_observed_tpf',
+                     's2')
     
-    def _process(self, df):
-        df.loc[:, self.name()] = np.sqrt((df['x_observed_nn_tf']-df['x_observed_tpf'])**2+
-                                         (df['y_observed_nn_tf']-df['y_observed_tpf'])**2)<(3569.674 * np.exp(-np.log10(df.s2)/0.369) + 1.582)
-        return df
+    def _evaluate(self, c):
+        return np.sqrt((c['x_observed_nn_tf']-c['x_observed_tpf'])**2+
+                       (c['y_observed_nn_tf']-c['y_observed_tpf'])**2)<(3569.674 * np.exp(-np.log10(c.s2)/0.369) + 1.582)
 
 
 class S2SingleScatter_HE(Lichen):
@@ -379,15 +376,23 @@ class S2SingleScatter_HE(Lichen):
     Contact: Tianyu Zhu <tz2263@columbia.edu>
     """
     version = 0.1
+    input_columns = ('largest_other_s2', 'largest_other_s2_pattern_fit', 's2')
     gmix_filename = os.path.join(DATA_DIR, 's2_single_classifier_gmix_v6.10.0.pkl')
-    gmix = pickle.load(open(gmix_filename, 'rb'))
 
-    def _process(self, df):
-        df[self.name()] = True
-        mask = np.logical_and(df['largest_other_s2_pattern_fit']>0, df['s2']>0)
-        Y = np.log10(df.loc[mask, ['largest_other_s2', 'largest_other_s2_pattern_fit', 's2']])
-        df.loc[mask, self.name()] = self.gmix.predict(Y).astype(bool)
-        return df
+    @property
+    def gmix(self):
+        return resources.load_pickle(self.gmix_filename)
+
+    def load_resources(self):
+        return self.gmix
+
+    def _evaluate(self, c):
+        passed = np.ones(len(c), dtype=bool)
+        mask = np.logical_and(c['largest_other_s2_pattern_fit']>0, c['s2']>0)
+        Y = np.log10(np.column_stack([c[column][mask] for column in self.input_columns]))
+        if mask.any():
+            passed[mask] = self.gmix.predict(Y).astype(bool)
+        return passed
 
 
 class S2Width_HE(Lichen):
@@ -404,48 +409,42 @@ class S2Width_HE(Lichen):
 
     Required minitrees: Corrections
     Defined with pax version: 6.10.1
+    The cut values (in /project2/lgrandi/twolf/S2WidthCutFiles/) are looked up on
+    lax.resources.search_path.
 
     Contact: Chiara Capelli (chiara@physik.uzh.ch)
     Tim Michael Heinz Wolf (tim.wolf@mpi-hd.mpg.de)
     """
     version = 0.1
+    input_columns = ('drift_time', 's2', 's2_range_50p_area', 'cs1_nn_tf', 'cs2_bottom_nn_tf',
+                     'z_3d_nn_tf')
+    derived_columns = ('CutS2Width',)
 
-    def _process(self, df):
+    def _evaluate(self, c):
         # load cut values
-        cut_array = np.loadtxt("/project2/lgrandi/twolf/S2WidthCutFiles/cut_values.txt")
+        cut_array = resources.load_table('cut_values.txt')
         drift_time_bin_centers = (cut_array[:, 0])
         drift_time_edges = drift_time_bin_centers + 5 # total bin width is 10
 
         # find bin in cutspace for drift_time
-        found_bin = np.digitize(df["drift_time"], drift_time_edges)
+        found_bin = np.digitize(c["drift_time"], drift_time_edges)
 
         # apply standard S2 width cut
         S2WidthLichen = sr1.S2Width()
-        df = S2WidthLichen.process(df)
+        c[S2WidthLichen.name()] = S2WidthLichen._evaluate(c)
 
-        mybins = []
-        for bin in found_bin:
-            if bin == len(drift_time_edges):
-                mybins.append(bin - 1)
-            else:
-                mybins.append(bin)
-        found_bin = np.asarray(mybins)
+        found_bin = np.where(found_bin == len(drift_time_edges), found_bin - 1, found_bin)
 
         # get corresponding cut values
         cut_down = cut_array[found_bin][:, 1]
         cut_up = cut_array[found_bin][:, 2]
 
         # derivation of combined energy to stich the two cuts together
-        w=13.7e-3
-        df_test = pd.DataFrame()
-        df_test.loc[:, 'CES'] = w*(df.cs1_nn_tf/self.g1_sr1_he_ap(df.z_3d_nn_tf) +
-                                  df.cs2_bottom_nn_tf/self.g2_sr1_he_ap(df.z_3d_nn_tf))
-        df_test.loc[:, self.name()] = ((df["s2_range_50p_area"] > cut_down) & (df["s2_range_50p_area"] < cut_up))
+        ces = c.compute('ces')
+        passed_he = ((c["s2_range_50p_area"] > cut_down) & (c["s2_range_50p_area"] < cut_up))
 
         # stiching the cuts together
-        df.loc[:, self.name()] = True # default is True
-        df.loc[:, self.name()] = np.where(df_test['CES'] < 250, df['CutS2Width'], df_test[self.name()])
-        return df
+        return np.where(ces < 250, c['CutS2Width'], passed_he)
 
     def g1_sr1_he_ap(self, z):
         return 0.14798+(0.00007*z)
@@ -462,7 +461,7 @@ class S1SingleScatter_HE(Lichen):
              Tim Michael Heinz Wolf (tim.wolf@mpi-hd.mpg.de)
     """
     version = 0.1
+    input_columns = ('largest_other_s1',)
     
-    def _process(self, df):
-        df.loc[:, self.name()] = df['largest_other_s1']<45
-        return df
+    def _evaluate(self, c):
+        return c['largest_other_s1']<45
@@ -6,14 +6,10 @@ This includes all current definitions of the cuts for the first science run
 # -*- coding: utf-8 -*-
 import inspect
 import os
-import pytz
-import pickle  # noqa
 
 import numpy as np
-from pax import units
-
-from scipy.stats import chi2
 
+from lax import resources, trees, units
 from lax.lichen import Lichen, RangeLichen, ManyLichen, StringLichen
 from lax import __version__ as lax_version
 
@@ -141,53 +137,59 @@ class DAQVeto(ManyLichen):
     class EndOfRunCheck(Lichen):
         """Check that the event does not come in the last 21 seconds of the run
         """
+        input_columns = ('run_number', 'event_time')
 
-        def _process(self, df):
+        def get_run_end_times(self, run_numbers):
+            """Return {run number: end time (ns since epoch)}"""
             import hax          # noqa
+            import pytz
             if not len(hax.config):
                 # User didn't init hax yet... let's do it now
                 hax.init()
 
-            # Get the end times for each run
             # The datetime -> timestamp logic here is the same as in the pax event builder
-            run_numbers = np.unique(df.run_number.values)
+            run_numbers = np.unique(run_numbers)
             run_end_times = [int(q.replace(tzinfo=pytz.utc).timestamp() * int(1e9))
                              for q in hax.runs.get_run_info(run_numbers.tolist(), 'end')]
-            run_end_times = {run_numbers[i]: run_end_times[i]
-                             for i in range(len(run_numbers))}
+            return {run_numbers[i]: run_end_times[i]
+                    for i in range(len(run_numbers))}
+
+        def run_state(self, run_numbers):
+            return self.get_run_end_times(run_numbers)
+
+        def _evaluate(self, c):
+            run_numbers, run_index = np.unique(c['run_number'], return_inverse=True)
+            run_end_times = self.get_run_end_times(run_numbers)
+            end_times = np.array([run_end_times[run_number] for run_number in run_numbers],
+                                 dtype=np.int64)
 
             # Pass events that occur before (end time - 21 sec) of the run they are in
-            df.loc[:, self.name()] = df.apply(lambda row: row['event_time'] <
-                                              run_end_times[row['run_number']] - 21e9, axis=1)
-            return df
+            return c['event_time'] < end_times[run_index] - int(21e9)
 
     class BusyTypeCheck(Lichen):
         """Ensure that the last busy type (if any) is OFF
         """
+        input_columns = ('previous_busy_on', 'previous_busy_off')
 
-        def _process(self, df):
-            df.loc[:, self.name()] = ((~(df['previous_busy_on'] < 60e9)) |
-                                      (df['previous_busy_off'] <
-                                       df['previous_busy_on']))
-            return df
+        def _evaluate(self, c):
+            return ((~(c['previous_busy_on'] < 60e9)) |
+                    (c['previous_busy_off'] < c['previous_busy_on']))
 
     class BusyCheck(Lichen):
         """Check if the event contains a BUSY veto trigger
         """
+        input_columns = ('nearest_busy', 'event_duration')
 
-        def _process(self, df):
-            df.loc[:, self.name()] = (abs(df['nearest_busy']) >
-                                      df['event_duration'] / 2)
-            return df
+        def _evaluate(self, c):
+            return np.abs(c['nearest_busy']) > c['event_duration'] / 2
 
     class HEVCheck(Lichen):
         """Check if the event contains a HE veto trigger
         """
+        input_columns = ('nearest_hev', 'event_duration')
 
-        def _process(self, df):
-            df.loc[:, self.name()] = (abs(df['nearest_hev']) >
-                                      df['event_duration'] / 2)
-            return df
+        def _evaluate(self, c):
+            return np.abs(c['nearest_hev']) > c['event_duration'] / 2
 
 
 class S2Tails(Lichen):
@@ -200,11 +202,10 @@ class S2Tails(Lichen):
     Contact: Daniel Coderre <daniel.coderre@lhep.unibe.ch>
     """
     version = 0
+    input_columns = ('s2_over_tdiff',)
 
-    def _process(self, df):
-        df.loc[:, self.name()] = ((~(df['s2_over_tdiff'] >= 0)) |
-                                  (df['s2_over_tdiff'] < 0.04))
-        return df
+    def _evaluate(self, c):
+        return (~(c['s2_over_tdiff'] >= 0)) | (c['s2_over_tdiff'] < 0.04)
 
 
 class FiducialCylinder1T_TPF2dFDC(StringLichen):
@@ -224,10 +225,8 @@ class FiducialCylinder1T_TPF2dFDC(StringLichen):
     """
     version = 4
     string = "(-92.9 < z) & (z < -9) & (sqrt(x*x + y*y) < 36.94)"
-
-    def pre(self, df):
-        df.loc[:, 'r'] = np.sqrt(df['x'] * df['x'] + df['y'] * df['y'])
-        return df
+    input_columns = ('x', 'y')
+    derived_columns = ('r',)    # Registered in lax.derived, added by StringLichen
 
 
 class FiducialCylinder1T(StringLichen):
@@ -238,6 +237,7 @@ class FiducialCylinder1T(StringLichen):
 
     """
     version = 5
+    float32_safe = True
     string = "(-92.9 < z_3d_nn) & (z_3d_nn < -9) & (r_3d_nn < 36.94)"
 
 
@@ -250,6 +250,7 @@ class FiducialCylinder1p3T(StringLichen):
 
     """
     version = 0
+    float32_safe = True
     string = "(-92.9 < z_3d_nn) & (z_3d_nn < -9) & (r_3d_nn < 41.26)"
 
 
@@ -263,6 +264,7 @@ class FiducialZOptimized(StringLichen):
     https://xe1t-wiki.lngs.infn.it/doku.php?id=xenon:xenon1t:analysis:sciencerun1:summary_fiducial_volume_v4
     """
     version = 4
+    float32_safe = True
     string = "(-94 < z_3d_nn) & (z_3d_nn < -8) & (r_3d_nn < 42.8387) & \
               (z_3d_nn < -2.63725 - 0.00946597*r_3d_nn*r_3d_nn) & \
               (z_3d_nn > -158.173 + 0.0456094*r_3d_nn*r_3d_nn)"
@@ -345,16 +347,11 @@ class FiducialTestEllips(StringLichen):
     parameter_symbols = tuple('z0 vz p vr2'.split())
     parameter_values = None   # Will be tuple of parameter values
     string = "((( (((z_3d_nn-@z0)**2)**0.5) /@vz)**@p)+ (r_3d_nn**2/@vr2)**@p) < 1"
+    input_columns = ('x_3d_nn', 'y_3d_nn')
+    derived_columns = ('r_3d_nn',)
 
-    def _process(self, df):
-        bla = dict(zip(self.parameter_symbols, self.parameter_values))
-        df.loc[:, self.name()] = df.eval(self.string,
-                                         global_dict=bla)
-        return df
-
-    def pre(self, df):
-        df.loc[:, 'r_3d_nn'] = np.sqrt(df['x_3d_nn']**2 + df['y_3d_nn']**2)
-        return df
+    def get_parameters(self):
+        return dict(zip(self.parameter_symbols, self.parameter_values))
 
 
 for mass, params in FV_CONFIGS:
@@ -389,25 +386,14 @@ class FiducialFourLeafClover1250kg(StringLichen):
     version = 1
 
     string = "(-92.9 < z) & (z < -9) & (r_phi < r_max)"
+    input_columns = ('x', 'y', 'z')
+    derived_columns = ('r_phi', 'r_max')
 
-    def pre(self, df):
+    def _evaluate(self, c):
 
         # first get the points from 210Po
-        # open file and get text
-        rho_phi_filename = os.path.join(DATA_DIR,
-                                        'R_phi_curve_360points.txt')
-        with open(rho_phi_filename) as file:
-            text = file.readlines()
-        # get value per line
-        phi_values = []
-        r_values = []
-        for line in text:
-            phi_values.append(float(line.split()[0]))
-            r_values.append(float(line.split()[1]))
-
         # Set values needed for phi dependent radius
-        phi_values = np.array(phi_values)
-        r_values = np.array(r_values)
+        phi_values, r_values = resources.load_table('R_phi_curve_360points.txt').T
         # this is the average radius for the shape, this we scale
         average_radius_egg = np.average(r_values)
 
@@ -447,15 +433,15 @@ class FiducialFourLeafClover1250kg(StringLichen):
                 R - r_offset) ** 2)  # returns radius array [cm]
 
         # Rho from data
-        df.loc[:, 'r_phi'] = cart2pol(df['x'], df['y'])[0]
+        c['r_phi'] = cart2pol(c['x'], c['y'])[0]
         # Max Rho
-        df.loc[:, 'r_max'] = ((radius_scaling_value / average_radius_egg) *
-                              coffee_r(df['z'],
-                                       r_values[find_nearest(phi_values, cart2pol(df['x'], df['y'])[1])],
-                                       radius_offset_value,
-                                       max_height,
-                                       -max_height / 2 + depth_upper_bound))
-        return df
+        c['r_max'] = ((radius_scaling_value / average_radius_egg) *
+                      coffee_r(c['z'],
+                               r_values[find_nearest(phi_values, cart2pol(c['x'], c['y'])[1])],
+                               radius_offset_value,
+                               max_height,
+                               -max_height / 2 + depth_upper_bound))
+        return StringLichen._evaluate(self, c)
 
 
 class AmBeFiducial(StringLichen):
@@ -471,13 +457,15 @@ class AmBeFiducial(StringLichen):
     """
     version = 2
     string = "(distance_to_source < 103.5) & (-92.9 < z) & (z < -9) & (sqrt(x*x + y*y) < 42.00)"
+    input_columns = ('x', 'y', 'z')
+    derived_columns = ('distance_to_source',)
 
-    def pre(self, df):
+    def _evaluate(self, c):
         source_position = (97, 43.5, -50)
-        df.loc[:, 'distance_to_source'] = ((source_position[0] - df['x']) ** 2 +
-                                           (source_position[1] - df['y']) ** 2 +
-                                           (source_position[2] - df['z']) ** 2) ** 0.5
-        return df
+        c['distance_to_source'] = ((source_position[0] - c['x']) ** 2 +
+                                   (source_position[1] - c['y']) ** 2 +
+                                   (source_position[2] - c['z']) ** 2) ** 0.5
+        return StringLichen._evaluate(self, c)
 
 
 class InteractionExists(StringLichen):
@@ -486,6 +474,7 @@ class InteractionExists(StringLichen):
     Contact: Christopher Tunnell <tunnell@uchicago.edu>
     """
     version = 0
+    float32_safe = True
     string = "0 < cs1"
 
 
@@ -506,6 +495,7 @@ class S1LowEnergyRange(RangeLichen):
     Contact: Christopher Tunnell <tunnell@uchicago.edu>
     """
     version = 0
+    float32_safe = True
     allowed_range = (0, 200)
     variable = 'cs1'
 
@@ -522,6 +512,7 @@ class S1MaxPMT(StringLichen):
     Contact: Julien Wulf <jwulf@physik.uzh.ch>
     """
     version = 0
+    float32_safe = True
     string = "s1_largest_hit_area < 0.052 * s1 + 4.15"
 
 
@@ -545,22 +536,23 @@ class S1PatternLikelihood(ManyLichen):
     class S1TopPatternLikelihood(Lichen):
         """S1PatternLikelihood cut based on the top PMT array
         """
+        input_columns = ('s1', 's1_area_fraction_top', 's1_pattern_fit_hax',
+                         's1_pattern_fit_bottom_hax')
 
-        def _process(self, df):
-            s1t = df['s1'] * df['s1_area_fraction_top']
-            df.loc[:, self.name()] = (df['s1_pattern_fit_hax'] - df['s1_pattern_fit_bottom_hax'] <
-                                      13.0 + 2.3 * s1t**0.5 + 8.0 * s1t - 1.0 * s1t**1.5 + 0.04 * s1t**2.0)
-            return df
+        def _evaluate(self, c):
+            s1t = c['s1'] * c['s1_area_fraction_top']
+            return (c['s1_pattern_fit_hax'] - c['s1_pattern_fit_bottom_hax'] <
+                    13.0 + 2.3 * s1t**0.5 + 8.0 * s1t - 1.0 * s1t**1.5 + 0.04 * s1t**2.0)
 
     class S1BottomPatternLikelihood(Lichen):
         """S1PatternLikelihood cut based on the bottom PMT array
         """
+        input_columns = ('s1', 's1_area_fraction_top', 's1_pattern_fit_bottom_hax')
 
-        def _process(self, df):
-            s1b = df['s1'] * (1. - df['s1_area_fraction_top'])
-            df.loc[:, self.name()] = (df['s1_pattern_fit_bottom_hax'] < - 10.5 + 21.9 * s1b**0.5 +
-                                      1.44 * s1b - 0.21 * s1b**1.5 + 0.0064 * s1b**2.0)
-            return df
+        def _evaluate(self, c):
+            s1b = c['s1'] * (1. - c['s1_area_fraction_top'])
+            return (c['s1_pattern_fit_bottom_hax'] < - 10.5 + 21.9 * s1b**0.5 +
+                    1.44 * s1b - 0.21 * s1b**1.5 + 0.0064 * s1b**2.0)
 
 
 class S1Width(StringLichen):
@@ -617,17 +609,17 @@ class S2AreaFractionTop(Lichen):
 
     Contact: Adam Brown <abrown@physik.uzh.ch>
     """
+    input_columns = ('s2_area_fraction_top', 's2')
 
-    def _process_v2(self, df):
+    def _evaluate_v2(self, c):
         """This is a simple range cut which was chosen by eye.
         """
         allowed_range = (0.5, 0.72)
         aft_variable = 's2_area_fraction_top'
-        df.loc[:, self.name()] = ((df[aft_variable] < allowed_range[1]) &
-                                  (df[aft_variable] > allowed_range[0]))
-        return df
+        return ((c[aft_variable] < allowed_range[1]) &
+                (c[aft_variable] > allowed_range[0]))
 
-    def _process_v3(self, df):
+    def _evaluate_v3(self, c):
         """This is a more complex and much tighter cut than version 2 from fitting
         the distribution in slices in S2 space and choosing the 0.5% and 99.5% quantile
         for each fit to give a theoretical acceptance of 99%.
@@ -641,23 +633,19 @@ class S2AreaFractionTop(Lichen):
 
         aft_variable = 's2_area_fraction_top'
         s2_variable = 's2'
-        df.loc[:, self.name()] = ((df[aft_variable] <
-                                   upper_limit_s2_aft(df[s2_variable])) &
-                                  (df[aft_variable] >
-                                   lower_limit_s2_aft(df[s2_variable])))
-
-        return df
+        return ((c[aft_variable] < upper_limit_s2_aft(c[s2_variable])) &
+                (c[aft_variable] > lower_limit_s2_aft(c[s2_variable])))
 
     def __init__(self, version=2):
         self.version = version
         if version not in [2, 3]:
             raise ValueError('Only versions 2 and 3 are implemented')
 
-    def _process(self, df):
+    def _evaluate(self, c):
         if self.version == 2:
-            return self._process_v2(df)
+            return self._evaluate_v2(c)
         elif self.version == 3:
-            return self._process_v3(df)
+            return self._evaluate_v3(c)
         else:
             raise ValueError('Only versions 2 and 3 are implemented')
 
@@ -672,6 +660,8 @@ class CS2AreaFractionTop(ManyLichen):
     See the note at xenon:xenon1t:adam:s2aft:sr1_cs2_cut
     """
     version = 0
+    input_columns = ('cs2_top', 'cs2')
+    derived_columns = ('cs2_aft',)
 
     class CS2AreaFractionTopUpper(StringLichen):
         """cS2 AFT upper bound
@@ -692,6 +682,10 @@ class CS2AreaFractionTop(ManyLichen):
         df.loc[:, 'cs2_aft'] = df['cs2_top'] / df['cs2']
         return df
 
+    def _evaluate_cuts(self, c):
+        c['cs2_aft'] = c['cs2_top'] / c['cs2']
+        return ManyLichen._evaluate_cuts(self, c)
+
 
 class CS2AreaFractionTop96p(StringLichen):
     """cS2 area fraction top cut with 96% acceptance
@@ -719,6 +713,7 @@ class S2SingleScatter(Lichen):
     version = 4
     allowed_range = (0, np.inf)
     variable = 'temp'
+    input_columns = ('largest_other_s2', 's2')
 
     @classmethod
     def other_s2_bound(cls, s2_area):
@@ -730,10 +725,9 @@ class S2SingleScatter(Lichen):
 
         return rescaled_s2_0 * another_term_0 + rescaled_s2_1 * another_term_1
 
-    def _process(self, df):
-        largest_other_s2_is_nan = np.isnan(df.largest_other_s2)
-        df.loc[:, self.name()] = largest_other_s2_is_nan | (df.largest_other_s2 < self.other_s2_bound(df.s2))
-        return df
+    def _evaluate(self, c):
+        largest_other_s2_is_nan = np.isnan(c.largest_other_s2)
+        return largest_other_s2_is_nan | (c.largest_other_s2 < self.other_s2_bound(c.s2))
 
 
 class S2SingleScatterSimple(StringLichen):
@@ -774,6 +768,7 @@ class S2Threshold(StringLichen):
     Contact: Jelle Aalbers <aalbers@nikhef.nl>
     """
     version = 1
+    float32_safe = True
     string = "200 < s2"
 
 
@@ -790,6 +785,7 @@ class S2Width(Lichen):
     Contact: Tianyu <tz2263@columbia.edu>, Yuehuan <weiyh@physik.uzh.ch>, Jelle <jaalbers@nikhef.nl>
     """
     version = 6
+    input_columns = ('drift_time', 's2', 's2_range_50p_area')
 
     diffusion_constant = 25.26 * ((units.cm)**2) / units.s
     v_drift = 1.440 * (units.um) / units.ns
@@ -803,21 +799,15 @@ class S2Width(Lichen):
         """
         return np.sqrt(2 * self.diffusion_constant * (drift_time - self.DriftTimeFromGate) / self.v_drift ** 2)
 
-    def _process(self, df):
-        df.loc[:, self.name()] = True  # Default is True
-        mask = df.drift_time > self.DriftTimeFromGate
-        df.loc[mask, 'nElectron'] = np.clip(df.loc[mask, 's2'], 0, 5000) / self.scg
-        df.loc[mask, 'normWidth'] = (np.square(df.loc[mask, 's2_range_50p_area'] / self.SigmaToR50) -
-                                     np.square(self.scw)) / np.square(self.s2_width_model(df.loc[mask, 'drift_time']))
-        df.loc[mask, self.name()] = chi2.logpdf(df.loc[mask, 'normWidth'] * (df.loc[mask, 'nElectron'] - 1),
-                                                df.loc[mask, 'nElectron']) > - 14
-        return df
-
-    def post(self, df):
-        for temp_column in ['nElectron', 'normWidth']:
-            if temp_column in df.columns:
-                df.drop(temp_column, 1, inplace=True)
-        return df
+    def _evaluate(self, c):
+        from scipy.stats import chi2
+        passed = np.ones(len(c), dtype=bool)  # Default is True
+        mask = c.drift_time > self.DriftTimeFromGate
+        n_electron = np.clip(c.s2[mask], 0, 5000) / self.scg
+        norm_width = (np.square(c.s2_range_50p_area[mask] / self.SigmaToR50) -
+                      np.square(self.scw)) / np.square(self.s2_width_model(c.drift_time[mask]))
+        passed[mask] = chi2.logpdf(norm_width * (n_electron - 1), n_electron) > - 14
+        return passed
 
 
 class S1SingleScatter(Lichen):
@@ -840,23 +830,24 @@ class S1SingleScatter(Lichen):
 
     version = 4
     s2width = S2Width
+    input_columns = ('alt_s1_interaction_drift_time', 's2', 's2_range_50p_area')
 
-    def _process(self, df):
-        df.loc[:, self.name()] = True  # Default is True
-        mask = df.alt_s1_interaction_drift_time > self.s2width.DriftTimeFromGate
-        alt_n_electron = np.clip(df.loc[mask, 's2'], 0, 5000) / self.s2width.scg
+    def _evaluate(self, c):
+        from scipy.stats import chi2
+        passed = np.ones(len(c), dtype=bool)  # Default is True
+        mask = c.alt_s1_interaction_drift_time > self.s2width.DriftTimeFromGate
+        alt_n_electron = np.clip(c.s2[mask], 0, 5000) / self.s2width.scg
 
         # Alternate S1 relative width
-        alt_rel_width = np.square(df.loc[mask,
-                                         's2_range_50p_area'] / self.s2width.SigmaToR50) - np.square(self.s2width.scw)
+        alt_rel_width = np.square(c.s2_range_50p_area[mask] / self.s2width.SigmaToR50) - np.square(self.s2width.scw)
         alt_rel_width /= np.square(self.s2width.s2_width_model(self.s2width,
-                                                               df.loc[mask, 'alt_s1_interaction_drift_time']))
+                                                               c.alt_s1_interaction_drift_time[mask]))
 
         alt_interaction_passes = chi2.logpdf(alt_rel_width * (alt_n_electron - 1), alt_n_electron) > - 20
 
-        df.loc[mask, (self.name())] = True ^ alt_interaction_passes
+        passed[mask] = True ^ alt_interaction_passes
 
-        return df
+        return passed
 
 
 class S1AreaFractionTop(StringLichen):
@@ -890,6 +881,7 @@ class PreS2Junk(StringLichen):
     Contact: Julien Wulf <jwulf@physik.uzh.ch>
     """
     version = 1
+    float32_safe = True
     string = "area_before_main_s2 - s1 < 300"
 
 
@@ -946,15 +938,15 @@ class Flash(Lichen):
     """
 
     version = 0
+    input_columns = ('inside_flash', 'nearest_flash', 'flashing_width')
 
-    def _process(self, df):
-        df.loc[:, self.name()] = ((df['inside_flash'] == False) &
-                                  ((df.nearest_flash != df.nearest_flash) |
-                                   (df['nearest_flash'] > 120e9) |
-                                   (df['nearest_flash'] < (-10e9 - df['flashing_width'] * 1e9))
-                                   )
-                                  )
-        return df
+    def _evaluate(self, c):
+        return ((c['inside_flash'] == False) &
+                ((c.nearest_flash != c.nearest_flash) |
+                 (c['nearest_flash'] > 120e9) |
+                 (c['nearest_flash'] < (-10e9 - c['flashing_width'] * 1e9))
+                 )
+                )
 
 
 class PosDiff(Lichen):
@@ -965,12 +957,12 @@ class PosDiff(Lichen):
     Contact: Yuehuan Wei <ywei@physics.ucsd.edu>, Tianyu Zhu <tz2263@columbia.edu>
     """
     version = 4
+    input_columns = ('x_observed_nn', 'x_observed_tpf', 'y_observed_nn', 'y_observed_tpf', 's2')
 
-    def _process(self, df):
-        df.loc[:, self.name()] = (np.sqrt((df['x_observed_nn'] - df['x_observed_tpf'])**2 +
-                                          (df['y_observed_nn'] - df['y_observed_tpf'])**2) <
-                                  2429.322 * np.exp(-np.log10(df.s2) / 0.362) + 1.587)
-        return df
+    def _evaluate(self, c):
+        return (np.sqrt((c['x_observed_nn'] - c['x_observed_tpf'])**2 +
+                        (c['y_observed_nn'] - c['y_observed_tpf'])**2) <
+                2429.322 * np.exp(-np.log10(c.s2) / 0.362) + 1.587)
 
 
 class SingleElectronS2s(Lichen):  # noqa
@@ -978,31 +970,90 @@ class SingleElectronS2s(Lichen):  # noqa
     S1 and single electron S2s samples are used to train a Gradient-BDT and Random-Forest classifier. A weight average
     voting was then used to distinguish the two samples and cut is defined in this new parameter space.
     Information: xenon:xenon1t:analysis:subgroup:cuts:meetings:20180126:se_classification
+    The random forest (XENON1T_random_forest_peak_classifier_02052018.npz, or its .pkl) is not
+    shipped with lax: put it in the data directory before using this lichen.
     Contact: Fei Gao <feigao.ge@gmail.com>
     """
 
     version = 5
-
-    def _process(self, df):
-
-        # Random forest classifier
-        forest_filename = os.path.join(DATA_DIR, 'XENON1T_random_forest_peak_classifier_02052018.pkl')
-        forest_load = pickle.load(open(forest_filename, 'rb'))  # noqa
-
-        # Gradient Boosted Decesion Tree classifier
-        gbdt_filename = os.path.join(DATA_DIR, 'XENON1T_gradient_bdt_peak_classifier_02052018.pkl')
-        gbdt_load = pickle.load(open(gbdt_filename, 'rb'))  # noqa
+    input_columns = ('s1', 's1_area_fraction_top', 's1_rise_time', 's1_range_90p_area')
+    derived_columns = ('ses2prob',)
+
+    # Random forest classifier
+    forest_filename = os.path.join(DATA_DIR, 'XENON1T_random_forest_peak_classifier_02052018.npz')
+    # Gradient Boosted Decesion Tree classifier
+    gbdt_filename = os.path.join(DATA_DIR, 'XENON1T_gradient_bdt_peak_classifier_02052018.npz')
+
+    # Decide events from the bounds of ses2prob on a grid of the features, and
+    # run the classifiers only on events whose bounds straddle the threshold.
+    # Decisions are those of the classifiers; ses2prob is the middle of the
+    # bounds for events decided by the grid.
+    grid = False
+    # Grid edges per feature, placed on the thresholds of the trees
+    grid_edges = 16
+    # Cache of the grid, rebuilt when missing or made from other models. One
+    # file per number of edges, see grid_path.
+    grid_filename = os.path.join(DATA_DIR, 'XENON1T_peak_classifier_02052018_grid.npz')
+
+    def _models(self):
+        # Exported from the scikit-learn pickles with lax.trees.export
+        return (resources.load(self.forest_filename, trees.load),
+                resources.load(self.gbdt_filename, trees.load))
+
+    def load_resources(self):
+        if self.grid:
+            return self._models() + (resources.load(self.grid_path(), self._load_grid),)
+        return self._models()
+
+    def grid_path(self):
+        """Return the grid file for grid_edges, e.g. ..._grid_16.npz for grid_filename ..._grid.npz"""
+        root, ext = os.path.splitext(self.grid_filename)
+        return '%s_%d%s' % (root, self.grid_edges, ext)
+
+    def _grid_key(self, models):
+        return '%d %s' % (self.grid_edges, ' '.join(model.fingerprint() for model in models))
+
+    def _load_grid(self, filename):
+        forest_load, gbdt_load = models = self._models()
+        key = self._grid_key(models)
+        if os.path.exists(filename):
+            grid = trees.BoundsGrid.load(filename)
+            if grid.key == key:
+                return grid
+        edges = trees.threshold_edges(models, self.grid_edges)
+        forest_low, forest_high = forest_load.proba_bounds(edges)
+        gbdt_low, gbdt_high = gbdt_load.proba_bounds(edges)
+        grid = trees.BoundsGrid(edges, 0.5 * forest_low + 0.5 * gbdt_low,
+                                0.5 * forest_high + 0.5 * gbdt_high, key)
+        try:
+            grid.save(filename)
+        except (IOError, OSError):
+            pass
+        return grid
+
+    def _evaluate(self, c):
+        forest_load, gbdt_load = self._models()
 
         def _classifier_soft(features):
             return 0.5 * forest_load.predict_proba(features) + 0.5 * gbdt_load.predict_proba(features)
 
-        df.loc[:, 'ses2prob'] = _classifier_soft(df[['s1', 's1_area_fraction_top', 's1_rise_time',
-                                                     's1_range_90p_area']])[:, 1]
+        features = np.column_stack([c['s1'], c['s1_area_fraction_top'], c['s1_rise_time'],
+                                    c['s1_range_90p_area']])
 
         cut_threshold = 0.9
 
-        # current model is trained by data with S1 < 70PE and S1 width < 450PE
-        df.loc[:, self.name()] = (((df['ses2prob'] <= cut_threshold) & (df['s1_range_90p_area'] < 450)) |
-                                  (df['s1'] > 70))
+        if self.grid:
+            low, high = resources.load(self.grid_path(), self._load_grid).lookup(features)
+            ses2prob = 0.5 * (low + high)
+            # Margin for the rounding of the summed bounds
+            undecided = ((low <= cut_threshold + 1e-9) & (high >= cut_threshold - 1e-9) &
+                         np.asarray(c['s1_range_90p_area'] < 450) & ~np.asarray(c['s1'] > 70))
+            if undecided.any():
+                ses2prob[undecided] = _classifier_soft(features[undecided])[:, 1]
+            c['ses2prob'] = ses2prob
+        else:
+            c['ses2prob'] = _classifier_soft(features)[:, 1]
 
-        return df
+        # current model is trained by data with S1 < 70PE and S1 width < 450PE
+        return (((c['ses2prob'] <= cut_threshold) & (c['s1_range_90p_area'] < 450)) |
+                (c['s1'] > 70))
@@ -7,8 +7,8 @@ This includes all current definitions of the cuts for the second science run
 import inspect
 import os
 import numpy as np
-from pax import units
 
+from lax import units
 from lax.lichen import ManyLichen, StringLichen
 from lax.lichens import sciencerun0
 from lax import __version__ as lax_version
@@ -184,16 +184,11 @@ class FiducialTestEllips(StringLichen):
     parameter_symbols = tuple('z0 vz p vr2'.split())
     parameter_values = None   # Will be tuple of parameter values
     string = "((((((z_3d_nn-@z0)**2)**0.5)/@vz)**@p)+(r_3d_nn**2/@vr2)**@p)<1"
+    input_columns = ('x_3d_nn', 'y_3d_nn')
+    derived_columns = ('r_3d_nn',)
 
-    def _process(self, df):
-        bla = dict(zip(self.parameter_symbols, self.parameter_values))
-        df.loc[:, self.name()] = df.eval(self.string,
-                                         global_dict=bla)
-        return df
-
-    def pre(self, df):
-        df.loc[:, 'r_3d_nn'] = np.sqrt(df['x_3d_nn']**2 + df['y_3d_nn']**2)
-        return df
+    def get_parameters(self):
+        return dict(zip(self.parameter_symbols, self.parameter_values))
 
 
 for mass, params in FV_CONFIGS:
@@ -213,13 +208,15 @@ class NGFiducial(StringLichen):
     """
     version = 0
     string = "(distance_to_source < 111.5) & (-92.9 < z) & (z < -9) & (sqrt(x*x + y*y) < 42.00)"
+    input_columns = ('x', 'y', 'z')
+    derived_columns = ('distance_to_source',)
 
-    def pre(self, df):
+    def _evaluate(self, c):
         source_position = (31.6, 86.8, -50)
-        df.loc[:, 'distance_to_source'] = ((source_position[0] - df['x']) ** 2 +
-                                           (source_position[1] - df['y']) ** 2 +
-                                           (source_position[2] - df['z']) ** 2) ** 0.5
-        return df
+        c['distance_to_source'] = ((source_position[0] - c['x']) ** 2 +
+                                   (source_position[1] - c['y']) ** 2 +
+                                   (source_position[2] - c['z']) ** 2) ** 0.5
+        return StringLichen._evaluate(self, c)
 
 
 InteractionExists = sciencerun0.InteractionExists
@@ -1,6 +1,7 @@
 """Cuts for SR2 analyses"""
 import numpy as np                                         # pylint: disable=unused-import
 from lax.lichen import Lichen, ManyLichen, StringLichen    # pylint: disable=unused-import
+from lax.expression import get_expression
 from lax import __version__ as lax_version
 
 from lax.lichens import sciencerun0 as sr0
@@ -8,8 +9,6 @@ from lax.lichens import sciencerun1 as sr1
 from lax.lichens import postsr1
 DATA_DIR = sr1.DATA_DIR
 
-from scipy.stats import chi2
-
 ##
 # Combination cut packages
 ##
@@ -155,10 +154,12 @@ class PosDiff(Lichen):
     Contact: Ricardo Peres <rperes@physik.uzh.ch>
     version = 5.1
     """
-    def _process(self,df):
-        df.loc[:,self.name()] = (np.sqrt((df['x_observed_nn_tf'] - df['x_observed_tpf'])**2 +
-                                         (df['y_observed_nn_tf'] - df['y_observed_tpf'])**2)) < (3574.38766518 * np.exp(-np.log10(df.s2)/0.342140864302) + 1.43838876151)
-        return df
+    input_columns = ('x_observed_nn_tf', 'x_observed_tpf', 'y_observed_nn_tf', 'y_observed_tpf',
+                     's2')
+
+    def _evaluate(self, c):
+        return (np.sqrt((c['x_observed_nn_tf'] - c['x_observed_tpf'])**2 +
+                        (c['y_observed_nn_tf'] - c['y_observed_tpf'])**2)) < (3574.38766518 * np.exp(-np.log10(c.s2)/0.342140864302) + 1.43838876151)
     
 # S2 AFT
 # Contact: Giovanni, Dominick
@@ -189,6 +190,8 @@ class CS2AreaFractionTopExtended(StringLichen):
              Giovanni Volta  <gvolta@physik.uzh.ch>"""
 
     version = 3
+    input_columns = ('cs2_top', 'cs2_bottom', 's2_lifetime_correction')
+    derived_columns = ('cxys2', 'cs2_aft')
 
     top_bound_string = ('(6.533946E-01 + 2.238536E-07 * cxys2 +'
                         ' -5.791706E-13 * cxys2**2 + 6.021542E-19 * cxys2**3 +'
@@ -202,13 +205,6 @@ class CS2AreaFractionTopExtended(StringLichen):
     string = ('((' + top_bound_string + ' > cs2_aft) & (' + bot_bound_string +
               ' < cs2_aft)) | (cxys2 > 2163000) | (cxys2 < 60)')
 
-    def pre(self, df):
-        df.loc[:, 'cxys2'] = ((df['cs2_top'] + df['cs2_bottom']) /
-                                df['s2_lifetime_correction'])
-        df.loc[:, 'cs2_aft'] = df['cs2_top'] / (df['cs2_top'] +
-                                                df['cs2_bottom'])
-        return df
-
 # S2 AFT cut for SR2 DEC analysis
 # Contact: Alex
 class CS2AreaFractionTopExtended98PercentSR2DEC(StringLichen):
@@ -218,54 +214,50 @@ class CS2AreaFractionTopExtended98PercentSR2DEC(StringLichen):
     Contact: Alexander Bismark <alexander.bismark@physik.uzh.ch>
     """ 
     version = 1
-
-    def pre(self, df):
-        df.loc[:, 'phi_3d_nn_tf']=np.arccos(df.x_3d_nn_tf/df.r_3d_nn_tf)*np.sign(df.y_3d_nn_tf)
-        df.loc[:, 'cxys2'] = ((df['cs2_top'] + df['cs2_bottom']) /
-                              df['s2_lifetime_correction'])
-        df.loc[:, 'cs2_aft'] = df['cs2_top'] / (df['cs2_top'] +
-                                                df['cs2_bottom'])
+    input_columns = ('x_3d_nn_tf', 'y_3d_nn_tf', 'r_3d_nn_tf', 'cs2_top', 'cs2_bottom',
+                     's2_lifetime_correction', 'run_number')
+    derived_columns = ('phi_3d_nn_tf', 'cxys2', 'cs2_aft',
+                       'CS2AreaFractionTopExtended98PercentSR2DEC_a',
+                       'CS2AreaFractionTopExtended98PercentSR2DEC_b',
+                       'CS2AreaFractionTopExtended98PercentSR2DEC_c',
+                       'CS2AreaFractionTopExtended98PercentSR2DEC_d')
+
+    def _evaluate(self, columns):
+        for name in ('phi_3d_nn_tf', 'cxys2', 'cs2_aft'):
+            columns[name] = columns.compute(name)
                                                 
         sel1=[24,55,0.18,0.85]
         sel2=[28.5,55,2.3,2.9]
 
-        top_bound = (0.648994665 + 1.52300931e-07 * df.cxys2 + -5.2647479e-13 * df.cxys2**2 + 8.03568987e-19 * df.cxys2**3 + -5.57506181e-25 * df.cxys2**4 + 1.43685312e-31 * df.cxys2**5 + 1.56990461 / np.sqrt(df.cxys2) + -4.07228467 / df.cxys2)
-        bot_bound = (0.625340081 + -3.98287273e-08 * df.cxys2 + 2.35998476e-13 * df.cxys2**2 + -6.28529432e-19 * df.cxys2**3 + 6.34553716e-25 * df.cxys2**4 + -2.13412861e-31 * df.cxys2**5 + -1.58076848 / np.sqrt(df.cxys2) + -0.188795581 / df.cxys2)
-        top_bound_sel1 = (0.614152119 + 2.02515815e-07 * df.cxys2 + -7.08321e-13 * df.cxys2**2 + 1.0052712e-18 * df.cxys2**3 + -3.21842323e-25 * df.cxys2**4 + -1.85841891e-31 * df.cxys2**5 + 2.22730555 / np.sqrt(df.cxys2) + -8.2040897 / df.cxys2)
-        bot_bound_sel1 = (0.594656959 + -2.69355922e-07 * df.cxys2 + 2.52189944e-12 * df.cxys2**2 + -9.42801294e-18 * df.cxys2**3 + 1.52439199e-23 * df.cxys2**4 + -8.87478224e-30 * df.cxys2**5 + -1.56542759 / np.sqrt(df.cxys2) + 2.55577526 / df.cxys2)
-        top_bound_sel2 = (0.622277296 + -3.68293654e-08 * df.cxys2 + 1.27599576e-12 * df.cxys2**2 + -5.6877691e-18 * df.cxys2**3 + 9.37834312e-24 * df.cxys2**4 + -5.27123147e-30 * df.cxys2**5 + 1.90261854 / np.sqrt(df.cxys2) + -5.64666308 / df.cxys2)
-        bot_bound_sel2 = (0.569358238 + -2.48258216e-07 * df.cxys2 + 1.95452201e-12 * df.cxys2**2 + -5.96514761e-18 * df.cxys2**3 + 7.53101645e-24 * df.cxys2**4 + -3.3715658e-30 * df.cxys2**5 + -1.54181588 / np.sqrt(df.cxys2) + -0.299435546 / df.cxys2)
-
-        a = (df.cxys2 > 1752600.0)
-        b = (df.cxys2  < 60)
-        c = ((df.run_number >= 18836) 
-               & (df.cs2_aft < top_bound)
-               & (df.cs2_aft > bot_bound))
-        d = ((df.run_number < 18836)
-         & ((((df['r_3d_nn_tf']>sel1[0])&(df['r_3d_nn_tf']<sel1[1])&(df['phi_3d_nn_tf']>sel1[2])&(df['phi_3d_nn_tf']<sel1[3])) 
-             & (df.cs2_aft < top_bound_sel1) 
-             & (df.cs2_aft > bot_bound_sel1))
-            |(((df['r_3d_nn_tf']>sel2[0])&(df['r_3d_nn_tf']<sel2[1])&(df['phi_3d_nn_tf']>sel2[2])&(df['phi_3d_nn_tf']<sel2[3])) 
-              & (df.cs2_aft < top_bound_sel2) 
-              & (df.cs2_aft > bot_bound_sel2))
-            |((~(((df['r_3d_nn_tf']>sel1[0])&(df['r_3d_nn_tf']<sel1[1])&(df['phi_3d_nn_tf']>sel1[2])&(df['phi_3d_nn_tf']<sel1[3]))
-                 |((df['r_3d_nn_tf']>sel2[0])&(df['r_3d_nn_tf']<sel2[1]) &(df['phi_3d_nn_tf']>sel2[2])&(df['phi_3d_nn_tf']<sel2[3])))) 
-              & (df.cs2_aft < top_bound) 
-              & (df.cs2_aft > bot_bound))))
-        df.loc[:,'CS2AreaFractionTopExtended98PercentSR2DEC_a'] = a
-        df.loc[:,'CS2AreaFractionTopExtended98PercentSR2DEC_b'] = b
-        df.loc[:,'CS2AreaFractionTopExtended98PercentSR2DEC_c'] = c
-        df.loc[:,'CS2AreaFractionTopExtended98PercentSR2DEC_d'] = d 
-        
-        try:
-            del top_bound; del bot_bound; 
-            del top_bound_sel1; del bot_bound_sel1; 
-            del top_bound_sel2; del bot_bound_sel2;
-            del a; del b; del c; del d
-        except:
-            pass
-                                                        
-        return df
+        top_bound = (0.648994665 + 1.52300931e-07 * columns.cxys2 + -5.2647479e-13 * columns.cxys2**2 + 8.03568987e-19 * columns.cxys2**3 + -5.57506181e-25 * columns.cxys2**4 + 1.43685312e-31 * columns.cxys2**5 + 1.56990461 / np.sqrt(columns.cxys2) + -4.07228467 / columns.cxys2)
+        bot_bound = (0.625340081 + -3.98287273e-08 * columns.cxys2 + 2.35998476e-13 * columns.cxys2**2 + -6.28529432e-19 * columns.cxys2**3 + 6.34553716e-25 * columns.cxys2**4 + -2.13412861e-31 * columns.cxys2**5 + -1.58076848 / np.sqrt(columns.cxys2) + -0.188795581 / columns.cxys2)
+        top_bound_sel1 = (0.614152119 + 2.02515815e-07 * columns.cxys2 + -7.08321e-13 * columns.cxys2**2 + 1.0052712e-18 * columns.cxys2**3 + -3.21842323e-25 * columns.cxys2**4 + -1.85841891e-31 * columns.cxys2**5 + 2.22730555 / np.sqrt(columns.cxys2) + -8.2040897 / columns.cxys2)
+        bot_bound_sel1 = (0.594656959 + -2.69355922e-07 * columns.cxys2 + 2.52189944e-12 * columns.cxys2**2 + -9.42801294e-18 * columns.cxys2**3 + 1.52439199e-23 * columns.cxys2**4 + -8.87478224e-30 * columns.cxys2**5 + -1.56542759 / np.sqrt(columns.cxys2) + 2.55577526 / columns.cxys2)
+        top_bound_sel2 = (0.622277296 + -3.68293654e-08 * columns.cxys2 + 1.27599576e-12 * columns.cxys2**2 + -5.6877691e-18 * columns.cxys2**3 + 9.37834312e-24 * columns.cxys2**4 + -5.27123147e-30 * columns.cxys2**5 + 1.90261854 / np.sqrt(columns.cxys2) + -5.64666308 / columns.cxys2)
+        bot_bound_sel2 = (0.569358238 + -2.48258216e-07 * columns.cxys2 + 1.95452201e-12 * columns.cxys2**2 + -5.96514761e-18 * columns.cxys2**3 + 7.53101645e-24 * columns.cxys2**4 + -3.3715658e-30 * columns.cxys2**5 + -1.54181588 / np.sqrt(columns.cxys2) + -0.299435546 / columns.cxys2)
+
+        a = (columns.cxys2 > 1752600.0)
+        b = (columns.cxys2  < 60)
+        c = ((columns.run_number >= 18836) 
+               & (columns.cs2_aft < top_bound)
+               & (columns.cs2_aft > bot_bound))
+        d = ((columns.run_number < 18836)
+         & ((((columns['r_3d_nn_tf']>sel1[0])&(columns['r_3d_nn_tf']<sel1[1])&(columns['phi_3d_nn_tf']>sel1[2])&(columns['phi_3d_nn_tf']<sel1[3])) 
+             & (columns.cs2_aft < top_bound_sel1) 
+             & (columns.cs2_aft > bot_bound_sel1))
+            |(((columns['r_3d_nn_tf']>sel2[0])&(columns['r_3d_nn_tf']<sel2[1])&(columns['phi_3d_nn_tf']>sel2[2])&(columns['phi_3d_nn_tf']<sel2[3])) 
+              & (columns.cs2_aft < top_bound_sel2) 
+              & (columns.cs2_aft > bot_bound_sel2))
+            |((~(((columns['r_3d_nn_tf']>sel1[0])&(columns['r_3d_nn_tf']<sel1[1])&(columns['phi_3d_nn_tf']>sel1[2])&(columns['phi_3d_nn_tf']<sel1[3]))
+                 |((columns['r_3d_nn_tf']>sel2[0])&(columns['r_3d_nn_tf']<sel2[1]) &(columns['phi_3d_nn_tf']>sel2[2])&(columns['phi_3d_nn_tf']<sel2[3])))) 
+              & (columns.cs2_aft < top_bound) 
+              & (columns.cs2_aft > bot_bound))))
+        columns['CS2AreaFractionTopExtended98PercentSR2DEC_a'] = a
+        columns['CS2AreaFractionTopExtended98PercentSR2DEC_b'] = b
+        columns['CS2AreaFractionTopExtended98PercentSR2DEC_c'] = c
+        columns['CS2AreaFractionTopExtended98PercentSR2DEC_d'] = d
+
+        return StringLichen._evaluate(self, columns)
         
     string = ('(CS2AreaFractionTopExtended98PercentSR2DEC_a | '
               'CS2AreaFractionTopExtended98PercentSR2DEC_b | '
@@ -296,10 +288,10 @@ class S1PMT3fold(Lichen):
     """
 
     version = 1
+    input_columns = ('s1_tight_coincidence',)
 
-    def _process(self, df):
-        df.loc[:, self.name()] = (df['s1_tight_coincidence'] > 2)
-        return df
+    def _evaluate(self, c):
+        return c['s1_tight_coincidence'] > 2
 
 # Maximum contribution of each PMT to the S1 hitpattern
 # Contact: UNKNOWN!!
@@ -350,20 +342,22 @@ class S2SingleScatter(Lichen):
     """
 
     version = 5
+    input_columns = ('largest_other_s2', 'largest_other_s2_pattern_fit',
+                     'largest_other_s2_delay_main_s1')
 
-    def _process(self, df):
-        df.loc[:, self.name()] = True
+    def _evaluate(self, c):
+        passed = np.ones(len(c), dtype=bool)
 
-        mask = df.eval('(largest_other_s2>0) \
+        mask = get_expression('(largest_other_s2>0) \
             & (largest_other_s2_pattern_fit>0) \
             & ((largest_other_s2_delay_main_s1<0) \
-            | (largest_other_s2_delay_main_s1>10e3))')
+            | (largest_other_s2_delay_main_s1>10e3))').evaluate(c)
 
-        df.loc[mask, self.name()] = df.loc[mask, 'largest_other_s2_pattern_fit'] > 0.856 * \
-            df.loc[mask, 'largest_other_s2'] - 47.8 * \
-            np.exp(- df.loc[mask, 'largest_other_s2'] / 32.93)
+        passed[mask] = c.largest_other_s2_pattern_fit[mask] > 0.856 * \
+            c.largest_other_s2[mask] - 47.8 * \
+            np.exp(- c.largest_other_s2[mask] / 32.93)
 
-        return df
+        return passed
 
 # S1 single scatter
 # Contact: Joran
@@ -390,26 +384,28 @@ class S1SingleScatter(Lichen):
     version = 5
     s2width = S2Width
     alt_s1_coincidence_threshold = 3
+    input_columns = ('alt_s1_interaction_drift_time', 'alt_s1_tight_coincidence', 's2',
+                     's2_range_50p_area')
     
-    def _process(self, df):
-        df.loc[:, self.name()] = True  # Default is True
-        mask = (df.alt_s1_interaction_drift_time > self.s2width.DriftTimeFromGate) & (
-                df.alt_s1_tight_coincidence >= self.alt_s1_coincidence_threshold)      
+    def _evaluate(self, c):
+        passed = np.ones(len(c), dtype=bool)  # Default is True
+        mask = (c.alt_s1_interaction_drift_time > self.s2width.DriftTimeFromGate) & (
+                c.alt_s1_tight_coincidence >= self.alt_s1_coincidence_threshold)      
     
         # S2 width cut for alternate S1 - main S2 interaction
-        alt_n_electron = np.clip(df.loc[mask, 's2'], 0, 5000) / self.s2width.scg
+        alt_n_electron = np.clip(c.s2[mask], 0, 5000) / self.s2width.scg
         
-        alt_rel_width = np.square(df.loc[mask,
-                's2_range_50p_area'] / self.s2width.SigmaToR50) - np.square(self.s2width.scw)
+        alt_rel_width = np.square(c.s2_range_50p_area[mask] / self.s2width.SigmaToR50) - np.square(self.s2width.scw)
         alt_rel_width /= np.square(self.s2width.s2_width_model(self.s2width,
-                df.loc[mask, 'alt_s1_interaction_drift_time']))
+                c.alt_s1_interaction_drift_time[mask]))
 
+        from scipy.stats import chi2
         alt_interaction_passes = chi2.logpdf(
                 alt_rel_width * (alt_n_electron - 1), alt_n_electron) > - 20
 
-        df.loc[mask, (self.name())] = True ^ alt_interaction_passes
+        passed[mask] = True ^ alt_interaction_passes
 
-        return df
+        return passed
 
 
 ##
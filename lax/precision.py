@@ -0,0 +1,141 @@
+"""Check lichens in single precision
+
+Lichens declaring float32_safe are evaluated on float32 copies of the float64
+minitree columns when their cut set has float32 = True (see
+ManyLichen.float32). flipped_events tells how many events of a reference
+sample change cut in single precision, to decide which lichens can declare
+themselves safe:
+
+    from lax import precision
+    print(precision.flipped_events(sciencerun1.LowEnergyBackground(), df))
+    precision.check_float32_safe(sciencerun1.LowEnergyBackground(), df)
+
+Copying columns on each evaluation saves no memory traffic. For that, cast
+the columns once after loading the minitrees with cast_float32: columns only
+safe lichens read are then stored, and read, in single precision.
+
+    df = precision.cast_float32(df, sciencerun1.LowEnergyBackground())
+"""
+# -*- coding: utf-8 -*-
+
+import copy
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lax import derived
+from lax.lichen import ManyLichen
+
+
+def _evaluate(lichen, data, float32):
+    """Return {cut name: boolean array} of lichen (and its lichens, if a cut set)"""
+    columns = derived.Columns(data, float32=float32)
+    with derived.memoize(), np.errstate(all='ignore'):
+        if isinstance(lichen, ManyLichen):
+            results = lichen._evaluate_cuts(columns)
+            passed = np.ones(len(columns), dtype=bool)
+            for outcome in results.values():
+                passed &= outcome
+        else:
+            results = OrderedDict()
+            passed = np.asarray(lichen._evaluate(columns), dtype=bool)
+    results[lichen.name()] = passed
+    return results
+
+
+def flipped_events(lichen, data):
+    """Count events whose cut differs between float64 and float32 evaluation
+
+    All lichens are evaluated in single precision here, whether they declare
+    float32_safe or not. Lichens of a cut set read the float32 results of
+    those before them.
+
+    :param lichen: Lichen or cut set; each lichen of a set is reported
+    :param data: Reference sample: DataFrame, dict of arrays or structured array
+    :return: DataFrame indexed by cut name, with columns float32_safe (as
+             declared), passed (events passing in float64), lost (passing in
+             float64 only), gained (passing in float32 only), flipped (lost +
+             gained) and fraction (flipped / events)
+    """
+    lichen.check_columns(data)
+    if getattr(lichen, 'float32', False):
+        # The reference is all in double precision
+        lichen = copy.copy(lichen)
+        lichen.float32 = False
+    exact = _evaluate(lichen, data, float32=False)
+    single = _evaluate(lichen, data, float32=True)
+    declared = {lichen.name(): lichen.float32_safe}
+    if isinstance(lichen, ManyLichen):
+        declared.update((each.name(), each.float32_safe) for each in lichen.lichen_list)
+
+    rows = []
+    for name, passed in exact.items():
+        lost = int(np.sum(passed & ~single[name]))
+        gained = int(np.sum(~passed & single[name]))
+        rows.append(OrderedDict([('float32_safe', declared[name]),
+                                 ('passed', int(passed.sum())),
+                                 ('lost', lost),
+                                 ('gained', gained),
+                                 ('flipped', lost + gained),
+                                 ('fraction', (lost + gained) / float(max(len(passed), 1)))]))
+    return pd.DataFrame(rows, index=list(exact))
+
+
+def _with_inputs(columns):
+    """Return columns and, recursively, the inputs of those that are derived variables"""
+    result = set()
+    for column in columns:
+        if column not in result:
+            result.add(column)
+            if column in derived.REGISTRY:
+                result |= _with_inputs(derived.REGISTRY[column].inputs)
+    return result
+
+
+def _columns_read(lichen, safe, unsafe):
+    """Add the columns read by lichens declaring float32_safe to safe, the others to unsafe"""
+    if isinstance(lichen, ManyLichen):
+        unsafe |= _with_inputs(lichen.input_columns)
+        for each in lichen.lichen_list:
+            _columns_read(each, safe, unsafe)
+    elif lichen.float32_safe:
+        safe |= _with_inputs(lichen.required_columns())
+    else:
+        unsafe |= _with_inputs(lichen.required_columns())
+
+
+def cast_float32(df, lichen):
+    """Store the float64 columns of df that only lichens declaring float32_safe read as float32
+
+    Every lichen then reads these columns in single precision, whether its
+    cut set has float32 set or not. Columns read by other lichens (directly
+    or through derived variables) stay in double precision.
+
+    :param df: DataFrame of events, modified in place
+    :param lichen: Lichen or cut set that will process df
+    :return: df
+    """
+    safe, unsafe = set(), set()
+    _columns_read(lichen, safe, unsafe)
+    for column in df.columns:
+        if column in safe and column not in unsafe and df[column].dtype == np.float64:
+            df[column] = df[column].values.astype(np.float32)
+    return df
+
+
+def check_float32_safe(lichen, data, max_fraction=0.):
+    """Raise a ValueError if a lichen declaring float32_safe flips events of data
+
+    :param lichen: Lichen or cut set
+    :param data: Reference sample: DataFrame, dict of arrays or structured array
+    :param max_fraction: Fraction of flipped events tolerated
+    :return: DataFrame of flipped_events
+    """
+    report = flipped_events(lichen, data)
+    bad = report[report['float32_safe'].astype(bool) & (report['fraction'] > max_fraction)]
+    if len(bad):
+        raise ValueError('Lichens declared float32_safe flip events in single precision: %s' %
+                         ', '.join('%s (%d)' % (name, flipped)
+                                   for name, flipped in bad['flipped'].items()))
+    return report
@@ -0,0 +1,302 @@
+"""Per-lichen profiling of cut processing
+
+When enabled, every Lichen.process call is measured: cut sets, each lichen
+they apply and nested cut sets, with their wall and CPU time, rows in and out,
+pass fraction, bytes of columns added and (optionally) peak additional memory.
+So are the evaluations of lichens on arrays, by Lichen.evaluate,
+ManyLichen.evaluate_cuts (and so cutflow, n_minus_one and overlap),
+ManyLichen.cut_results and evaluate_lichens.
+
+Peak memory is traced for the whole process, so it is not given (None) for
+calls made while lichens run in other threads, e.g. with ManyLichen.n_threads.
+
+    from lax import profiling
+    with profiling.profile() as profiler:
+        sciencerun1.LowEnergyBackground().process(df)
+    print(profiler.summary())
+    profiler.to_json('profile.json')
+
+Functions added with Profiler.add_hook are called with each record (a dict
+with the fields of RECORD_FIELDS) as soon as its call is complete.
+"""
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+RECORD_FIELDS = ('lichen', 'parent', 'depth', 'thread', 'wall_time', 'own_time', 'cpu_time',
+                 'rows_in', 'rows_out', 'passed', 'pass_fraction', 'bytes_added',
+                 'peak_memory')
+
+_active = None
+
+if hasattr(time, 'thread_time'):
+    _cpu_time = time.thread_time
+else:  # pragma: no cover
+    _cpu_time = time.process_time
+
+
+class _Call(object):
+    """A lichen call being measured"""
+
+    def __init__(self, lichen, rows_in, columns, parent, depth):
+        self.record = {'lichen': lichen.name(),
+                       'parent': parent,
+                       'depth': depth,
+                       'thread': threading.current_thread().name,
+                       'rows_in': rows_in}
+        self.lichen = lichen
+        self.cut_name = lichen.name()
+        self.columns = set(columns)
+        self.children_time = 0.
+        self.memory_start = self.memory_peak = 0
+        self.concurrent = False     # Other threads ran lichens during the call
+
+
+class Profiler(object):
+    """Collects one record per lichen call
+
+    Times include those of nested calls; own_time excludes them. The parent
+    of a call is the cut set that made it in the same thread (lichens run by
+    ManyLichen.n_threads have none).
+
+    :param memory: Trace allocations (tracemalloc) for the peak additional
+                   memory of each call. This slows processing down, and
+                   needs Python 3.9 or later. Calls overlapping with calls in
+                   other threads get no peak memory.
+    """
+
+    def __init__(self, memory=False):
+        self._tracemalloc = None
+        if memory:
+            import tracemalloc
+            if not hasattr(tracemalloc, 'reset_peak'):
+                raise ValueError('Measuring memory needs Python 3.9 or later')
+            self._tracemalloc = tracemalloc
+        self.memory = memory
+        self.records = []
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stacks = {}   # Thread id -> stack of calls, of threads with calls open
+        self._tracing = False
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return 'Profiler(%d records)' % len(self)
+
+    def add_hook(self, function):
+        """Call function(record) for every completed call"""
+        self.hooks.append(function)
+
+    def remove_hook(self, function):
+        self.hooks.remove(function)
+
+    def start(self):
+        if self.memory and not self._tracemalloc.is_tracing():
+            self._tracemalloc.start()
+            self._tracing = True
+
+    def stop(self):
+        if self._tracing:
+            self._tracemalloc.stop()
+            self._tracing = False
+
+    def measure(self, lichen, df, function):
+        """Return function(df), recording it as a call of lichen"""
+        stack = getattr(self._local, 'stack', None)
+        if stack and stack[-1].lichen is lichen:
+            # Lichens without _evaluate of their own are evaluated on a
+            # DataFrame; that call is measured already
+            return function(df)
+        call, result = self._call(lichen, len(df), df.columns, function, df)
+        record = call.record
+        record['rows_out'] = len(result)
+        if call.cut_name in result.columns:
+            passed = int(np.count_nonzero(result[call.cut_name].values))
+        else:
+            passed = None
+        record['bytes_added'] = int(sum(result[column].values.nbytes
+                                        for column in result.columns
+                                        if column not in call.columns))
+        self._complete(call, passed)
+        return result
+
+    def measure_evaluate(self, lichen, columns, function):
+        """Return function(columns), recording it as a call of lichen
+
+        :param columns: derived.Columns the lichen is evaluated on
+        :param function: Function of columns returning the boolean array of the cut
+        """
+        call, passed = self._call(lichen, len(columns), columns.added, function, columns)
+        call.record['rows_out'] = len(passed)
+        call.record['bytes_added'] = int(passed.nbytes + sum(
+            values.nbytes for column, values in columns.added.items()
+            if column not in call.columns and column != call.cut_name))
+        self._complete(call, int(np.count_nonzero(passed)))
+        return passed
+
+    def _call(self, lichen, rows_in, columns, function, data):
+        """Time function(data) as a call of lichen, return the call and the result"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        call = _Call(lichen, rows_in, columns,
+                     parent=stack[-1].cut_name if stack else None, depth=len(stack))
+        self._enter(stack, call)
+        wall, cpu = time.time(), _cpu_time()
+        try:
+            result = function(data)
+        finally:
+            stack.pop()
+            wall, cpu = time.time() - wall, _cpu_time() - cpu
+            peak_memory = self._exit(stack, call)
+        if stack:
+            stack[-1].children_time += wall
+
+        record = call.record
+        record['wall_time'] = wall
+        record['own_time'] = wall - call.children_time
+        record['cpu_time'] = cpu
+        record['peak_memory'] = peak_memory
+        return call, result
+
+    def _enter(self, stack, call):
+        with self._lock:
+            self._stacks[threading.get_ident()] = stack
+            if len(self._stacks) > 1:
+                # Memory of all open calls is shared with another thread
+                call.concurrent = True
+                for calls in self._stacks.values():
+                    for each in calls:
+                        each.concurrent = True
+            if self.memory:
+                self._memory_enter(stack, call)
+            stack.append(call)
+
+    def _exit(self, stack, call):
+        """Return the peak memory of call, None if it is not known"""
+        with self._lock:
+            if not stack:
+                del self._stacks[threading.get_ident()]
+            if not self.memory:
+                return None
+            peak_memory = self._memory_exit(stack, call)
+        return None if call.concurrent else peak_memory
+
+    def _complete(self, call, passed):
+        record = call.record
+        record['passed'] = passed
+        if passed is None:
+            record['pass_fraction'] = None
+        else:
+            rows = record['rows_out']
+            record['pass_fraction'] = passed / float(rows) if rows else np.nan
+        with self._lock:
+            self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def _memory_enter(self, stack, call):
+        # tracemalloc has one peak: fold it into the enclosing call, then reset it
+        current, peak = self._tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+        self._tracemalloc.reset_peak()
+        call.memory_start = call.memory_peak = current
+
+    def _memory_exit(self, stack, call):
+        call.memory_peak = max(call.memory_peak, self._tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1].memory_peak = max(stack[-1].memory_peak, call.memory_peak)
+        self._tracemalloc.reset_peak()
+        return call.memory_peak - call.memory_start
+
+    def report(self):
+        """Return a DataFrame with one row per call, in order of completion"""
+        with self._lock:
+            records = list(self.records)
+        return pd.DataFrame(records, columns=list(RECORD_FIELDS))
+
+    def summary(self):
+        """Return a DataFrame with totals per lichen, the most expensive first
+
+        :return: DataFrame indexed by cut name with the number of calls, total
+                 wall, own and CPU time, rows in, events passed, bytes added
+                 and the largest peak memory
+        """
+        report = self.report()
+        result = report.groupby('lichen').agg(
+            calls=('wall_time', 'size'), wall_time=('wall_time', 'sum'),
+            own_time=('own_time', 'sum'), cpu_time=('cpu_time', 'sum'),
+            rows_in=('rows_in', 'sum'), passed=('passed', 'sum'),
+            bytes_added=('bytes_added', 'sum'), peak_memory=('peak_memory', 'max'))
+        return result.sort_values('own_time', ascending=False)
+
+    def to_json(self, filename=None):
+        """Return the records as JSON, or write them to filename"""
+        with self._lock:
+            records = [dict((key, _plain(value)) for key, value in record.items())
+                       for record in self.records]
+        if filename is None:
+            return json.dumps(records, indent=2, sort_keys=True)
+        with open(filename, 'w') as f:
+            json.dump(records, f, indent=2, sort_keys=True)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+def _plain(value):
+    """Python value for JSON, NaN becomes None"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def enable(memory=False):
+    """Profile lichen calls from now on, return the Profiler"""
+    global _active
+    disable()
+    _active = Profiler(memory)
+    _active.start()
+    return _active
+
+
+def disable():
+    """Stop profiling, return the Profiler that was active (or None)"""
+    global _active
+    profiler, _active = _active, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def get_profiler():
+    """Return the active Profiler, or None if profiling is disabled"""
+    return _active
+
+
+@contextmanager
+def profile(memory=False):
+    """Profile the lichen calls of a block, yielding the Profiler"""
+    global _active
+    previous = _active
+    profiler = Profiler(memory)
+    profiler.start()
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+        profiler.stop()
@@ -0,0 +1,207 @@
+"""Models and other files used by lichens, loaded once per process
+
+A file is loaded on first use and kept until it is evicted, so every lichen
+(and every cut set, run and thread) using it shares one copy. Worker
+processes forked after preloading inherit that copy: its pages are shared
+copy-on-write with the parent instead of being loaded again in each worker.
+
+Tables given by file name only are looked up in the directories of
+search_path: those of the LAX_DATA_PATH environment variable (separated
+like PATH), then the lax data directory.
+
+    from lax import resources
+    model = resources.load_pickle(os.path.join(DATA_DIR, 'model.pkl'))
+
+    table = resources.load_table('cut_values.txt')    # Found on search_path
+
+    resources.preload(cuts)        # Before creating a multiprocessing pool
+    resources.evict(filename)      # Load filename again on next use
+    resources.clear()              # Evict everything
+"""
+# -*- coding: utf-8 -*-
+
+import functools
+import gc
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Directories in which find looks for relative file names, in order
+search_path = [d for d in os.environ.get('LAX_DATA_PATH', '').split(os.pathsep) if d] + [DATA_DIR]
+
+_loaded = OrderedDict()      # (path, loader name) -> object
+_mtimes = {}                 # path -> modification time of the file when loaded
+_recorders = []              # {path: modification time} of each active record_use
+_lock = threading.RLock()
+
+
+def _reset_lock():
+    # A lock held by another thread while forking stays locked in the child
+    global _lock
+    _lock = threading.RLock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+def _unpickle(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def load(filename, loader):
+    """Return loader(filename), calling loader only the first time
+
+    :param filename: Path of the file; equal absolute paths share one object
+    :param loader: Function of the filename returning the loaded object
+    """
+    path = os.path.abspath(filename)
+    key = (path, getattr(loader, '__name__', repr(loader)))
+    with _lock:
+        if key not in _loaded:
+            if path not in _mtimes:
+                _mtimes[path] = _mtime(path)
+            _loaded[key] = loader(filename)
+        for used in _recorders:
+            used[path] = _mtimes[path]
+        return _loaded[key]
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def state(filename):
+    """Return the modification time of the file loaded from filename, or of
+    the file itself if nothing is loaded from it (None if it does not exist)
+
+    Lichens using filename give the same results as long as this is the same.
+    """
+    path = os.path.abspath(filename)
+    with _lock:
+        if path in _mtimes:
+            return _mtimes[path]
+    return _mtime(path)
+
+
+@contextmanager
+def record_use():
+    """Collect the files used meanwhile, as {path: state(path)}
+
+    Uses from all threads are collected, e.g. by the lichens of a cut set
+    running on a thread pool.
+    """
+    used = {}
+    with _lock:
+        _recorders.append(used)
+    try:
+        yield used
+    finally:
+        with _lock:
+            _recorders[:] = [x for x in _recorders if x is not used]
+
+
+def load_pickle(filename):
+    """Return the unpickled contents of filename, unpickling it only the first time"""
+    return load(filename, _unpickle)
+
+
+def find(filename):
+    """Return the path of filename: filename itself if absolute, else the first
+    match in the directories of search_path
+
+    :raises IOError: if there is no such file
+    """
+    if os.path.isabs(filename):
+        if not os.path.exists(filename):
+            raise IOError('No file %s' % filename)
+        return filename
+    for directory in search_path:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    raise IOError('No file %s in %s (set LAX_DATA_PATH or extend lax.resources.search_path)' % (
+        filename, os.pathsep.join(search_path)))
+
+
+def _read_table(filename, binary=False, **kwargs):
+    if binary:
+        npy_filename = os.path.splitext(filename)[0] + '.npy'
+        if not os.path.exists(npy_filename) or \
+                os.path.getmtime(npy_filename) < os.path.getmtime(filename):
+            table = np.loadtxt(filename, **kwargs)
+            try:
+                # Other processes may read npy_filename meanwhile
+                temporary = '%s.%d.tmp.npy' % (npy_filename[:-len('.npy')], os.getpid())
+                np.save(temporary, table)
+                os.rename(temporary, npy_filename)
+            except (IOError, OSError):
+                table.flags.writeable = False
+                return table
+        return np.load(npy_filename, mmap_mode='r')
+    table = np.loadtxt(filename, **kwargs)
+    # Shared by all users of the file
+    table.flags.writeable = False
+    return table
+
+
+def load_table(filename, binary=False, **kwargs):
+    """Return the read-only array of the text table filename, parsing it only the first time
+
+    :param filename: Path or name of the file on search_path (see find)
+    :param binary: Memory-map a .npy copy of the table, written next to the
+                   text file when missing or older than it (the text is used
+                   if the copy cannot be written)
+    :param kwargs: Options of np.loadtxt, e.g. skiprows=1
+    """
+    return load(find(filename), functools.partial(_read_table, binary=binary, **kwargs))
+
+
+def loaded():
+    """Return the absolute paths of the files currently loaded"""
+    with _lock:
+        return [path for path, _ in _loaded]
+
+
+def evict(filename):
+    """Forget the objects loaded from filename, so it is loaded again on next use
+
+    :return: Number of objects forgotten
+    """
+    path = os.path.abspath(filename)
+    with _lock:
+        keys = [key for key in _loaded if key[0] == path]
+        for key in keys:
+            del _loaded[key]
+        _mtimes.pop(path, None)
+    return len(keys)
+
+
+def clear():
+    """Forget all loaded objects"""
+    with _lock:
+        _loaded.clear()
+        _mtimes.clear()
+
+
+def preload(lichen, freeze=True):
+    """Load the resources of lichen (and its lichens) now, e.g. before forking workers
+
+    :param lichen: Lichen or cut set; see Lichen.load_resources
+    :param freeze: Move all objects to the permanent generation of the garbage
+                   collector (gc.freeze, Python 3.7+), so collections in the
+                   workers do not write to, and thus copy, the shared pages
+    """
+    lichen.load_resources()
+    if freeze and hasattr(gc, 'freeze'):
+        gc.freeze()
@@ -0,0 +1,258 @@
+"""Packed storage of per-event cut outcomes
+
+A cut set with many lichens normally leaves one bool column per lichen in the
+DataFrame. CutResults instead keeps the outcome of every cut as one bit of an
+unsigned 64-bit word per event (a new word is started every 64 cuts), with a
+name-to-bit index. Columns are only materialized on request.
+
+Cutflow and N-1 tables are counted from the bits, in one pass per cut:
+
+    results = CutResults.from_frame(cuts.evaluate_cuts(df), cuts.get_cut_names())
+    results.cutflow()                       # Survivors after each cut
+    results.n_minus_one(df['run_number'])   # Survivors of all cuts but one, per run
+    results.overlap()                       # Events failing both of each pair of cuts
+"""
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BITS_PER_WORD = 64
+
+
+class CutResults(object):
+    """Outcome of a set of cuts, one bit per cut per event
+
+    :param n_events: Number of events
+    :param name: Name of the combined cut (e.g. 'CutAllEnergy')
+    :param index: Index to use when exporting to a DataFrame
+    """
+
+    def __init__(self, n_events, name=None, index=None):
+        self.n_events = n_events
+        self.name = name
+        self.index = index
+        self.bits = OrderedDict()    # Cut name -> bit number
+        self.words = np.zeros((n_events, 0), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __contains__(self, name):
+        return name in self.bits
+
+    def __repr__(self):
+        return 'CutResults(%s: %d cuts, %d events)' % (self.name, len(self), self.n_events)
+
+    @property
+    def names(self):
+        return list(self.bits.keys())
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def _locate(self, name):
+        try:
+            bit = self.bits[name]
+        except KeyError:
+            raise KeyError('No cut named %s in %s' % (name, self))
+        return bit // BITS_PER_WORD, np.uint64(bit % BITS_PER_WORD)
+
+    def add(self, name, passed):
+        """Store the outcome of a cut
+
+        :param name: Name of the cut (e.g. 'CutS2Width')
+        :param passed: Boolean array, True for events passing the cut
+        """
+        passed = np.asarray(passed, dtype=bool)
+        if len(passed) != self.n_events:
+            raise ValueError('Expected %d outcomes for %s, got %d' % (self.n_events, name, len(passed)))
+        if name not in self.bits:
+            bit = len(self.bits)
+            if bit % BITS_PER_WORD == 0:
+                self.words = np.hstack([self.words,
+                                        np.zeros((self.n_events, 1), dtype=np.uint64)])
+            self.bits[name] = bit
+        word, bit = self._locate(name)
+        column = self.words[:, word]
+        column &= ~(np.uint64(1) << bit)
+        column |= passed.astype(np.uint64) << bit
+
+    def get(self, name):
+        """Return a boolean array, True for events passing cut name"""
+        word, bit = self._locate(name)
+        return ((self.words[:, word] >> bit) & np.uint64(1)).astype(bool)
+
+    __getitem__ = get
+
+    def masks(self, names=None):
+        """Return {word number: bit mask} covering the given cuts (default all)"""
+        if names is None:
+            names = self.names
+        masks = {}
+        for name in names:
+            word, bit = self._locate(name)
+            masks[word] = masks.get(word, np.uint64(0)) | (np.uint64(1) << bit)
+        return masks
+
+    def passed(self, names=None):
+        """Return a boolean array, True for events passing all cuts in names (default all)"""
+        result = np.ones(self.n_events, dtype=bool)
+        for word, mask in self.masks(names).items():
+            result &= (self.words[:, word] & mask) == mask
+        return result
+
+    def failures(self, names=None):
+        """Return the number of cuts in names (default all) each event fails"""
+        result = np.zeros(self.n_events, dtype=np.int64)
+        for word, mask in self.masks(names).items():
+            result += _popcount(~self.words[:, word] & mask).astype(np.int64)
+        return result
+
+    def first_failed(self, names=None):
+        """Return the position in names (default all) of the first cut each event fails
+
+        Events passing every cut get len(names).
+        """
+        names = self.names if names is None else list(names)
+        for name in names:
+            self._locate(name)
+        bits = [self.bits[name] for name in names]
+        if bits != sorted(bits):
+            # The lowest failing bit must be the first failing cut: repack in order
+            results = CutResults(self.n_events)
+            for name in names:
+                results.add(name, self.get(name))
+            return results.first_failed(names)
+        lookup = np.full(bits[-1] + 1 if bits else 0, len(names), dtype=np.int64)
+        lookup[bits] = np.arange(len(names))
+        first = np.full(self.n_events, len(names), dtype=np.int64)
+        # Events failing cuts in several words keep those of the lowest word
+        for word, mask in sorted(self.masks(names).items(), reverse=True):
+            failed = ~self.words[:, word] & mask
+            failing = np.flatnonzero(failed)
+            failed = failed[failing]
+            lowest = failed & (~failed + np.uint64(1))
+            # Powers of two convert to float64 exactly
+            first[failing] = lookup[word * BITS_PER_WORD + np.log2(lowest).astype(np.int64)]
+        return first
+
+    def cutflow(self, names=None, groups=None):
+        """Count the events passing each cut and all cuts before it
+
+        :param names: Cuts in order of application (default all)
+        :param groups: Array with the group (e.g. run number) of each event,
+                       or a pandas Categorical (e.g. of pd.cut, for bins)
+        :return: DataFrame indexed by 'Total' and the cut names, with one column
+                 per group ('events' without groups)
+        """
+        names = self.names if names is None else list(names)
+        codes, labels = _group_codes(groups, self.n_events)
+        counts = _tally(self.first_failed(names), len(names) + 1, codes, len(labels))
+        # Column i: events failing no cut before position i
+        survivors = counts[:, ::-1].cumsum(axis=1)[:, ::-1]
+        return pd.DataFrame(survivors.T, index=['Total'] + names, columns=labels)
+
+    def n_minus_one(self, names=None, groups=None):
+        """Count the events passing all cuts except one
+
+        :param names: Cuts to consider (default all)
+        :param groups: See cutflow
+        :return: DataFrame indexed by the cut left out and 'All' (events passing
+                 every cut), with one column per group ('events' without groups)
+        """
+        names = self.names if names is None else list(names)
+        codes, labels = _group_codes(groups, self.n_events)
+        selected = self.failures(names) <= 1
+        counts = _tally(self.first_failed(names)[selected], len(names) + 1,
+                        None if codes is None else codes[selected], len(labels))
+        passed_all = counts[:, -1:]
+        return pd.DataFrame(np.hstack([counts[:, :-1] + passed_all, passed_all]).T,
+                            index=names + ['All'], columns=labels)
+
+    def failed_bits(self, name):
+        """Return the events failing cut name as a bitmap, 64 events per uint64"""
+        packed = np.packbits(~self.get(name))
+        padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+        padded[:len(packed)] = packed
+        return padded.view(np.uint64)
+
+    def overlap(self, names=None):
+        """Count the events failing both cuts of each pair of cuts
+
+        The outcomes are transposed once into a bitmap per cut, so each pair
+        takes an AND and a popcount of 64 events at a time. Matrices of
+        different chunks or runs add up.
+
+        :param names: Cuts to consider (default all)
+        :return: DataFrame with cut names as index and columns; the diagonal
+                 holds the number of events failing each cut
+        """
+        names = self.names if names is None else list(names)
+        bitmaps = [self.failed_bits(name) for name in names]
+        counts = np.zeros((len(names), len(names)), dtype=np.int64)
+        for i, bitmap in enumerate(bitmaps):
+            for j in range(i, len(names)):
+                counts[i, j] = counts[j, i] = _popcount(bitmap & bitmaps[j]).sum()
+        return pd.DataFrame(counts, index=names, columns=names)
+
+    def to_frame(self, names=None, combined=True):
+        """Export to a DataFrame of boolean columns
+
+        :param names: Cuts to export (default all)
+        :param combined: Also export the combined cut (named after this set)
+        :return: DataFrame with one column per cut
+        """
+        if names is None:
+            names = self.names
+        columns = OrderedDict((name, self.get(name)) for name in names)
+        if combined and self.name is not None:
+            columns[self.name] = self.passed()
+        return pd.DataFrame(columns, index=self.index)
+
+    @classmethod
+    def from_frame(cls, df, names, name=None):
+        """Pack boolean columns of a DataFrame"""
+        results = cls(len(df), name=name, index=df.index)
+        for cut_name in names:
+            results.add(cut_name, df[cut_name].values)
+        return results
+
+
+def _popcount(words):
+    """Return the number of set bits of each element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    # Sum bits in pairs, nibbles, then bytes, and add the bytes up with a multiplication
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = ((words & np.uint64(0x3333333333333333)) +
+             ((words >> np.uint64(2)) & np.uint64(0x3333333333333333)))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def _group_codes(groups, n_events):
+    """Return integer codes (-1 for no group) and labels of groups, or (None, ['events'])"""
+    if groups is None:
+        return None, ['events']
+    if len(groups) != n_events:
+        raise ValueError('Expected %d groups, got %d' % (n_events, len(groups)))
+    if isinstance(groups, pd.Categorical):
+        return np.asarray(groups.codes), list(groups.categories)
+    codes, labels = pd.factorize(np.asarray(groups), sort=True)
+    return codes, list(labels)
+
+
+def _tally(values, n_values, codes, n_groups):
+    """Return an array (group, value) of the number of events with each value
+
+    Events without a group (code -1) are not counted.
+    """
+    if codes is None:
+        return np.bincount(values, minlength=n_values)[np.newaxis, :]
+    grouped = codes >= 0
+    keys = codes[grouped] * n_values + values[grouped]
+    return np.bincount(keys, minlength=n_groups * n_values).reshape(n_groups, n_values)
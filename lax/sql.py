@@ -0,0 +1,362 @@
+"""Apply cut sets with SQL, in an embedded DuckDB
+
+The StringLichen and RangeLichen cuts of a cut set are compiled into one
+SELECT, with one boolean column per cut, which DuckDB runs vectorised and in
+parallel, e.g. directly on Parquet exports of the minitrees:
+
+    from lax import sql
+    cuts = sql.query(sciencerun1.LowEnergyBackground(),
+                     "read_parquet('sr1_background/*.parquet')",
+                     columns=['run_number', 'event_number'], passed_only=True)
+
+Lichens that cannot be translated are evaluated afterwards, with
+Lichen._evaluate, on the (reduced) result of the query.
+
+Cut strings keep their numpy meaning: comparisons with NaN are False,
+functions and divisions by zero give NaN or infinities where DuckDB would
+raise an error or give NULL (which would fail the cut), and nulls in float
+columns are read as NaN. duckdb is only needed when this module is used.
+"""
+# -*- coding: utf-8 -*-
+
+import ast
+from collections import OrderedDict
+
+import numpy as np
+
+from lax.expression import LOCAL_PREFIX, constant_value, is_constant
+from lax.lichen import (ManyLichen, RangeLichen, StringLichen, columns_read,
+                        evaluate_lichens, is_declarative)
+
+NAN = "'nan'::DOUBLE"
+INF = "'inf'::DOUBLE"
+
+# Name under which data that is not a SQL relation is registered
+SOURCE_VIEW = '_lax_source'
+
+# Types of DuckDB columns that can hold NaN
+FLOAT_TYPES = ('DOUBLE', 'FLOAT', 'REAL', 'FLOAT4', 'FLOAT8')
+
+# Cut string function: (SQL function, ((condition on {0}, result), ...)),
+# with the results numpy gives where the SQL function raises an error
+FUNCTIONS = {
+    'sin': ('sin', (('isinf({0})', NAN),)),
+    'cos': ('cos', (('isinf({0})', NAN),)),
+    'tan': ('tan', (('isinf({0})', NAN),)),
+    'exp': ('exp', ()),
+    'log': ('ln', (('{0} < 0', NAN), ('{0} = 0', '-' + INF))),
+    'log10': ('log10', (('{0} < 0', NAN), ('{0} = 0', '-' + INF))),
+    'sqrt': ('sqrt', (('{0} < 0', NAN),)),
+    'sinh': ('sinh', ()),
+    'cosh': ('cosh', ()),
+    'tanh': ('tanh', ()),
+    'arcsin': ('asin', (('{0} < -1 OR {0} > 1', NAN),)),
+    'arccos': ('acos', (('{0} < -1 OR {0} > 1', NAN),)),
+    'arctan': ('atan', ()),
+    'arcsinh': ('asinh', ()),
+    'arccosh': ('acosh', ()),
+    'arctanh': ('atanh', (('{0} < -1 OR {0} > 1', NAN),)),
+    'abs': ('abs', ()),
+    'arctan2': ('atan2', ()),
+}
+
+BINARY_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+                    ast.BitAnd: 'AND', ast.BitOr: 'OR'}
+COMPARISONS = {ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+               ast.Eq: '=', ast.NotEq: '<>'}
+
+
+def _duckdb():
+    import duckdb  # pylint: disable=import-error
+    return duckdb
+
+
+def quote(name):
+    """Return name as a SQL identifier"""
+    return '"%s"' % name.replace('"', '""')
+
+
+def literal(value):
+    """Return a python number or boolean as a SQL literal"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, int):
+        return '%d' % value
+    if isinstance(value, float):
+        if value != value:
+            return NAN
+        if value in (float('inf'), -float('inf')):
+            return INF if value > 0 else '-' + INF
+        # Plain decimals would be DECIMAL in DuckDB
+        return 'CAST(%r AS DOUBLE)' % value
+    raise ValueError('Cannot write %r in SQL' % (value,))
+
+
+class _Translator(object):
+    """Translate the normalised tree of an Expression into SQL
+
+    :param columns: {name: SQL expression} of the columns the string can read
+    :param parameters: {name: value} of '@' parameters
+    :param exact: Names of columns that cannot hold NaN (integers, booleans)
+    """
+
+    def __init__(self, columns, parameters=None, exact=()):
+        self.columns = columns
+        self.parameters = parameters or {}
+        self.exact = exact
+
+    def translate(self, node):
+        if isinstance(node, ast.Expression):
+            node = node.body
+        if is_constant(node):
+            return literal(constant_value(node))
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            raise ValueError('Cannot translate %s' % node.__class__.__name__)
+        return method(node)
+
+    def is_nan(self, node, sql):
+        """Return SQL true where sql is NaN, None if it cannot be"""
+        if is_constant(node):
+            value = constant_value(node)
+            return 'TRUE' if value != value else None
+        if isinstance(node, ast.Name) and node.id in self.exact:
+            return None
+        return 'isnan(CAST(%s AS DOUBLE))' % sql
+
+    def visit_Name(self, node):
+        if node.id.startswith(LOCAL_PREFIX):
+            name = node.id[len(LOCAL_PREFIX):]
+            if name not in self.parameters:
+                raise ValueError('No value given for parameter @%s' % name)
+            if not np.isscalar(self.parameters[name]):
+                raise ValueError('Parameter @%s is not a scalar' % name)
+            return literal(self.parameters[name])
+        if node.id not in self.columns:
+            raise ValueError('Column %s is not available' % node.id)
+        return self.columns[node.id]
+
+    def visit_BinOp(self, node):
+        left, right = self.translate(node.left), self.translate(node.right)
+        if isinstance(node.op, ast.Pow):
+            return 'pow(%s, %s)' % (left, right)
+        if type(node.op) not in BINARY_OPERATORS:
+            # SQL % and // round towards zero, numpy towards minus infinity
+            raise ValueError('Cannot translate operator %s' % node.op.__class__.__name__)
+        if isinstance(node.op, ast.Div):
+            return self.divide(node, left, right)
+        return '(%s %s %s)' % (left, BINARY_OPERATORS[type(node.op)], right)
+
+    def divide(self, node, left, right):
+        """Return SQL of left / right, with the NaN or infinity of numpy where right is 0
+
+        DuckDB gives NULL there, unless ieee_floating_point_ops is set (1.1 and later).
+        """
+        if is_constant(node.right) and constant_value(node.right) != 0:
+            return '(%s / %s)' % (left, right)
+        zero = 'WHEN %s = 0 THEN %s' % (left, NAN)
+        nan = self.is_nan(node.left, left)
+        if nan is not None:
+            zero = 'WHEN %s THEN %s %s' % (nan, NAN, zero)
+        # The sign of the infinity is that of left times that of right, -0. included
+        return ('(CASE WHEN %s = 0 THEN CASE %s WHEN (%s > 0) = signbit(CAST(%s AS DOUBLE)) '
+                'THEN -%s ELSE %s END ELSE %s / %s END)' % (right, zero, left, right, INF, INF,
+                                                            left, right))
+
+    def visit_UnaryOp(self, node):
+        operand = self.translate(node.operand)
+        if isinstance(node.op, ast.USub):
+            return '(- %s)' % operand
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        return '(NOT %s)' % operand
+
+    def visit_Compare(self, node):
+        left_node, right_node = node.left, node.comparators[0]
+        left, right = self.translate(left_node), self.translate(right_node)
+        op = type(node.ops[0])
+        result = '(%s %s %s)' % (left, COMPARISONS[op], right)
+        for nan in (self.is_nan(left_node, left), self.is_nan(right_node, right)):
+            if nan is None:
+                continue
+            # As in numpy: NaN is unequal to everything, and not ordered
+            if op is ast.NotEq:
+                result = '(%s OR %s)' % (result, nan)
+            else:
+                result = '(%s AND NOT %s)' % (result, nan)
+        return result
+
+    def visit_Call(self, node):
+        name = node.func.id
+        if name not in FUNCTIONS:
+            # expm1 and log1p have no SQL equivalent of the same precision
+            raise ValueError('Cannot translate function %s' % name)
+        function, guards = FUNCTIONS[name]
+        args = [self.translate(arg) for arg in node.args]
+        result = '%s(%s)' % (function, ', '.join(args))
+        if guards:
+            result = 'CASE %s ELSE %s END' % (
+                ' '.join('WHEN %s THEN %s' % (condition.format(args[0]), value)
+                         for condition, value in guards), result)
+        return result
+
+
+def to_sql(expression, columns, parameters=None, exact=()):
+    """Translate an Expression (see lax.expression) into a SQL expression
+
+    :param columns: {name: SQL expression} of the columns the string can read
+    :param parameters: {name: value} of '@' parameters
+    :param exact: Names of columns that cannot hold NaN
+    :raises ValueError: if the expression cannot be translated
+    """
+    return _Translator(columns, parameters, exact).translate(expression.tree)
+
+
+def lichen_sql(lichen, columns, exact=()):
+    """Return a SQL expression of the cut of lichen, None if it cannot be translated
+
+    :param columns: {name: SQL expression} of the available columns
+    :param exact: Names of columns that cannot hold NaN
+    """
+    if not is_declarative(lichen):
+        return None
+    if isinstance(lichen, StringLichen):
+        try:
+            result = to_sql(lichen.expression(), columns, lichen.get_parameters(), exact)
+        except ValueError:
+            return None
+    elif isinstance(lichen, RangeLichen):
+        if lichen.variable not in columns:
+            return None
+        # Comparisons with NaN are false in numpy
+        result = '(%s > %s AND %s < %s AND NOT isnan(CAST(%s AS DOUBLE)))' % (
+            columns[lichen.variable], literal(lichen.allowed_range[0]),
+            columns[lichen.variable], literal(lichen.allowed_range[1]),
+            columns[lichen.variable])
+    else:
+        scope = dict(columns)
+        exact = set(exact)
+        for each in lichen.get_evaluation_list():
+            cut = lichen_sql(each, scope, exact)
+            if cut is None:
+                return None
+            scope[each.name()] = cut
+            exact.add(each.name())
+        result = '(%s)' % (' AND '.join(scope[name] for name in lichen.get_cut_names())
+                           or 'TRUE')
+    return 'COALESCE(%s, FALSE)' % result
+
+
+def translate(lichen, schema):
+    """Split a lichen or cut set into SQL expressions and lichens to apply afterwards
+
+    :param lichen: Lichen, usually a ManyLichen
+    :param schema: {column name: DuckDB type name} of the data
+    :return: OrderedDict {cut name: SQL expression} of the translated
+             lichens, and the list of the other lichens, in evaluation order
+    """
+    columns = {}
+    exact = set()
+    for name, column_type in schema.items():
+        if column_type.upper() in FLOAT_TYPES:
+            columns[name] = 'COALESCE(%s, %s)' % (quote(name), NAN)
+        else:
+            columns[name] = quote(name)
+            exact.add(name)
+
+    if not isinstance(lichen, ManyLichen):
+        lichens = [lichen]
+    elif is_declarative(lichen):
+        lichens = lichen.get_evaluation_list()
+    else:
+        # Helper columns of the set are made by the set itself
+        return OrderedDict(), [lichen]
+
+    expressions = OrderedDict()
+    fallback = []
+    for each in lichens:
+        expression = lichen_sql(each, columns, exact)
+        if expression is None:
+            fallback.append(each)
+        else:
+            expressions[each.name()] = columns[each.name()] = expression
+            exact.add(each.name())
+    return expressions, fallback
+
+
+def select(lichen, source, schema, columns=(), passed_only=False):
+    """Return the SELECT of the translated cuts, their names, and the lichens to apply to its result
+
+    The query returns columns, the columns the other lichens read, and the
+    translated cut columns.
+
+    :param source: SQL relation of the events, e.g. "read_parquet('sr1/*.parquet')"
+    :param schema: {column name: DuckDB type name} of source
+    :param columns: Columns of source to return as well, e.g. event numbers
+    :param passed_only: Only return events passing all translated cuts
+    """
+    expressions, fallback = translate(lichen, schema)
+    names = list(columns)
+    names += [column for column in columns_read(fallback)
+              if column in schema and column not in names]
+    terms = [quote(name) for name in names]
+    terms += ['%s AS %s' % (expression, quote(name)) for name, expression in expressions.items()]
+    query = 'SELECT %s FROM %s' % (', '.join(terms) or 'TRUE', source)
+    if passed_only and expressions:
+        query += ' WHERE %s' % ' AND '.join(expressions.values())
+    return query, list(expressions), fallback
+
+
+def query(lichen, source, connection=None, columns=(), passed_only=False):
+    """Evaluate lichen with DuckDB, return a DataFrame of its cut columns
+
+    The cut columns are those of ManyLichen.evaluate_cuts: one per lichen of
+    the set and the combined cut.
+
+    :param lichen: Lichen, usually a ManyLichen
+    :param source: SQL relation of the events (a table name, or e.g.
+                   "read_parquet('sr1/*.parquet')"), or a DataFrame or
+                   Arrow table to query
+    :param connection: DuckDB connection, by default a new in-memory database
+    :param columns: Columns of source to return as well, e.g. event numbers
+    :param passed_only: Only return events passing the cut. Translated cuts
+                        are then applied in the query itself.
+    :return: DataFrame of columns and the cut columns
+    """
+    if connection is None:
+        connection = _duckdb().connect()
+    if not isinstance(source, str):
+        connection.register(SOURCE_VIEW, source)
+        source = SOURCE_VIEW
+
+    schema = OrderedDict((row[0], row[1]) for row in
+                         connection.execute('DESCRIBE SELECT * FROM %s' % source).fetchall())
+    lichen.check_columns(list(schema))
+    missing = [column for column in columns if column not in schema]
+    if missing:
+        raise KeyError('Columns not in %s: %s' % (source, ', '.join(missing)))
+
+    sql, translated, fallback = select(lichen, source, schema, columns, passed_only)
+    df = connection.execute(sql).df()
+
+    cuts = OrderedDict((name, df[name].values.astype(bool)) for name in translated)
+    if fallback:
+        cuts.update(evaluate_lichens(fallback, df))
+
+    if isinstance(lichen, ManyLichen):
+        passed = np.ones(len(df), dtype=bool)
+        for name in lichen.get_cut_names():
+            passed &= cuts[name]
+        cuts[lichen.name()] = passed
+        cut_names = lichen.get_cut_names() + [lichen.name()]
+    else:
+        cut_names = [lichen.name()]
+
+    result = df[list(columns)].copy()
+    for name in cut_names:
+        result[name] = cuts[name]
+    if passed_only:
+        result = result[result[lichen.name()].values].reset_index(drop=True)
+    return result
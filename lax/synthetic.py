@@ -0,0 +1,185 @@
+"""Synthetic minitree events, for tests and benchmarks
+
+make_events draws a DataFrame with every column the SR0, SR1, post-SR1 and
+SR2 lichens read. The same seed always gives the same events. Distributions
+only roughly follow those of XENON1T minitrees (areas spanning decades,
+positions in the TPC, times in ns, a few percent of the events near
+vetoes), so that every cut passes some events and rejects others. They are
+not meant for physics.
+
+    from lax import synthetic
+    df = synthetic.make_events(10 ** 6, seed=1)
+    for chunk in synthetic.iter_events(10 ** 8, chunksize=10 ** 6):
+        ...
+"""
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+# Columns read by the lichens of lax.lichens
+COLUMNS = (
+    'run_number', 'event_number', 'event_time', 'event_duration',
+    's1', 'cs1', 's2', 'cs2', 'cs2_top', 'cs2_bottom', 'cs2_aft',
+    's2_lifetime_correction', 's2_no_ap_pmts', 'cs2_aft_no_ap_pmts',
+    'cs1_nn_tf', 'cs2_bottom_nn_tf',
+    'x', 'y', 'z', 'x_3d_nn', 'y_3d_nn', 'z_3d_nn', 'r_3d_nn',
+    'x_3d_nn_tf', 'y_3d_nn_tf', 'z_3d_nn_tf', 'r_3d_nn_tf',
+    'x_observed_nn', 'y_observed_nn', 'x_observed_nn_tf', 'y_observed_nn_tf',
+    'x_observed_tpf', 'y_observed_tpf', 'drift_time', 'alt_s1_interaction_drift_time',
+    's1_area_fraction_top', 's1_area_fraction_top_probability_hax',
+    's1_area_lower_injection_fraction', 's1_area_upper_injection_fraction',
+    's1_largest_hit_area', 's1_pattern_fit_hax', 's1_pattern_fit_bottom_hax',
+    's1_range_90p_area', 's1_rise_time', 's1_tight_coincidence', 'alt_s1_tight_coincidence',
+    's2_area_fraction_top', 's2_range_50p_area', 's2_pattern_fit',
+    's2_pattern_fit_top_reduced_ap', 's2_over_tdiff',
+    'largest_other_s1', 'largest_other_s2', 'largest_other_s2_delay_main_s1',
+    'largest_other_s2_pattern_fit', 'largest_s2_before_main_s2_area', 'area_before_main_s2',
+    'nearest_busy', 'nearest_hev', 'previous_busy_on', 'previous_busy_off',
+    'nearest_muon_veto_trigger', 'nearest_flash', 'flashing_width', 'inside_flash',
+)
+
+FIRST_RUN = 6386                 # First SR1 background run
+RUN_START = 1486650000 * 10 ** 9  # Start of FIRST_RUN (ns since the epoch)
+RUN_DURATION = 3600 * 10 ** 9     # ns
+EVENTS_PER_RUN = 100000
+
+TPC_RADIUS = 47.9   # cm
+TPC_LENGTH = 96.9   # cm
+DRIFT_VELOCITY = 1.44e-4  # cm / ns
+
+
+def _log_uniform(rng, low, high, n):
+    return 10 ** rng.uniform(np.log10(low), np.log10(high), n)
+
+
+def _generate(rng, n, first_event):
+    """Return {column: array} of n events, starting at event first_event of the dataset"""
+    d = {}
+    event = first_event + np.arange(n)
+    run = event // EVENTS_PER_RUN
+    d['run_number'] = FIRST_RUN + run
+    d['event_number'] = event % EVENTS_PER_RUN
+    d['event_time'] = (RUN_START + run * RUN_DURATION +
+                       (d['event_number'] + rng.uniform(0, 1, n)) *
+                       (RUN_DURATION // EVENTS_PER_RUN)).astype(np.int64)
+    d['event_duration'] = rng.normal(1e6, 1e4, n)
+
+    # Areas (PE)
+    d['s1'] = _log_uniform(rng, 1, 1e4, n)
+    d['cs1'] = d['s1'] * rng.uniform(0.8, 1.3, n)
+    d['s2'] = _log_uniform(rng, 50, 1e6, n)
+    aft = np.clip(rng.normal(0.63, 0.03, n), 0, 1)
+    d['s2_area_fraction_top'] = aft
+    d['s2_lifetime_correction'] = rng.uniform(1, 2, n)
+    cs2 = d['s2'] * rng.uniform(1, 1.2, n) * d['s2_lifetime_correction']
+    d['cs2'] = cs2
+    d['cs2_top'] = cs2 * aft
+    d['cs2_bottom'] = cs2 - d['cs2_top']
+    d['cs2_aft'] = d['cs2_top'] / cs2
+    d['s2_no_ap_pmts'] = d['s2'] * rng.uniform(0.9, 1, n)
+    d['cs2_aft_no_ap_pmts'] = np.clip(aft + rng.normal(0, 0.01, n), 0, 1)
+    d['cs1_nn_tf'] = d['cs1'] * rng.normal(1, 0.01, n)
+    d['cs2_bottom_nn_tf'] = d['cs2_bottom'] * rng.normal(1, 0.01, n)
+
+    # Positions (cm), uniform in the TPC
+    r = TPC_RADIUS * np.sqrt(rng.uniform(0, 1, n))
+    phi = rng.uniform(-np.pi, np.pi, n)
+    z = -TPC_LENGTH * rng.uniform(0, 1, n)
+    for suffix, smear in (('', 0.5), ('_3d_nn', 0.3), ('_3d_nn_tf', 0.2),
+                          ('_observed_nn', 0.5), ('_observed_nn_tf', 0.4),
+                          ('_observed_tpf', 0.6)):
+        d['x' + suffix] = r * np.cos(phi) + rng.normal(0, smear, n)
+        d['y' + suffix] = r * np.sin(phi) + rng.normal(0, smear, n)
+        if suffix in ('', '_3d_nn', '_3d_nn_tf'):
+            d['z' + suffix] = z + rng.normal(0, smear, n)
+    d['r_3d_nn'] = np.hypot(d['x_3d_nn'], d['y_3d_nn'])
+    d['r_3d_nn_tf'] = np.hypot(d['x_3d_nn_tf'], d['y_3d_nn_tf'])
+    d['drift_time'] = -z / DRIFT_VELOCITY
+    d['alt_s1_interaction_drift_time'] = d['drift_time'] + _log_uniform(rng, 1e2, 1e6, n)
+
+    # S1 properties
+    d['s1_area_fraction_top'] = np.clip(rng.normal(0.1 - 0.003 * z, 0.08), 0, 1)
+    d['s1_area_fraction_top_probability_hax'] = rng.uniform(0, 1, n) ** 2
+    d['s1_area_lower_injection_fraction'] = rng.uniform(0, 0.2, n)
+    d['s1_area_upper_injection_fraction'] = rng.uniform(0, 0.2, n)
+    d['s1_largest_hit_area'] = d['s1'] * rng.uniform(0.02, 0.2, n)
+    d['s1_pattern_fit_hax'] = d['s1'] * rng.gamma(2, 1, n)
+    d['s1_pattern_fit_bottom_hax'] = d['s1_pattern_fit_hax'] * rng.uniform(0.3, 0.8, n)
+    d['s1_range_90p_area'] = _log_uniform(rng, 20, 1000, n)
+    d['s1_rise_time'] = rng.gamma(4, 15, n)
+    d['s1_tight_coincidence'] = np.minimum(rng.poisson(1 + d['s1'] / 10.), 248)
+    d['alt_s1_tight_coincidence'] = rng.poisson(1, n)
+
+    # S2 properties
+    d['s2_range_50p_area'] = (np.sqrt(500 ** 2 + 2e-3 * d['drift_time'] * 1e3) *
+                              rng.normal(1, 0.1, n))
+    d['s2_pattern_fit'] = 0.03 * d['s2'] * rng.gamma(4, 0.25, n) + rng.gamma(2, 50, n)
+    d['s2_pattern_fit_top_reduced_ap'] = d['s2_pattern_fit'] * rng.uniform(0.4, 0.6, n)
+    d['s2_over_tdiff'] = _log_uniform(rng, 1e-2, 1e3, n)
+
+    # Other peaks
+    d['largest_other_s1'] = np.where(rng.uniform(0, 1, n) < 0.7, 0,
+                                     d['s1'] * _log_uniform(rng, 1e-3, 2, n))
+    d['largest_other_s2'] = np.where(rng.uniform(0, 1, n) < 0.7, 0,
+                                     d['s2'] * _log_uniform(rng, 1e-4, 1, n))
+    d['largest_other_s2_delay_main_s1'] = np.where(rng.uniform(0, 1, n) < 0.05,
+                                                   rng.uniform(-3000, 0, n),
+                                                   rng.uniform(-1e4, 1e6, n))
+    d['largest_other_s2_pattern_fit'] = d['largest_other_s2'] * rng.gamma(2, 0.05, n)
+    d['largest_s2_before_main_s2_area'] = np.where(rng.uniform(0, 1, n) < 0.8, 0,
+                                                   _log_uniform(rng, 10, 1e4, n))
+    d['area_before_main_s2'] = d['s1'] + _log_uniform(rng, 1, 1e3, n)
+
+    # Vetoes and neighbouring events (ns)
+    sign = np.where(rng.uniform(0, 1, n) < 0.5, -1, 1)
+    d['nearest_busy'] = sign * _log_uniform(rng, 1e5, 1e11, n)
+    d['nearest_hev'] = -sign * _log_uniform(rng, 1e5, 1e11, n)
+    d['previous_busy_on'] = _log_uniform(rng, 1e6, 1e12, n)
+    d['previous_busy_off'] = d['previous_busy_on'] * rng.uniform(0, 1.1, n)
+    d['nearest_muon_veto_trigger'] = rng.uniform(-3e10, 3e10, n)
+    d['nearest_flash'] = sign * _log_uniform(rng, 1e8, 1e12, n)
+    d['flashing_width'] = _log_uniform(rng, 1, 100, n)
+    d['inside_flash'] = rng.uniform(0, 1, n) < 0.01
+    return d
+
+
+def make_events(n, seed=0, columns=None, nan_fraction=0., first_event=0):
+    """Return a DataFrame of n synthetic events
+
+    :param n: Number of events
+    :param seed: Seed of the random generator; equal seeds give equal events
+    :param columns: Columns to return (default: all of COLUMNS). All columns
+                    are drawn anyway, so a subset gives the same values.
+    :param nan_fraction: Fraction of float values replaced by NaN
+    :param first_event: Position of the first event in the dataset (sets
+                        run and event numbers and event times)
+    """
+    n = int(n)
+    columns = list(COLUMNS if columns is None else columns)
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise KeyError('No synthetic values for columns: %s' % ', '.join(unknown))
+    rng = np.random.RandomState(seed)
+    data = _generate(rng, n, int(first_event))
+    if nan_fraction:
+        for column in COLUMNS:
+            if data[column].dtype.kind == 'f':
+                data[column][rng.uniform(0, 1, n) < nan_fraction] = np.nan
+    return pd.DataFrame(dict((column, data[column]) for column in columns),
+                        columns=columns, index=pd.RangeIndex(int(first_event),
+                                                             int(first_event) + n))
+
+
+def iter_events(n, chunksize=10 ** 6, seed=0, columns=None, nan_fraction=0.):
+    """Yield the events of a dataset of n events as DataFrames of chunksize events
+
+    Chunk i is make_events(..., seed=(seed, i)), so any dataset size can be
+    generated with bounded memory, and the chunks do not depend on n.
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be positive, got %s' % chunksize)
+    n, chunksize = int(n), int(chunksize)
+    for i, start in enumerate(range(0, n, chunksize)):
+        yield make_events(min(chunksize, n - start), seed=(seed, i), columns=columns,
+                          nan_fraction=nan_fraction, first_event=start)
@@ -0,0 +1,492 @@
+"""Decision-tree ensembles evaluated with NumPy
+
+Random forests and gradient-boosted trees of scikit-learn are exported once
+into flat arrays (feature, threshold, children and leaf values of all nodes
+of all trees) and saved as .npz files. Evaluating them needs neither
+scikit-learn nor pickle, and all events go down all trees together, one tree
+level per step.
+
+    from lax import trees
+    trees.export('classifier.pkl', 'classifier.npz')   # Once
+    ensemble = trees.load('classifier.npz')
+    probabilities = ensemble.predict_proba(features)
+
+Ensembles of trees with at most 64 leaves (e.g. gradient boosting of depth
+6 or less) are evaluated with leaf bit masks instead (see
+TreeEnsemble._leaf_tables), which is faster than scikit-learn.
+
+Pickles are read with stand-ins for the scikit-learn classes, so models
+pickled by any scikit-learn version can be exported, whichever version (if
+any) is installed.
+"""
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+KINDS = ('forest', 'boosting')
+
+# Trees with at most this many leaves are evaluated with bit masks
+BITS = 64
+ALL_LEAVES = 2 ** BITS - 1
+
+# Multiplying a power of two 2**i by this gives a distinct top 6 bits for each i
+_DE_BRUIJN = np.uint64(0x03f79d71b4cb0a89)
+_DE_BRUIJN_POSITIONS = np.zeros(BITS, dtype=np.intp)
+for _i in range(BITS):
+    _DE_BRUIJN_POSITIONS[((1 << _i) * 0x03f79d71b4cb0a89 & ALL_LEAVES) >> 58] = _i
+
+
+class TreeEnsemble(object):
+    """Trees stored as flat arrays, with leaves pointing to themselves
+
+    :param feature: Feature compared at each node
+    :param threshold: Events with feature <= threshold go to the left child
+    :param left: Left child of each node (the node itself for leaves)
+    :param right: Right child of each node (the node itself for leaves)
+    :param value: Array (node, class) of leaf values
+    :param roots: Root node of each tree
+    :param depth: Largest depth of the trees
+    :param kind: 'forest' (average of the class fractions of the trees) or
+                 'boosting' (sum of the trees' scores, see learning_rate, init)
+    :param learning_rate: Factor of the tree scores, for boosting
+    :param init: Initial score of each class column, for boosting
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, depth,
+                 kind='forest', learning_rate=1., init=None):
+        if kind not in KINDS:
+            raise ValueError('Unknown kind of ensemble %s, expected one of %s' % (kind, KINDS))
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.depth = int(depth)
+        self.kind = kind
+        self.learning_rate = float(learning_rate)
+        self.init = np.zeros(self.value.shape[1]) if init is None else np.asarray(init, dtype=np.float64)
+
+    def __repr__(self):
+        return 'TreeEnsemble(%s: %d trees, %d nodes)' % (self.kind, len(self.roots), len(self.feature))
+
+    def apply(self, X):
+        """Return an array (tree, event) of the leaf node each event ends in
+
+        Events go down all trees together, one level per step. Features are
+        compared in single precision, as scikit-learn does.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        events = np.arange(len(X))
+        nodes = np.repeat(self.roots[:, np.newaxis], len(X), axis=1)
+        for _ in range(self.depth):
+            go_left = X[events, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def decision_function(self, X, chunksize=None):
+        """Return an array (event, class column) of summed leaf values (scores for boosting)"""
+        X = np.asarray(X)
+        result = np.empty((len(X), self.value.shape[1]))
+        tables = self._leaf_tables()
+        if chunksize is None:
+            chunksize = 10000 if tables is None else 256
+        for start in range(0, len(X), chunksize):
+            chunk = X[start:start + chunksize]
+            if tables is None:
+                result[start:start + chunksize] = self.value[self.apply(chunk)].sum(axis=0)
+            else:
+                result[start:start + chunksize] = _score_with_tables(tables, chunk)
+        if self.kind == 'boosting':
+            result = self.init + self.learning_rate * result
+        return result
+
+    def predict_proba(self, X, chunksize=None):
+        """Return an array (event, class) of class probabilities
+
+        Events with a NaN feature get NaN probabilities.
+
+        :param X: Array (event, feature)
+        :param chunksize: Number of events to evaluate at once (default: what
+                          is fastest for the trees)
+        """
+        X = np.asarray(X, dtype=np.float64)
+        scores = self.decision_function(X, chunksize)
+        if self.kind == 'forest':
+            proba = scores / len(self.roots)
+        elif scores.shape[1] == 1:
+            proba = 1 / (1 + np.exp(-scores))
+            proba = np.hstack([1 - proba, proba])
+        else:
+            proba = np.exp(scores - scores.max(axis=1)[:, np.newaxis])
+            proba /= proba.sum(axis=1)[:, np.newaxis]
+        proba[np.isnan(X).any(axis=1)] = np.nan
+        return proba
+
+    def _leaf_tables(self):
+        """Return the tables of _score_with_tables, or None if a tree has over 64 leaves
+
+        Leaves of each tree are numbered from left to right, and a uint64
+        per tree holds the leaves an event can still end in. An event going
+        right at a node can no longer reach the leaves left of it. For each
+        feature, the nodes of all trees are sorted by threshold: an event
+        goes right at exactly the nodes with a threshold below its value,
+        a prefix of that order. Row k of the table of a feature holds, per
+        tree, the leaves left after the first k nodes. An event ends in the
+        lowest leaf left after AND-ing the rows of its feature values.
+        Tables take 8 bytes per tree per node.
+        """
+        if hasattr(self, '_tables'):
+            return self._tables
+        self._tables = None
+        n_trees = len(self.roots)
+        leaf_values = np.zeros((n_trees * BITS, self.value.shape[1]))
+        nodes = [[] for _ in range(self.feature.max() + 1 if len(self.feature) else 0)]
+        for tree, root in enumerate(self.roots):
+            leaves = 0
+            # (node, first leaf of its subtree) in depth-first order, left first
+            stack = [root]
+            first_leaf = {}
+            order = []
+            while stack:
+                node = stack.pop()
+                first_leaf[node] = leaves
+                if self.left[node] == node:
+                    if leaves == BITS:
+                        return None
+                    leaf_values[tree * BITS + leaves] = self.value[node]
+                    leaves += 1
+                else:
+                    order.append(node)
+                    stack += [self.right[node], self.left[node]]
+            for node in order:
+                # Leaves of the left subtree, from its first leaf to that of the right subtree
+                lost = ((1 << (first_leaf[self.right[node]] - first_leaf[node])) - 1) << first_leaf[node]
+                nodes[self.feature[node]].append((_round_down(self.threshold[node]), tree,
+                                                  ~lost & ALL_LEAVES))
+        tables = []
+        for feature_nodes in nodes:
+            feature_nodes.sort(key=lambda x: x[0])
+            thresholds = np.array([x[0] for x in feature_nodes], dtype=np.float32)
+            rows = np.full((len(feature_nodes) + 1, n_trees), ALL_LEAVES, dtype=np.uint64)
+            rows[np.arange(1, len(feature_nodes) + 1), [x[1] for x in feature_nodes]] = \
+                [x[2] for x in feature_nodes]
+            tables.append((thresholds, np.bitwise_and.accumulate(rows, axis=0)))
+        self._tables = tables, leaf_values
+        return self._tables
+
+    def bounds(self, edges):
+        """Return the lowest and highest decision_function of events in each cell of a grid
+
+        A leaf counts for a cell if some value in the cell reaches it, so
+        the bounds hold for every event in the cell, though they need not be
+        attained.
+
+        :param edges: Per feature, increasing float32 edges. Cell i holds the
+                      values above edge i - 1 and up to edge i; the first and
+                      last cells are open-ended.
+        :return: Arrays low and high of shape (cells per feature..., class column)
+        """
+        edges = [np.asarray(e, dtype=np.float32) for e in edges]
+        shape = tuple(len(e) + 1 for e in edges) + (self.value.shape[1],)
+        low, high = np.zeros(shape), np.zeros(shape)
+        for root in self.roots:
+            tree_low, tree_high = np.full(shape, np.inf), np.full(shape, -np.inf)
+            # (node, (first, last) cell reachable per feature)
+            stack = [(root, tuple((0, n - 1) for n in shape[:-1]))]
+            while stack:
+                node, box = stack.pop()
+                if self.left[node] == node:
+                    cells = tuple(slice(first, last + 1) for first, last in box)
+                    np.minimum(tree_low[cells], self.value[node], out=tree_low[cells])
+                    np.maximum(tree_high[cells], self.value[node], out=tree_high[cells])
+                    continue
+                feature = self.feature[node]
+                threshold = _round_down(self.threshold[node])
+                first, last = box[feature]
+                # Left: cells with a lower edge below the threshold, right: an upper edge above it
+                left = min(last, np.searchsorted(edges[feature], threshold, side='left'))
+                right = max(first, np.searchsorted(edges[feature], threshold, side='right'))
+                if first <= left:
+                    stack.append((self.left[node], box[:feature] + ((first, left),) + box[feature + 1:]))
+                if right <= last:
+                    stack.append((self.right[node], box[:feature] + ((right, last),) + box[feature + 1:]))
+            low += tree_low
+            high += tree_high
+        if self.kind == 'boosting':
+            low, high = self.init + self.learning_rate * low, self.init + self.learning_rate * high
+        return low, high
+
+    def proba_bounds(self, edges, column=1):
+        """Return the lowest and highest probability of class column in each cell of a grid
+
+        :param edges: See bounds
+        :return: Arrays low and high of shape (cells per feature...)
+        """
+        low, high = self.bounds(edges)
+        if self.kind == 'forest':
+            return low[..., column] / len(self.roots), high[..., column] / len(self.roots)
+        if low.shape[-1] != 1:
+            raise ValueError('No probability bounds for boosting with %d classes' % low.shape[-1])
+        low, high = 1 / (1 + np.exp(-low[..., 0])), 1 / (1 + np.exp(-high[..., 0]))
+        if column == 0:
+            return 1 - high, 1 - low
+        return low, high
+
+    def fingerprint(self):
+        """Return a hash of the trees"""
+        h = hashlib.sha1()
+        for array in (self.feature, self.threshold, self.left, self.right, self.value,
+                      self.roots, self.init):
+            h.update(np.ascontiguousarray(array).view(np.uint8))
+        h.update(repr((self.depth, self.kind, self.learning_rate)).encode())
+        return h.hexdigest()
+
+    def save(self, filename):
+        np.savez_compressed(filename, feature=self.feature, threshold=self.threshold,
+                            left=self.left, right=self.right, value=self.value,
+                            roots=self.roots, depth=self.depth, kind=self.kind,
+                            learning_rate=self.learning_rate, init=self.init)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as f:
+            return cls(f['feature'], f['threshold'], f['left'], f['right'], f['value'],
+                       f['roots'], f['depth'], str(f['kind']), float(f['learning_rate']),
+                       f['init'])
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Export a scikit-learn classifier, or a stand-in of one read by read_sklearn_pickle
+
+        Supports random forests and extra trees, and gradient boosting with
+        the (binomial or multinomial) deviance loss.
+        """
+        name = type(model).__name__
+        if hasattr(model, 'learning_rate'):
+            loss = getattr(model, 'loss', 'deviance')
+            if loss not in ('deviance', 'log_loss'):
+                raise ValueError('Cannot export %s with loss %s' % (name, loss))
+            stages = np.asarray(model.estimators_)
+            trees = [estimator.tree_ for estimator in stages.ravel()]
+            # Stage-major order: tree i scores class column i % n_columns
+            n_columns = stages.shape[1]
+            kind, learning_rate, init = 'boosting', model.learning_rate, _initial_scores(model, n_columns)
+        elif hasattr(model, 'estimators_'):
+            trees = [estimator.tree_ for estimator in model.estimators_]
+            n_columns = None
+            kind, learning_rate, init = 'forest', 1., None
+        else:
+            raise ValueError('Cannot export %s: not a tree ensemble' % name)
+
+        arrays = [_tree_arrays(tree) for tree in trees]
+        if n_columns is None:
+            n_columns = arrays[0][4].shape[1]
+        offsets = np.cumsum([0] + [len(a[0]) for a in arrays])
+        feature, threshold, left, right, value = [], [], [], [], []
+        for i, (f, t, l, r, v) in enumerate(arrays):
+            nodes = offsets[i] + np.arange(len(f))
+            leaf = l < 0
+            feature.append(np.where(leaf, 0, f))
+            threshold.append(np.where(leaf, np.inf, t))
+            left.append(np.where(leaf, nodes, offsets[i] + l))
+            right.append(np.where(leaf, nodes, offsets[i] + r))
+            if kind == 'forest':
+                # Class fractions of the training events in each leaf
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    v = v / v.sum(axis=1)[:, np.newaxis]
+            else:
+                column = np.zeros((len(v), n_columns))
+                column[:, i % n_columns] = v[:, 0]
+                v = column
+            value.append(v)
+        depth = max(_depth(l, r) for _, _, l, r, _ in arrays)
+        return cls(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                   np.concatenate(right), np.concatenate(value), offsets[:-1], depth,
+                   kind, learning_rate, init)
+
+
+class BoundsGrid(object):
+    """Lowest and highest value of a function of the features in each cell of a grid
+
+    :param edges: Per feature, increasing float32 edges (see TreeEnsemble.bounds)
+    :param low: Array (cells per feature...) of lowest values
+    :param high: Array (cells per feature...) of highest values
+    :param key: Description of what the bounds were computed from
+    """
+
+    def __init__(self, edges, low, high, key=''):
+        self.edges = [np.asarray(e, dtype=np.float32) for e in edges]
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.key = key
+        if self.low.shape != tuple(len(e) + 1 for e in self.edges):
+            raise ValueError('Bounds of shape %s do not fit edges of %s values' % (
+                self.low.shape, [len(e) for e in self.edges]))
+
+    def __repr__(self):
+        return 'BoundsGrid(%s cells)' % 'x'.join(str(n) for n in self.low.shape)
+
+    def lookup(self, X):
+        """Return arrays low and high of the bounds for each event (row of X)
+
+        Events with a NaN feature get -inf and inf.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        cells = np.ravel_multi_index([np.searchsorted(e, X[:, i], side='left')
+                                      for i, e in enumerate(self.edges)], self.low.shape)
+        low, high = self.low.ravel()[cells], self.high.ravel()[cells]
+        missing = np.isnan(X).any(axis=1)
+        low[missing], high[missing] = -np.inf, np.inf
+        return low, high
+
+    def save(self, filename):
+        arrays = dict(('edges_%d' % i, e) for i, e in enumerate(self.edges))
+        np.savez_compressed(filename, low=self.low, high=self.high, key=self.key, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as f:
+            edges = [f['edges_%d' % i] for i in range(f['low'].ndim)]
+            return cls(edges, f['low'], f['high'], str(f['key']))
+
+
+def threshold_edges(ensembles, n_edges):
+    """Return per feature n_edges (or fewer) grid edges, spread over the thresholds of ensembles
+
+    Grid cells then split where the trees do, which keeps bounds tight.
+    """
+    n_features = max(e.feature.max() for e in ensembles) + 1
+    edges = []
+    for feature in range(n_features):
+        thresholds = np.unique(np.concatenate([
+            [_round_down(t) for t in e.threshold[(e.feature == feature) & (e.left != np.arange(len(e.left)))]]
+            for e in ensembles]).astype(np.float32))
+        if len(thresholds) > n_edges:
+            thresholds = thresholds[np.linspace(0, len(thresholds) - 1, n_edges).round().astype(int)]
+        edges.append(thresholds)
+    return edges
+
+
+def _score_with_tables(tables, X):
+    """Return an array (event, class column) of summed leaf values, see TreeEnsemble._leaf_tables"""
+    tables, leaf_values = tables
+    X = np.asarray(X, dtype=np.float32)
+    n_trees = len(leaf_values) // BITS
+    leaves = np.full((len(X), n_trees), ALL_LEAVES, dtype=np.uint64)
+    for feature, (thresholds, rows) in enumerate(tables):
+        # Events go right at nodes with a threshold below their value
+        leaves &= rows[np.searchsorted(thresholds, X[:, feature], side='left')]
+    # Number of the lowest leaf: isolate the lowest set bit, then look it up
+    lowest = _DE_BRUIJN_POSITIONS[((leaves & (np.uint64(0) - leaves)) * _DE_BRUIJN) >> np.uint64(58)]
+    return leaf_values[np.arange(n_trees) * BITS + lowest].sum(axis=1)
+
+
+def _round_down(threshold):
+    """Largest float32 not above threshold: x <= threshold if and only if x <= it, for float32 x"""
+    result = np.float32(threshold)
+    if result > threshold:
+        result = np.nextafter(result, np.float32(-np.inf))
+    return result
+
+
+def _tree_arrays(tree):
+    """Return feature, threshold, left, right and value (node, class) of a tree"""
+    if hasattr(tree, 'children_left'):
+        # scikit-learn Tree
+        value = np.asarray(tree.value)
+        return (np.asarray(tree.feature), np.asarray(tree.threshold),
+                np.asarray(tree.children_left), np.asarray(tree.children_right), value[:, 0, :])
+    nodes = tree.state['nodes']
+    return (nodes['feature'], nodes['threshold'], nodes['left_child'], nodes['right_child'],
+            np.asarray(tree.state['values'])[:, 0, :])
+
+
+def _depth(left, right):
+    """Largest number of edges from the root (node 0) to a leaf"""
+    depth = np.zeros(len(left), dtype=int)
+    # Children always come after their parent
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _initial_scores(model, n_columns):
+    """Return the score of each class column before the first boosting stage"""
+    init = model.init_
+    name = type(init).__name__
+    if isinstance(init, str):
+        if init == 'zero':
+            return np.zeros(n_columns)
+    elif name == 'LogOddsEstimator':
+        # scikit-learn < 0.21
+        return np.array([float(init.prior)])
+    elif name == 'PriorProbabilityEstimator':
+        # scikit-learn < 0.21 starts multinomial scores from the priors themselves
+        return np.asarray(init.priors, dtype=np.float64)
+    elif name == 'DummyClassifier':
+        prior = np.asarray(init.class_prior_, dtype=np.float64)
+        if n_columns == 1:
+            return np.array([np.log(prior[1] / (1 - prior[1]))])
+        return np.log(prior)
+    raise ValueError('Cannot export initial estimator %s' % name)
+
+
+class _StandIn(object):
+    """Instance of a scikit-learn class, as a plain attribute holder"""
+
+    def __init__(self, *args):
+        self.args = args
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+        self.state = state
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        if module.split('.')[0] == 'sklearn':
+            return type(name, (_StandIn,), {'__module__': module})
+        if module.split('.')[0] in ('numpy', 'copy_reg', 'copyreg', '__builtin__', 'builtins'):
+            return pickle.Unpickler.find_class(self, module, name)
+        raise pickle.UnpicklingError('Not reading %s.%s from a model pickle' % (module, name))
+
+
+def read_sklearn_pickle(filename):
+    """Return the object pickled in filename, with stand-ins for scikit-learn classes
+
+    Only scikit-learn, NumPy and builtin classes are allowed in the pickle.
+    """
+    with open(filename, 'rb') as f:
+        if bytes is str:  # pragma: no cover
+            return _Unpickler(f).load()
+        return _Unpickler(f, encoding='latin1').load()
+
+
+def load(filename):
+    """Return the TreeEnsemble saved in filename (.npz)
+
+    If there is no such file, the classifier pickled in the .pkl file of the
+    same name is exported.
+    """
+    if os.path.exists(filename):
+        return TreeEnsemble.load(filename)
+    return export(os.path.splitext(filename)[0] + '.pkl')
+
+
+def export(pickle_filename, filename=None):
+    """Export the classifier pickled in pickle_filename, return the TreeEnsemble
+
+    :param filename: Save it to this .npz file too
+    """
+    ensemble = TreeEnsemble.from_sklearn(read_sklearn_pickle(pickle_filename))
+    if filename is not None:
+        ensemble.save(filename)
+    return ensemble
@@ -0,0 +1,13 @@
+"""Units used by the lichens, with the values of pax.units
+
+As in pax, lengths are in cm and times in ns. Importing pax just for these
+would make every import of the lichens pay for all of pax.
+"""
+# -*- coding: utf-8 -*-
+
+cm = 1.
+um = 1e-4 * cm
+
+ns = 1.
+us = 1e3 * ns
+s = 1e9 * ns
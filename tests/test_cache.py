@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/cache.py"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax import cache, resources
+from lax.lichen import Lichen, ManyLichen, StringLichen
+
+run_ends = {}    # Run number -> end time, for EndOfRun
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+class Small(StringLichen):
+    string = "abs(b) < @limit"
+
+    def __init__(self, limit=1.):
+        self.limit = limit
+
+    def _process(self, df):
+        df.loc[:, self.name()] = self.expression().evaluate(df, {'limit': self.limit})
+        return df
+
+
+class Both(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Small()]
+
+
+class Table(Lichen):
+    """Passes events with a below the value in a table file"""
+    input_columns = ('a',)
+    filename = None
+
+    def _evaluate(self, c):
+        return c['a'] < float(resources.load_table(self.filename))
+
+
+class Sum(Lichen):
+    """Reads a and b without declaring them"""
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['a'] + df['b'] > 0
+        return df
+
+
+class EndOfRun(Lichen):
+    input_columns = ('run_number', 'a')
+
+    def run_state(self, run_numbers):
+        return dict((run_number, run_ends[run_number]) for run_number in run_numbers)
+
+    def _evaluate(self, c):
+        return c['a'] < np.array([run_ends[run] for run in c['run_number']])
+
+
+class CacheTestCase(unittest.TestCase):
+    """Test case for lax/cache.py
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame({'a': rng.normal(size=100),
+                                'b': rng.normal(size=100)})
+        self.cache = cache.enable()
+
+    def tearDown(self):
+        cache.disable()
+
+    def test_hit(self):
+        expected = Both().process(self.df.copy())
+        self.assertEqual(self.cache.misses, 3)
+        result = Both().process(self.df.copy())
+        self.assertEqual(self.cache.hits, 1)
+        pd.testing.assert_frame_equal(result, expected)
+
+        # Shared lichens are found on their own
+        Positive().process(self.df.copy())
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_miss(self):
+        Small().process(self.df.copy())
+        Small(limit=2.).process(self.df.copy())
+        df = self.df.copy()
+        df.loc[3, 'b'] = 0.
+        Small().process(df)
+        # Columns the lichen does not read do not matter
+        df = self.df.copy()
+        df.loc[3, 'a'] = 0.
+        Small().process(df)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def test_undeclared_inputs(self):
+        Sum().process(self.df.copy())
+        df = self.df.copy()
+        df['b'] = -10.
+        result = Sum().process(df)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertFalse(result['CutSum'].any())
+        # Also in a cut set
+        both = ManyLichen()
+        both.lichen_list = [Positive(), Sum()]
+        both.process(self.df.copy())
+        self.assertFalse(both.process(df)['CutSum'].any())
+
+    def test_method_code(self):
+        Sum().process(self.df.copy())
+        original = Sum._process
+        try:
+            def _process(self, df):
+                df.loc[:, self.name()] = df['a'] - df['b'] > 0
+                return df
+            Sum._process = _process
+            result = Sum().process(self.df.copy())
+        finally:
+            Sum._process = original
+        self.assertEqual(self.cache.hits, 0)
+        np.testing.assert_array_equal(result['CutSum'], self.df['a'] > self.df['b'])
+        Sum().process(self.df.copy())
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_eviction(self):
+        self.cache.max_bytes = 250    # Room for two cut columns of 100 bytes
+        for i in range(3):
+            Small(limit=i).process(self.df.copy())
+        self.assertEqual(len(self.cache), 2)
+        self.assertLessEqual(self.cache.nbytes, 250)
+        Small(limit=0).process(self.df.copy())
+        self.assertEqual(self.cache.hits, 0)
+        Small(limit=2).process(self.df.copy())
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_files(self):
+        """Results are not reused once a file the lichen read has changed"""
+        directory = tempfile.mkdtemp()
+        Table.filename = os.path.join(directory, 'limit.txt')
+        try:
+            with open(Table.filename, 'w') as f:
+                f.write('0.5\n')
+            expected = Table().process(self.df.copy())
+            pd.testing.assert_frame_equal(Table().process(self.df.copy()), expected)
+            self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+            with open(Table.filename, 'w') as f:
+                f.write('0.\n')
+            os.utime(Table.filename, (0, 0))
+            # Still the loaded table, so still the same results
+            Table().process(self.df.copy())
+            self.assertEqual(self.cache.hits, 2)
+
+            resources.evict(Table.filename)
+            result = Table().process(self.df.copy())
+            self.assertEqual(self.cache.hits, 2)
+            np.testing.assert_array_equal(result['CutTable'], self.df['a'] < 0)
+        finally:
+            resources.clear()
+            shutil.rmtree(directory)
+
+    def test_run_state(self):
+        df = self.df.assign(run_number=np.repeat([1, 2], 50))
+        run_ends.update({1: 0., 2: 0.})
+        EndOfRun().process(df.copy())
+        EndOfRun().process(df.copy())
+        self.assertEqual(self.cache.hits, 1)
+        run_ends[2] = 1.
+        result = EndOfRun().process(df.copy())
+        self.assertEqual(self.cache.hits, 1)
+        np.testing.assert_array_equal(result['CutEndOfRun'], df['a'] < np.repeat([0., 1.], 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
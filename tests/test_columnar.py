@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/columnar.py"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax.lichen import Lichen, ManyLichen, RangeLichen, StringLichen
+
+try:
+    import polars as pl
+except ImportError:  # pragma: no cover
+    pl = None
+
+if pl is not None:
+    from lax import columnar
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+class Small(StringLichen):
+    string = "abs(b) < 1"
+
+
+class Radius(Lichen):
+    """Imperative lichen adding a helper column"""
+    input_columns = ('a', 'b')
+    derived_columns = ('radius',)
+
+    def pre(self, df):
+        df.loc[:, 'radius'] = np.sqrt(df['a'] ** 2 + df['b'] ** 2)
+        return df
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['radius'] < 1.5
+        return df
+
+
+class OnRadius(StringLichen):
+    string = "radius > 0.5"
+
+
+class Window(RangeLichen):
+    variable = 'a'
+    allowed_range = (-1, 1)
+
+
+class Functions(StringLichen):
+    string = "(sqrt(abs(a)) * 2 ** b >= 0.5) | ~(arctan2(a, b) < @angle) & (b != 0.3)"
+
+    def get_parameters(self):
+        return {'angle': 0.5}
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Radius(), Small(), OnRadius(), Window(), Functions()]
+
+
+@unittest.skipIf(pl is None, 'polars is not installed')
+class ColumnarTestCase(unittest.TestCase):
+    """Test case for lax/columnar.py
+    """
+
+    def setUp(self):
+        self.cuts = Cuts()
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame({'a': rng.normal(size=500), 'b': rng.normal(size=500)})
+        df.loc[::7, 'a'] = np.nan
+        self.df = df
+        self.expected = self.cuts.evaluate_cuts(df)
+
+    def test_translate(self):
+        schema = pl.from_pandas(self.df).collect_schema()
+        expressions, fallback = columnar.translate(self.cuts, schema)
+        self.assertEqual(list(expressions),
+                         ['CutPositive', 'CutSmall', 'CutWindow', 'CutFunctions'])
+        self.assertEqual([x.name() for x in fallback], ['CutRadius', 'CutOnRadius'])
+
+    def test_apply(self):
+        """Translated and fallback lichens give the results of evaluate_cuts"""
+        lf = pl.from_pandas(self.df).lazy()
+        result = columnar.apply(self.cuts, lf)
+        self.assertIsInstance(result, pl.LazyFrame)
+        result = result.collect()
+        self.assertEqual(result.columns, ['a', 'b'] + self.cuts.cut_columns())
+        for column in self.expected.columns:
+            np.testing.assert_array_equal(result[column].to_numpy(),
+                                          self.expected[column].values)
+
+        self.assertIsInstance(columnar.apply(self.cuts, lf.collect()), pl.DataFrame)
+        with self.assertRaises(KeyError):
+            columnar.apply(self.cuts, lf.select('a'))
+        with self.assertRaises(TypeError):
+            columnar.apply(self.cuts, self.df)
+
+    def test_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError:  # pragma: no cover
+            self.skipTest('pyarrow is not installed')
+        table = pa.Table.from_pandas(self.df, preserve_index=False)
+        result = columnar.apply(self.cuts, table)
+        self.assertIsInstance(result, pa.Table)
+        np.testing.assert_array_equal(result.column('CutCuts').to_numpy(),
+                                      self.expected['CutCuts'].values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/cutsets.py"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax.cutsets import SharedResults, process_cut_sets
+from lax.lichen import Lichen, ManyLichen, StringLichen
+
+calls = []    # Names of the lichens processed
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+    def _process(self, df):
+        calls.append(self.name())
+        return StringLichen._process(self, df)
+
+
+class Small(Positive):
+    string = "abs(b) < 1"
+
+
+class Radius(Lichen):
+    input_columns = ('a', 'b')
+    derived_columns = ('radius',)
+    limit = 1.5
+
+    def _process(self, df):
+        calls.append(self.name())
+        df.loc[:, 'radius'] = np.sqrt(df['a'] ** 2 + df['b'] ** 2)
+        df.loc[:, self.name()] = df['radius'] < self.limit
+        return df
+
+
+class WideRadius(Radius):
+    limit = 2.
+
+    def name(self):
+        return 'CutRadius'
+
+
+class First(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Radius()]
+
+
+class Second(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Small(), Radius(), Positive()]
+
+
+class Third(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [WideRadius(), Small()]
+
+
+class DropNegative(Lichen):
+    """Drops events with b < -1 and reverses the order of the others"""
+    input_columns = ('b',)
+
+    def pre(self, df):
+        return df[df['b'] >= -1].iloc[::-1]
+
+    def _process(self, df):
+        calls.append(self.name())
+        df.loc[:, self.name()] = df['b'] < 1.5
+        return df
+
+
+def make_frame(n=300):
+    rng = np.random.RandomState(0)
+    return pd.DataFrame({'a': rng.normal(size=n),
+                         'b': rng.normal(size=n)})
+
+
+class CutSetsTestCase(unittest.TestCase):
+    """Test case for lax/cutsets.py
+    """
+
+    def setUp(self):
+        del calls[:]
+
+    def test_shared(self):
+        cut_sets = [First(), Second(), Third(), First()]
+        expected = make_frame()
+        for cuts in cut_sets:
+            expected = cuts.process(expected)
+        self.assertEqual(len(calls), 9)
+
+        del calls[:]
+        result = process_cut_sets(cut_sets, make_frame())
+        pd.testing.assert_frame_equal(result, expected)
+        # CutRadius of Third differs, so Radius is run again for the last set
+        self.assertEqual(calls, ['CutPositive', 'CutRadius', 'CutSmall',
+                                 'CutRadius', 'CutRadius'])
+
+    def test_dropped_rows(self):
+        """Events a shared lichen drops fail it"""
+        df = make_frame()
+        shared = SharedResults()
+        result, passed = shared.apply(df.copy(), DropNegative())
+        self.assertLess(len(result), len(df))
+        np.testing.assert_array_equal(passed, (df['b'] >= -1) & (df['b'] < 1.5))
+        # Not evaluated again, same outcome
+        result, again = shared.apply(result, DropNegative())
+        self.assertEqual(calls, ['CutDropNegative'])
+        np.testing.assert_array_equal(again, passed[result.index])
+
+        class Dropping(ManyLichen):
+            def __init__(self):
+                self.lichen_list = [DropNegative(), Positive()]
+
+        cut_sets = [Dropping(), First()]
+        expected = df.copy()
+        for cuts in cut_sets:
+            expected = cuts.process(expected)
+        pd.testing.assert_frame_equal(process_cut_sets(cut_sets, df.copy()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
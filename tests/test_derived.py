@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/derived.py"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax import derived
+
+
+class DerivedTestCase(unittest.TestCase):
+    """Test case for lax/derived.py
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame({'cs2_top': rng.uniform(1, 10, 100),
+                                'cs2_bottom': rng.uniform(1, 10, 100),
+                                's2_lifetime_correction': rng.uniform(1, 2, 100)})
+        self.calls = 0
+
+        @derived.register('test_double_cxys2', ('cxys2',))
+        def double(c):
+            self.calls += 1
+            return 2 * c.cxys2
+
+    def tearDown(self):
+        del derived.REGISTRY['test_double_cxys2']
+
+    def test_definitions(self):
+        df = derived.add(self.df, 'cxys2', 'cs2_aft')
+        np.testing.assert_array_equal(df['cs2_aft'],
+                                      df['cs2_top'] / (df['cs2_top'] + df['cs2_bottom']))
+        np.testing.assert_array_equal(
+            derived.compute(self.df, 'test_double_cxys2'), 2 * df['cxys2'].values)
+
+    def test_columns(self):
+        """Existing columns are used as inputs, not recomputed"""
+        self.df['cxys2'] = 1.
+        np.testing.assert_array_equal(derived.compute(self.df, 'test_double_cxys2'), 2.)
+        with self.assertRaises(KeyError):
+            derived.compute(self.df, 'no_such_variable')
+
+    def test_memoize(self):
+        with derived.memoize():
+            first = derived.compute(self.df, 'test_double_cxys2')
+            with derived.memoize():
+                self.assertIs(derived.compute(self.df, 'test_double_cxys2'), first)
+            self.assertIs(derived.compute(self.df, 'test_double_cxys2'), first)
+            # Other rows, other values
+            derived.compute(self.df.iloc[:10].copy(), 'test_double_cxys2')
+        self.assertEqual(self.calls, 2)
+        derived.compute(self.df, 'test_double_cxys2')
+        self.assertEqual(self.calls, 3)
+
+    def test_arrays(self):
+        """Dicts of arrays and structured arrays work as DataFrames do"""
+        expected = derived.compute(self.df, 'test_double_cxys2')
+        for data in [{name: self.df[name].values for name in self.df.columns},
+                     self.df.to_records(index=False)]:
+            c = derived.Columns(data)
+            self.assertEqual(len(c), 100)
+            self.assertEqual(sorted(derived.column_names(data)), sorted(self.df.columns))
+            np.testing.assert_array_equal(c.test_double_cxys2, expected)
+            c['cxys2'] = np.ones(100)
+            np.testing.assert_array_equal(c['cxys2'], 1.)
+            self.assertEqual(list(c.added), ['cxys2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/expression.py"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax import expression
+from lax.lichen import ManyLichen, StringLichen
+
+
+class Label(StringLichen):
+    string = "label.str.startswith('s') & a > 0"
+
+
+class ExpressionTestCase(unittest.TestCase):
+    """Test case for lax/expression.py
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame({'a': rng.normal(size=100),
+                                'b': rng.normal(size=100)})
+        self.df.loc[::7, 'a'] = np.nan
+
+    def check(self, string, **parameters):
+        """Compare to pandas.eval with and without numexpr"""
+        plan = expression.Expression(string)
+        expected = self.df.eval(string, local_dict=parameters)
+        np.testing.assert_array_equal(plan.evaluate(self.df, parameters), expected)
+        plan.use_numexpr = False
+        np.testing.assert_array_equal(plan.evaluate(self.df, parameters), expected)
+
+    def test_precedence(self):
+        """& and | bind like 'and' and 'or', as in pandas"""
+        self.check("a < -1 | b > 1")
+        self.check("a > 0 & b > 0 | a < -1")
+
+    def test_functions_and_chains(self):
+        self.check("(~ (a > 0)) | (sqrt(b*b) < exp(-1))")
+        self.check("-1 < a < 1")
+
+    def test_parameters(self):
+        self.check("a**2 < @x", x=0.5)
+        self.assertEqual(expression.Expression("a < @x").parameters, ['x'])
+
+    def test_columns(self):
+        plan = expression.Expression("(b > 1) & (sqrt(a*a + b) < 2)")
+        self.assertEqual(plan.columns, ['b', 'a'])
+
+    def test_cache(self):
+        self.assertIs(expression.get_expression("a > 1"),
+                      expression.get_expression("a > 1"))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            expression.Expression("a.mean() > 1")
+
+    def test_frame_fallback(self):
+        """Strings only DataFrame.eval understands are evaluated by it"""
+        df = self.df.assign(label=np.where(self.df['b'] > 0, 'signal', 'background'))
+        for string in ("label.str.startswith('s') & a > 0",
+                       "label == 'signal'",
+                       "label in ['signal']",
+                       "a.abs() < @x"):
+            plan = expression.get_expression(string)
+            self.assertIsInstance(plan, expression.FrameExpression)
+            np.testing.assert_array_equal(plan.evaluate(df, {'x': 0.5}),
+                                          df.eval(string, local_dict={'x': 0.5}))
+        with self.assertRaises(ValueError):
+            expression.get_expression("a >")
+
+        expected = df['label'].str.startswith('s') & (df['a'] > 0)
+        np.testing.assert_array_equal(Label().evaluate(df), expected)
+        np.testing.assert_array_equal(Label().process(df.copy())['CutLabel'], expected)
+        cuts = ManyLichen()
+        cuts.lichen_list = [Label()]
+        np.testing.assert_array_equal(cuts.evaluate_cuts(df)['CutLabel'], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Test that importing lax stays cheap"""
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_after(statement, modules):
+    """Return those of modules a fresh interpreter has imported after statement"""
+    script = '%s\nimport sys\nprint(",".join(m for m in %r if m in sys.modules))' % (
+        statement, tuple(modules))
+    # Only this tree on the path: modules the environment preloads do not count
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=ROOT, env=env)
+    return [m for m in output.decode().strip().split(',') if m]
+
+
+class ImportsTestCase(unittest.TestCase):
+    """Test case for lazy imports in lax and lax.lichens
+    """
+
+    def test_import_lax(self):
+        self.assertEqual(imported_after('import lax', ['lax.lichens', 'lax.lichen', 'pax', 'scipy',
+                                                       'matplotlib', 'seaborn', 'numpy']), [])
+
+    def test_lazy_lichens(self):
+        self.assertEqual(imported_after('import lax.lichens',
+                                        ['lax.lichens.sciencerun0', 'lax.lichens.postsr1']), [])
+        self.assertEqual(imported_after('import lax; lax.lichens.sciencerun1',
+                                         ['lax.lichens.sciencerun1', 'lax.lichens.postsr1']),
+                         ['lax.lichens.sciencerun1'])
+
+    def test_no_work_on_import(self):
+        """Lichen modules neither import heavy packages nor load models"""
+        statement = ('from lax.lichens import sciencerun2, postsr1\n'
+                     'from lax import resources\n'
+                     'assert not resources.loaded()')
+        self.assertEqual(imported_after(statement, ['pax', 'scipy', 'sklearn',
+                                                    'matplotlib', 'seaborn']), [])
+
+    def test_profiling(self):
+        """Allocations are traced only when measuring memory"""
+        self.assertEqual(imported_after('from lax import profiling\nprofiling.Profiler()',
+                                        ['tracemalloc']), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/incremental.py"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax.incremental import IncrementalProcessor
+from lax.lichen import Lichen, ManyLichen, StringLichen
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+processed = []    # Number of events processed by EndOfRun, per call
+
+
+class EndOfRun(Lichen):
+    """Pass events before a run-level end time"""
+    input_columns = ('run_number', 'event_number')
+    end_times = {1: 50, 2: 50}
+
+    def run_state(self, run_numbers):
+        return {run_number: self.end_times[run_number] for run_number in run_numbers}
+
+    def _process(self, df):
+        processed.append(len(df))
+        end_times = df['run_number'].map(self.end_times)
+        df.loc[:, self.name()] = df['event_number'] < end_times
+        return df
+
+
+class DropNegative(Lichen):
+    """Drops events with negative a"""
+    input_columns = ('a',)
+
+    def _process(self, df):
+        df = df[df['a'] > 0].copy()
+        df.loc[:, self.name()] = True
+        return df
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), EndOfRun()]
+
+
+def make_frame(run_number, n=100):
+    rng = np.random.RandomState(run_number)
+    return pd.DataFrame({'run_number': run_number,
+                         'event_number': np.arange(n),
+                         'a': rng.normal(size=n)})
+
+
+class IncrementalTestCase(unittest.TestCase):
+    """Test case for lax/incremental.py
+    """
+
+    def setUp(self):
+        del processed[:]
+        EndOfRun.end_times = {1: 50, 2: 50}
+
+    def test_update(self):
+        processor = IncrementalProcessor(Cuts())
+        processor.update(make_frame(1))
+        df = pd.concat([make_frame(1), make_frame(2)], ignore_index=True)
+        result = processor.update(df)
+        self.assertEqual(processed, [100, 100])
+        expected = Cuts().process(df.copy())
+        del processed[:]
+        pd.testing.assert_frame_equal(result, expected[Cuts().cut_columns()])
+
+        # Run 1 got a new end time
+        EndOfRun.end_times = {1: 80, 2: 50}
+        result = processor.update(df)
+        self.assertEqual(processed, [100])
+        self.assertEqual(result['CutEndOfRun'].sum(), 130)
+
+    def test_dropped_rows(self):
+        processor = IncrementalProcessor(DropNegative())
+        df = make_frame(1)
+        result = processor.update(df)
+        self.assertEqual(result['CutDropNegative'].dtype, bool)
+        np.testing.assert_array_equal(result['CutDropNegative'], df['a'] > 0)
+
+    def test_save(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'cuts.pkl')
+            processor = IncrementalProcessor(Cuts(), filename)
+            processor.update(make_frame(1))
+            processor.save()
+
+            processor = IncrementalProcessor(Cuts(), filename)
+            self.assertEqual(len(processor), 100)
+            processor.update(make_frame(1))
+            self.assertEqual(processed, [100])
+
+            self.assertEqual(len(IncrementalProcessor(Positive(), filename)), 0)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
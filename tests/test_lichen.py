@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/lichen.py"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax.lichen import Lichen, ManyLichen, StringLichen
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+class Small(StringLichen):
+    string = "abs(b) < 1"
+
+
+class Radius(Lichen):
+    """Imperative lichen adding a helper column"""
+    input_columns = ('a', 'b')
+    derived_columns = ('radius',)
+
+    def pre(self, df):
+        df.loc[:, 'radius'] = np.sqrt(df['a'] ** 2 + df['b'] ** 2)
+        return df
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['radius'] < 1.5
+        return df
+
+
+class Undeclared(Lichen):
+    """Out-of-tree style lichen: a _process of its own, no input_columns"""
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['a'] + df['b'] > 0
+        return df
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Radius(), Small()]
+
+
+def make_frame(n=500, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({'a': rng.normal(size=n),
+                         'b': rng.normal(size=n)})
+
+
+class ManyLichenTestCase(unittest.TestCase):
+    """Test case for ManyLichen evaluation modes
+    """
+
+    def test_short_circuit(self):
+        """Survivors-only evaluation gives the same combined cut"""
+        expected = Cuts().process(make_frame())
+
+        cuts = Cuts()
+        cuts.short_circuit = True
+        result = cuts.process(make_frame())
+
+        np.testing.assert_array_equal(result['CutCuts'], expected['CutCuts'])
+        self.assertEqual(list(result.columns), list(expected.columns))
+        # Events rejected by an earlier cut are not evaluated
+        self.assertFalse(result.loc[~result['CutPositive'], 'CutRadius'].any())
+        self.assertTrue(result.loc[~result['CutPositive'], 'radius'].isnull().all())
+
+        df = make_frame()
+        packed = cuts.cut_results(df)
+        np.testing.assert_array_equal(packed.passed(), expected['CutCuts'])
+        # No cut or helper columns are added
+        self.assertEqual(list(df.columns), ['a', 'b'])
+        # Unless asked for
+        cuts.cut_results(df, helper_columns=['radius'])
+        pd.testing.assert_series_equal(df['radius'], result['radius'])
+
+    def test_dropped_rows(self):
+        """Events a lichen drops fail it, in every evaluation mode"""
+        class DropNegative(Lichen):
+            """Drops events with b < -1 and reverses the order of the others"""
+            input_columns = ('b',)
+
+            def pre(self, df):
+                return df[df['b'] >= -1].iloc[::-1]
+
+            def _process(self, df):
+                df.loc[:, self.name()] = df['b'] < 1.5
+                return df
+
+        def make_cuts():
+            cuts = Cuts()
+            cuts.lichen_list = [Positive(), DropNegative(), Radius(), Small()]
+            return cuts
+
+        df = make_frame()
+        processed = make_cuts().process(df.copy())
+        self.assertLess(len(processed), len(df))
+        expected = processed['CutCuts'].reindex(df.index, fill_value=False).values
+
+        results = make_cuts().cut_results(df.copy())
+        np.testing.assert_array_equal(results.passed(), expected)
+        np.testing.assert_array_equal(results.passed(['CutDropNegative']),
+                                      (df['b'] >= -1) & (df['b'] < 1.5))
+
+        cuts = make_cuts()
+        cuts.short_circuit = True
+        np.testing.assert_array_equal(cuts.cut_results(df.copy()).passed(), expected)
+        result = cuts.process(df.copy())
+        np.testing.assert_array_equal(result['CutCuts'].reindex(df.index, fill_value=False), expected)
+
+        cutflow = make_cuts().cutflow(df)
+        self.assertEqual(cutflow.loc['CutSmall', 'events'], expected.sum())
+        pd.testing.assert_frame_equal(cutflow, results.cutflow())
+
+    def test_evaluation_order(self):
+        """Reordered evaluation keeps results and cut column order"""
+        expected = Cuts().process(make_frame())
+
+        cuts = Cuts()
+        cuts.short_circuit = True
+        cuts.auto_order = True
+        result = cuts.process(make_frame())
+        self.assertEqual(sorted(cuts.evaluation_order), sorted(cuts.get_cut_names()))
+        self.assertEqual([x for x in result.columns if x.startswith('Cut')],
+                         [x for x in expected.columns if x.startswith('Cut')])
+        np.testing.assert_array_equal(result['CutCuts'], expected['CutCuts'])
+
+        cuts.evaluation_order = ['CutSmall', 'CutRadius', 'CutPositive']
+        np.testing.assert_array_equal(cuts.cut_results(make_frame()).passed(),
+                                      expected['CutCuts'])
+
+    def test_profile_dependencies(self):
+        """Lichens reading the output of others are profiled after them, pre() runs once"""
+        class OnRadius(StringLichen):
+            string = "radius > 0.5"
+
+        class Counted(Cuts):
+            calls = []
+
+            def __init__(self):
+                Cuts.__init__(self)
+                self.lichen_list = self.lichen_list + [OnRadius()]
+
+            def pre(self, df):
+                self.calls.append(len(df))
+                return df
+
+        expected = Counted().process(make_frame())
+        cuts = Counted()
+        cuts.auto_order = True
+        del Counted.calls[:]
+        result = cuts.process(make_frame())
+        self.assertEqual(Counted.calls, [500])
+        names = [lichen.name() for lichen in cuts.get_evaluation_list()]
+        self.assertLess(names.index('CutRadius'), names.index('CutOnRadius'))
+        np.testing.assert_array_equal(result['CutCounted'], expected['CutCounted'])
+
+        statistics = Counted().profile_order(make_frame(), sample_size=100)
+        self.assertEqual(sorted(statistics.index), sorted(cuts.get_cut_names()))
+
+        cuts = Counted()
+        cuts.auto_order = True
+        np.testing.assert_array_equal(cuts.cut_results(make_frame()).passed(),
+                                      expected['CutCounted'])
+
+    def test_threads(self):
+        """Parallel evaluation gives the same frame, dependencies included"""
+        class OnRadius(StringLichen):
+            string = "radius > 0.5"
+
+        def make_cuts():
+            cuts = Cuts()
+            cuts.lichen_list = cuts.lichen_list + [OnRadius()]
+            return cuts
+
+        expected = make_cuts().process(make_frame())
+
+        cuts = make_cuts()
+        cuts.n_threads = 4
+        result = cuts.process(make_frame())
+        pd.testing.assert_frame_equal(result, expected)
+
+        # Lichens declaring no input columns get all columns
+        def make_cuts():
+            cuts = Cuts()
+            cuts.lichen_list = cuts.lichen_list + [OnRadius(), Undeclared()]
+            return cuts
+
+        expected = make_cuts().process(make_frame())
+        cuts = make_cuts()
+        cuts.n_threads = 4
+        pd.testing.assert_frame_equal(cuts.process(make_frame()), expected)
+
+    def test_chunked(self):
+        """Chunked processing matches processing the whole frame"""
+        df = make_frame(n=1000)
+        expected = Cuts().process(df.copy())
+
+        result = Cuts().process_chunked(df, chunksize=300)
+        self.assertEqual(list(df.columns), ['a', 'b'])
+        self.assertEqual(list(result.columns),
+                         ['CutPositive', 'CutRadius', 'CutSmall', 'CutCuts'])
+        pd.testing.assert_frame_equal(result, expected[result.columns])
+
+        chunks = [df.iloc[:400].copy(), df.iloc[400:].copy()]
+        result = pd.concat(list(Cuts().process_iter(chunks)))
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_evaluate(self):
+        """Evaluation without touching the DataFrame matches process"""
+        class OnRadius(StringLichen):
+            string = "radius > 0.5"
+
+        cuts = Cuts()
+        cuts.lichen_list = cuts.lichen_list + [OnRadius()]
+        expected = cuts.process(make_frame())
+
+        df = make_frame()
+        result = cuts.evaluate_cuts(df)
+        self.assertEqual(list(df.columns), ['a', 'b'])
+        pd.testing.assert_frame_equal(result, expected[cuts.cut_columns()])
+        np.testing.assert_array_equal(cuts.evaluate(df), expected['CutCuts'])
+        np.testing.assert_array_equal(Small().evaluate(df), expected['CutSmall'])
+        np.testing.assert_array_equal(Radius().evaluate(df), expected['CutRadius'])
+        self.assertEqual(list(df.columns), ['a', 'b'])
+
+    def test_undeclared_inputs(self):
+        """Lichens declaring no input columns get all columns to evaluate on"""
+        expected = (make_frame()['a'] + make_frame()['b'] > 0).values
+        for data in (make_frame(), dict(make_frame().items()),
+                     make_frame().to_records(index=False)):
+            np.testing.assert_array_equal(Undeclared().evaluate(data), expected)
+
+        cuts = Cuts()
+        cuts.lichen_list = cuts.lichen_list + [Undeclared()]
+        df = make_frame()
+        result = cuts.evaluate_cuts(df)
+        pd.testing.assert_frame_equal(result, cuts.process(make_frame())[cuts.cut_columns()])
+        self.assertEqual(list(df.columns), ['a', 'b'])
+
+    def test_evaluate_arrays(self):
+        """Dicts of arrays and structured arrays give the results of process"""
+        class OnRadius(StringLichen):
+            string = "radius > 0.5"
+
+        class Ring(Lichen):
+            input_columns = ('a', 'b')
+
+            def _evaluate(self, c):
+                return np.hypot(c['a'], c['b']) > 0.2
+
+        cuts = Cuts()
+        cuts.lichen_list = cuts.lichen_list + [OnRadius(), Ring()]
+        expected = cuts.process(make_frame())
+
+        df = make_frame()
+        for data in [{'a': df['a'].values, 'b': df['b'].values},
+                     df.to_records(index=False)]:
+            np.testing.assert_array_equal(cuts.evaluate(data), expected['CutCuts'])
+            np.testing.assert_array_equal(Ring().evaluate(data), expected['CutRing'])
+            result = cuts.evaluate_cuts(data)
+            np.testing.assert_array_equal(result.values, expected[cuts.cut_columns()].values)
+
+        with self.assertRaises(KeyError):
+            cuts.evaluate({'a': df['a'].values})
+
+    def test_save_order(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'orders.json')
+            cuts = Cuts()
+            cuts.evaluation_order = ['CutSmall', 'CutPositive', 'CutRadius']
+            cuts.save_order(filename)
+
+            other = Cuts()
+            self.assertTrue(other.load_order(filename))
+            self.assertEqual(other.evaluation_order, cuts.evaluation_order)
+        finally:
+            shutil.rmtree(directory)
+
+
+class ColumnsTestCase(unittest.TestCase):
+    """Test case for column introspection
+    """
+
+    def test_string_lichen(self):
+        self.assertEqual(Small().required_columns(), ['b'])
+        self.assertEqual(Small().produced_columns(), ['CutSmall'])
+
+    def test_many_lichen(self):
+        cuts = Cuts()
+        self.assertEqual(cuts.required_columns(), ['a', 'b'])
+        self.assertEqual(cuts.produced_columns(),
+                         ['CutPositive', 'radius', 'CutRadius', 'CutSmall', 'CutCuts'])
+
+    def test_check_columns(self):
+        with self.assertRaises(KeyError):
+            Cuts().process(make_frame()[['a']])
+        Cuts().check_columns(['a', 'b'])
+
+    def test_dependencies(self):
+        """Lichens reading another lichen's output are evaluated after it"""
+        class OnRadius(StringLichen):
+            string = "radius > 0.5"
+
+        cuts = Cuts()
+        cuts.lichen_list = [OnRadius()] + cuts.lichen_list
+        self.assertEqual(cuts.get_dependencies()['CutOnRadius'], {'CutRadius'})
+        self.assertEqual(cuts.required_columns(), ['radius', 'a', 'b'])
+
+        cuts.lichen_list = cuts.lichen_list[1:] + cuts.lichen_list[:1]
+        cuts.evaluation_order = ['CutOnRadius', 'CutSmall', 'CutRadius', 'CutPositive']
+        self.assertEqual([x.name() for x in cuts.get_evaluation_list()],
+                         ['CutSmall', 'CutRadius', 'CutOnRadius', 'CutPositive'])
+
+
+if __name__ == '__main__':
+    unittest.main()
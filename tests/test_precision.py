@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/precision.py"""
+import importlib
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax import precision, synthetic
+from lax.lichen import Lichen, ManyLichen, StringLichen
+
+
+class Threshold(StringLichen):
+    float32_safe = True
+    string = "s2 > 200"
+
+
+class Time(StringLichen):
+    """Nanosecond times do not fit in single precision"""
+    string = "event_time > 1.5e18 + 1000"
+
+
+class Dtype(Lichen):
+    """Remember the dtype of the column it reads"""
+    float32_safe = True
+    input_columns = ('s2',)
+    seen = []
+
+    def _evaluate(self, c):
+        self.seen.append(c['s2'].dtype)
+        return c['s2'] > 0
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Threshold(), Time(), Dtype()]
+
+
+class PrecisionTestCase(unittest.TestCase):
+    """Test case for lax/precision.py
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame({
+            's2': rng.uniform(0, 1000, 1000),
+            'event_time': 1.5e18 + rng.randint(-10000, 10000, 1000).astype(np.float64)})
+        Dtype.seen = []
+
+    def test_flipped_events(self):
+        report = precision.flipped_events(Cuts(), self.df)
+        self.assertEqual(list(report.index), ['CutThreshold', 'CutTime', 'CutDtype', 'CutCuts'])
+        self.assertEqual(report.loc['CutThreshold', 'flipped'], 0)
+        self.assertGreater(report.loc['CutTime', 'flipped'], 0)
+        self.assertEqual(report.loc['CutTime', 'flipped'],
+                         report.loc['CutTime', 'lost'] + report.loc['CutTime', 'gained'])
+        self.assertEqual(report.loc['CutThreshold', 'passed'], (self.df['s2'] > 200).sum())
+        self.assertEqual(Dtype.seen, [np.float64, np.float32])
+
+        precision.check_float32_safe(Cuts(), self.df)
+        Time.float32_safe = True
+        try:
+            with self.assertRaises(ValueError):
+                precision.check_float32_safe(Cuts(), self.df)
+        finally:
+            Time.float32_safe = False
+
+    def test_float32_mode(self):
+        """Only lichens declaring float32_safe are evaluated in single precision"""
+        expected = Cuts().evaluate_cuts(self.df)
+        cuts = Cuts()
+        cuts.float32 = True
+        result = cuts.evaluate_cuts(self.df)
+        pd.testing.assert_frame_equal(result, expected)
+        self.assertEqual(Dtype.seen, [np.float64, np.float32])
+
+    def test_cast_float32(self):
+        df = self.df.copy()
+        expected = Cuts().evaluate_cuts(df)
+        self.assertIs(precision.cast_float32(df, Cuts()), df)
+        self.assertEqual(df['s2'].dtype, np.float32)
+        self.assertEqual(df['event_time'].dtype, np.float64)
+        pd.testing.assert_frame_equal(Cuts().evaluate_cuts(df), expected)
+
+        # Time reads s2 too: it stays in double precision
+        class TimeAndS2(Time):
+            string = "(event_time > 1.5e18 + 1000) & (s2 > 0)"
+
+        cuts = Cuts()
+        cuts.lichen_list = cuts.lichen_list + [TimeAndS2()]
+        self.assertEqual(precision.cast_float32(self.df.copy(), cuts)['s2'].dtype, np.float64)
+
+    def test_declared_lichens(self):
+        """Lichens of lax.lichens declaring float32_safe flip no synthetic events"""
+        df = synthetic.make_events(100000, seed=3)
+        checked = set()
+        for module_name in ('sciencerun0', 'sciencerun1', 'postsr1', 'sciencerun2'):
+            module = importlib.import_module('lax.lichens.' + module_name)
+            for name in dir(module):
+                klass = getattr(module, name)
+                if (isinstance(klass, type) and issubclass(klass, Lichen) and
+                        klass.float32_safe and klass not in checked):
+                    checked.add(klass)
+                    report = precision.check_float32_safe(klass(), df)
+                    self.assertGreater(report['passed'].iloc[0], 0)
+        self.assertGreaterEqual(len(checked), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/profiling.py"""
+import json
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax import profiling
+from lax.lichen import Lichen, ManyLichen, StringLichen
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+class Radius(Lichen):
+    """Imperative lichen adding a helper column"""
+    input_columns = ('a', 'b')
+    derived_columns = ('radius',)
+
+    def pre(self, df):
+        df.loc[:, 'radius'] = np.sqrt(df['a'] ** 2 + df['b'] ** 2)
+        return df
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['radius'] < 1.5
+        return df
+
+
+class Inner(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Radius()]
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Inner()]
+
+
+def make_frame(n=1000):
+    rng = np.random.RandomState(0)
+    return pd.DataFrame({'a': rng.normal(size=n), 'b': rng.normal(size=n)})
+
+
+class ProfilingTestCase(unittest.TestCase):
+    """Test case for lax/profiling.py
+    """
+
+    def test_records(self):
+        seen = []
+        with profiling.profile() as profiler:
+            profiler.add_hook(lambda record: seen.append(record['lichen']))
+            result = Cuts().process(make_frame())
+        self.assertIsNone(profiling.get_profiler())
+
+        report = profiler.report().set_index('lichen')
+        self.assertEqual(seen, ['CutPositive', 'CutRadius', 'CutInner', 'CutCuts'])
+        self.assertEqual(list(report.columns), list(profiling.RECORD_FIELDS[1:]))
+        self.assertEqual(report.loc['CutRadius', 'parent'], 'CutInner')
+        self.assertEqual(report.loc['CutRadius', 'depth'], 2)
+        self.assertEqual(report.loc['CutPositive', 'passed'], result['CutPositive'].sum())
+        self.assertEqual(report.loc['CutRadius', 'bytes_added'], 1000 * (8 + 1))
+        self.assertEqual(report.loc['CutCuts', 'rows_in'], 1000)
+        self.assertTrue((report['own_time'] <= report['wall_time']).all())
+        self.assertIsNone(report.loc['CutCuts', 'peak_memory'])
+
+        summary = profiler.summary()
+        self.assertEqual(sorted(summary.index), sorted(report.index))
+        records = json.loads(profiler.to_json())
+        self.assertEqual([x['lichen'] for x in records], seen)
+
+        Cuts().process(make_frame())
+        self.assertEqual(len(profiler), 4)
+
+    def test_memory(self):
+        profiler = profiling.enable(memory=True)
+        try:
+            Cuts().process(make_frame(n=100000))
+        finally:
+            self.assertIs(profiling.disable(), profiler)
+        report = profiler.report().set_index('lichen')
+        # The helper column alone is 800 kB
+        self.assertGreater(report.loc['CutRadius', 'peak_memory'], 8e5)
+        self.assertGreaterEqual(report.loc['CutCuts', 'peak_memory'],
+                                report.loc['CutRadius', 'peak_memory'])
+
+    def test_evaluate(self):
+        """Evaluation on arrays is measured as processing is"""
+        df = make_frame()
+        expected = Cuts().process(df.copy())
+        for evaluate in (lambda cuts: cuts.evaluate_cuts(df),
+                         lambda cuts: cuts.cutflow(df),
+                         lambda cuts: cuts.cut_results(df)):
+            with profiling.profile() as profiler:
+                evaluate(Cuts())
+            report = profiler.report().set_index('lichen')
+            self.assertEqual(list(report.index), ['CutPositive', 'CutRadius', 'CutInner', 'CutCuts'])
+            self.assertEqual(report.loc['CutRadius', 'parent'], 'CutInner')
+            self.assertEqual(report.loc['CutPositive', 'passed'], expected['CutPositive'].sum())
+            self.assertEqual(report.loc['CutCuts', 'passed'], expected['CutCuts'].sum())
+            self.assertEqual(report.loc['CutRadius', 'bytes_added'], 1000 * (8 + 1))
+
+        with profiling.profile() as profiler:
+            Radius().evaluate(df)
+        self.assertEqual(list(profiler.report()['lichen']), ['CutRadius'])
+
+    def test_threads(self):
+        """Peak memory is not given for calls overlapping with other threads"""
+        cuts = Cuts()
+        cuts.n_threads = 2
+        profiler = profiling.enable(memory=True)
+        try:
+            cuts.process(make_frame())
+        finally:
+            profiling.disable()
+        report = profiler.report()
+        self.assertEqual(len(report), 4)
+        self.assertTrue(report['peak_memory'].isnull().all())
+        self.assertEqual(report.set_index('lichen').loc['CutCuts', 'thread'],
+                         threading.current_thread().name)
+
+        # Later calls in one thread are measured again
+        profiler = profiling.enable(memory=True)
+        try:
+            Cuts().process(make_frame())
+        finally:
+            profiling.disable()
+        self.assertFalse(profiler.report()['peak_memory'].isnull().any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/resources.py"""
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from lax import resources
+from lax.lichen import Lichen, ManyLichen
+
+
+def _loaded_in_worker(_):
+    return resources.loaded()
+
+
+class Model(Lichen):
+    """Lichen using a pickled model"""
+    filename = None
+
+    def load_resources(self):
+        return resources.load_pickle(self.filename)
+
+    def _evaluate(self, c):
+        return c['a'] > self.load_resources()['threshold']
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Model()]
+
+
+class ResourcesTestCase(unittest.TestCase):
+    """Test case for lax/resources.py
+    """
+
+    def setUp(self):
+        resources.clear()
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'model.pkl')
+        with open(self.filename, 'wb') as f:
+            pickle.dump({'threshold': 0.5}, f)
+        Model.filename = self.filename
+        self.calls = []
+
+    def tearDown(self):
+        resources.clear()
+        shutil.rmtree(self.directory)
+
+    def loader(self, filename):
+        self.calls.append(filename)
+        return object()
+
+    def test_load(self):
+        first = resources.load(self.filename, self.loader)
+        self.assertIs(resources.load(os.path.join(self.directory, '.', 'model.pkl'), self.loader),
+                      first)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(resources.loaded(), [os.path.abspath(self.filename)])
+
+        self.assertEqual(resources.evict(self.filename), 1)
+        self.assertIsNot(resources.load(self.filename, self.loader), first)
+        self.assertEqual(len(self.calls), 2)
+        resources.clear()
+        self.assertEqual(resources.loaded(), [])
+
+    def test_threads(self):
+        threads = [threading.Thread(target=resources.load, args=(self.filename, self.loader))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.calls), 1)
+
+    def test_lichen(self):
+        self.assertEqual(list(Model().evaluate({'a': [0., 1.]})), [False, True])
+        self.assertIs(Model().load_resources(), Model().load_resources())
+
+        resources.clear()
+        resources.preload(Cuts(), freeze=False)
+        self.assertEqual(resources.loaded(), [os.path.abspath(self.filename)])
+
+    def test_tables(self):
+        with open(os.path.join(self.directory, 'cut_values.txt'), 'w') as f:
+            f.write('x y\n1 2.5\n3 4\n')
+        search_path = resources.search_path[:]
+        resources.search_path.insert(0, self.directory)
+        try:
+            self.assertEqual(resources.find('cut_values.txt'),
+                             os.path.join(self.directory, 'cut_values.txt'))
+            self.assertTrue(os.path.exists(resources.find('R_phi_curve_360points.txt')))
+            with self.assertRaises(IOError):
+                resources.find('missing.txt')
+
+            table = resources.load_table('cut_values.txt', skiprows=1)
+            np.testing.assert_array_equal(table, [[1, 2.5], [3, 4]])
+            self.assertIs(resources.load_table('cut_values.txt', skiprows=1), table)
+            self.assertFalse(table.flags.writeable)
+
+            binary = resources.load_table('cut_values.txt', binary=True, skiprows=1)
+            self.assertIsInstance(binary, np.memmap)
+            np.testing.assert_array_equal(binary, table)
+            self.assertTrue(os.path.exists(os.path.join(self.directory, 'cut_values.npy')))
+        finally:
+            resources.search_path[:] = search_path
+
+    @unittest.skipIf('fork' not in multiprocessing.get_all_start_methods(), 'Needs fork')
+    def test_fork(self):
+        """Workers forked after preloading have the models already"""
+        resources.preload(Cuts(), freeze=False)
+        pool = multiprocessing.get_context('fork').Pool(2)
+        try:
+            results = pool.map(_loaded_in_worker, range(2))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(results, [[os.path.abspath(self.filename)]] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/results.py"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax.lichen import Lichen, ManyLichen, StringLichen
+from lax.results import CutResults
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+class Small(StringLichen):
+    string = "abs(b) < 1"
+
+
+class Sum(Lichen):
+    """A _process of its own and no input_columns, like many user lichens"""
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['a'] + df['b'] > 0
+        return df
+
+
+class Both(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Small()]
+
+
+class ResultsTestCase(unittest.TestCase):
+    """Test case for lax/results.py
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame({'a': rng.normal(size=200),
+                                'b': rng.normal(size=200)},
+                               index=np.arange(200) * 3)
+
+    def test_many_words(self):
+        """Bits beyond the first word are stored and combined correctly"""
+        rng = np.random.RandomState(1)
+        outcomes = rng.rand(70, 50) > 0.02
+        results = CutResults(50)
+        for i, passed in enumerate(outcomes):
+            results.add('Cut%d' % i, passed)
+        self.assertEqual(results.words.shape, (50, 2))
+        for i, passed in enumerate(outcomes):
+            np.testing.assert_array_equal(results['Cut%d' % i], passed)
+        np.testing.assert_array_equal(results.passed(), outcomes.all(axis=0))
+        np.testing.assert_array_equal(results.passed(['Cut3', 'Cut66']),
+                                      outcomes[3] & outcomes[66])
+
+    def test_overwrite(self):
+        results = CutResults(3)
+        results.add('CutA', [True, False, True])
+        results.add('CutA', [False, True, True])
+        np.testing.assert_array_equal(results['CutA'], [False, True, True])
+
+    def test_many_lichen(self):
+        """cut_results matches process and leaves no cut columns behind"""
+        expected = Both().process(self.df.copy())
+        df = self.df.copy()
+        results = Both().cut_results(df)
+        self.assertEqual(list(df.columns), ['a', 'b'])
+        pd.testing.assert_frame_equal(results.to_frame(),
+                                      expected[['CutPositive', 'CutSmall', 'CutBoth']])
+
+
+    def test_cutflow(self):
+        cuts = Both().evaluate_cuts(self.df)
+        positive, small = cuts['CutPositive'], cuts['CutSmall']
+        results = CutResults.from_frame(cuts, ['CutPositive', 'CutSmall'])
+        table = results.cutflow()
+        self.assertEqual(list(table.index), ['Total', 'CutPositive', 'CutSmall'])
+        self.assertEqual(list(table['events']), [200, positive.sum(), (positive & small).sum()])
+
+        table = results.n_minus_one()
+        self.assertEqual(list(table.index), ['CutPositive', 'CutSmall', 'All'])
+        self.assertEqual(list(table['events']),
+                         [small.sum(), positive.sum(), (positive & small).sum()])
+
+    def test_groups(self):
+        """Grouped counts add up to the ungrouped ones, for any number of words"""
+        rng = np.random.RandomState(2)
+        outcomes = rng.rand(70, 500) > 0.01
+        results = CutResults(500)
+        for i, passed in enumerate(outcomes):
+            results.add('Cut%d' % i, passed)
+        runs = rng.randint(10, 13, 500)
+        for method in (results.cutflow, results.n_minus_one):
+            table = method(groups=runs)
+            self.assertEqual(list(table.columns), [10, 11, 12])
+            np.testing.assert_array_equal(table.sum(axis=1), method()['events'])
+        n_minus_one = results.n_minus_one()['events']
+        for i in (0, 40, 69):
+            others = np.delete(outcomes, i, axis=0).all(axis=0)
+            self.assertEqual(n_minus_one['Cut%d' % i], others.sum())
+        np.testing.assert_array_equal(results.failures(), (~outcomes).sum(axis=0))
+        # Any order of cuts
+        table = results.cutflow(['Cut66', 'Cut3'])['events']
+        self.assertEqual(list(table), [500, outcomes[66].sum(), (outcomes[66] & outcomes[3]).sum()])
+
+    def test_many_lichen_tables(self):
+        """Tables of chunks add up to those of the whole frame"""
+        chunks = [self.df.iloc[:120], self.df.iloc[120:]]
+        for method in ('cutflow', 'n_minus_one'):
+            expected = getattr(Both(), method)(self.df, by='a', bins=[-10, 0, 10])
+            result = getattr(Both(), method)(iter(chunks), by='a', bins=[-10, 0, 10])
+            pd.testing.assert_frame_equal(result, expected)
+            self.assertEqual(len(expected.columns), 2)
+        efficiency = Both().cutflow(self.df, efficiency=True)['events']
+        self.assertEqual(efficiency['Total'], 1)
+        self.assertAlmostEqual(efficiency['CutPositive'], (self.df['a'] > 0).mean())
+        efficiency = Both().n_minus_one(self.df, efficiency=True)['events']
+        self.assertAlmostEqual(efficiency['CutSmall'],
+                               (self.df['b'][self.df['a'] > 0].abs() < 1).mean())
+        with self.assertRaises(ValueError):
+            Both().cutflow(iter([]))
+
+    def test_undeclared_inputs(self):
+        """Tables of cut sets with lichens declaring no input columns"""
+        cuts = Both()
+        cuts.lichen_list = cuts.lichen_list + [Sum()]
+        expected = cuts.cut_results(self.df.copy())
+        pd.testing.assert_frame_equal(cuts.cutflow(self.df), expected.cutflow())
+        pd.testing.assert_frame_equal(cuts.n_minus_one(self.df), expected.n_minus_one())
+        pd.testing.assert_frame_equal(cuts.overlap(self.df), expected.overlap())
+        self.assertEqual(cuts.cutflow(self.df, by='a', bins=[-10, 0, 10]).loc['CutSum'].sum(),
+                         expected.passed().sum())
+
+    def test_overlap(self):
+        rng = np.random.RandomState(3)
+        outcomes = rng.rand(70, 1001) > 0.3
+        results = CutResults(1001)
+        for i, passed in enumerate(outcomes):
+            results.add('Cut%d' % i, passed)
+        matrix = results.overlap()
+        failed = (~outcomes).astype(int)
+        np.testing.assert_array_equal(matrix.values, failed.dot(failed.T))
+        self.assertEqual(matrix.loc['Cut2', 'Cut68'], (~outcomes[2] & ~outcomes[68]).sum())
+        np.testing.assert_array_equal(results.failed_bits('Cut0').view(np.uint8)[:126],
+                                      np.packbits(~outcomes[0]))
+
+        chunks = [self.df.iloc[:50], self.df.iloc[50:]]
+        expected = Both().overlap(self.df)
+        pd.testing.assert_frame_equal(Both().overlap(iter(chunks)), expected)
+        self.assertEqual(expected.loc['CutPositive', 'CutSmall'],
+                         ((self.df['a'] <= 0) & (self.df['b'].abs() >= 1)).sum())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/sql.py"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax.lichen import Lichen, ManyLichen, RangeLichen, StringLichen
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover
+    duckdb = None
+
+if duckdb is not None:
+    from lax import sql
+
+
+class Positive(StringLichen):
+    string = "a > 0"
+
+
+class Radius(Lichen):
+    """Imperative lichen adding a helper column"""
+    input_columns = ('a', 'b')
+    derived_columns = ('radius',)
+
+    def pre(self, df):
+        df.loc[:, 'radius'] = np.sqrt(df['a'] ** 2 + df['b'] ** 2)
+        return df
+
+    def _process(self, df):
+        df.loc[:, self.name()] = df['radius'] < 1.5
+        return df
+
+
+class OnRadius(StringLichen):
+    string = "radius > 0.5"
+
+
+class Window(RangeLichen):
+    variable = 'b'
+    allowed_range = (-1, 1)
+
+
+class Functions(StringLichen):
+    """sqrt and log of negative numbers are NaN, log(0) is -inf"""
+    string = "~(sqrt(a) < 1) & (log10(b) != -0.3) | (log(n) > -1) & ~(n == @n)"
+
+    def get_parameters(self):
+        return {'n': np.int64(2)}
+
+
+class Ratio(StringLichen):
+    """Division by zero gives infinities (or NaN for 0 / 0), as in numpy"""
+    string = "(a / n > 1) | (n / (b - b) < 0) | (a / 0. > 0) | ~(n / n == 1)"
+
+
+class Cuts(ManyLichen):
+    def __init__(self):
+        self.lichen_list = [Positive(), Radius(), OnRadius(), Window(), Functions(), Ratio()]
+
+
+@unittest.skipIf(duckdb is None, 'duckdb is not installed')
+class SQLTestCase(unittest.TestCase):
+    """Test case for lax/sql.py
+    """
+
+    def setUp(self):
+        self.cuts = Cuts()
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame({'a': rng.normal(size=500), 'b': rng.normal(size=500),
+                           'n': rng.randint(0, 4, size=500)})
+        df.loc[::7, 'a'] = np.nan
+        df.loc[::11, 'b'] = np.nan
+        self.df = df
+        self.expected = self.cuts.evaluate_cuts(df)
+
+    def test_translate(self):
+        schema = {'a': 'DOUBLE', 'b': 'DOUBLE', 'n': 'BIGINT'}
+        expressions, fallback = sql.translate(self.cuts, schema)
+        self.assertEqual(list(expressions),
+                         ['CutPositive', 'CutWindow', 'CutFunctions', 'CutRatio'])
+        self.assertEqual([x.name() for x in fallback], ['CutRadius', 'CutOnRadius'])
+        self.assertIn('ln(', expressions['CutFunctions'])
+
+        query, translated, _ = sql.select(self.cuts, 'events', schema, ['n'])
+        self.assertTrue(query.startswith('SELECT "n", "a", "b", COALESCE('))
+        self.assertEqual(translated, list(expressions))
+
+    def test_query(self):
+        """Translated and fallback lichens give the results of evaluate_cuts"""
+        result = sql.query(self.cuts, self.df)
+        self.assertEqual(list(result.columns), self.cuts.cut_columns())
+        for column in self.expected.columns:
+            np.testing.assert_array_equal(result[column].values,
+                                          self.expected[column].values)
+
+        connection = duckdb.connect()
+        connection.register('events', self.df)
+        result = sql.query(self.cuts, 'events', connection, columns=['n'], passed_only=True)
+        passed = self.expected['CutCuts'].values
+        self.assertGreater(passed.sum(), 0)
+        np.testing.assert_array_equal(result['n'].values, self.df['n'].values[passed])
+        self.assertTrue(result['CutCuts'].all())
+
+        with self.assertRaises(KeyError):
+            sql.query(self.cuts, self.df[['a', 'n']])
+
+    def test_division(self):
+        """Divisions by zero do not depend on the DuckDB settings"""
+        self.assertTrue(self.expected['CutRatio'].any())
+        self.assertFalse(self.expected['CutRatio'].all())
+        df = self.df.assign(b=np.where(np.arange(500) % 3, -0., 0.))
+        expected = Ratio().evaluate(df)
+        connection = duckdb.connect()
+        try:
+            connection.execute('SET ieee_floating_point_ops = false')
+        except duckdb.Error:  # pragma: no cover
+            pass    # Before DuckDB 1.1, always
+        result = sql.query(Ratio(), df, connection)
+        np.testing.assert_array_equal(result['CutRatio'].values, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
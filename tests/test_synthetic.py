@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/synthetic.py"""
+import importlib
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lax import synthetic
+
+
+class SyntheticTestCase(unittest.TestCase):
+    """Test case for lax/synthetic.py
+    """
+
+    def test_make_events(self):
+        df = synthetic.make_events(1000, seed=1)
+        self.assertEqual(list(df.columns), list(synthetic.COLUMNS))
+        self.assertEqual(len(df), 1000)
+        self.assertFalse(df.isnull().values.any())
+        pd.testing.assert_frame_equal(df, synthetic.make_events(1000, seed=1))
+        self.assertFalse(df['s1'].equals(synthetic.make_events(1000, seed=2)['s1']))
+
+    def test_columns(self):
+        df = synthetic.make_events(100, seed=1)
+        subset = synthetic.make_events(100, seed=1, columns=['s2', 'cs1'])
+        self.assertEqual(list(subset.columns), ['s2', 'cs1'])
+        pd.testing.assert_frame_equal(subset, df[['s2', 'cs1']])
+        with self.assertRaises(KeyError):
+            synthetic.make_events(100, columns=['s1', 'no_such_column'])
+
+    def test_nan_fraction(self):
+        df = synthetic.make_events(10000, nan_fraction=0.1)
+        fraction = df['s1'].isnull().mean()
+        self.assertTrue(0.08 < fraction < 0.12)
+        self.assertFalse(df['run_number'].isnull().any())
+
+    def test_iter_events(self):
+        chunks = list(synthetic.iter_events(2500, chunksize=1000, columns=['event_number']))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+        df = pd.concat(chunks)
+        np.testing.assert_array_equal(df.index, np.arange(2500))
+        np.testing.assert_array_equal(df['event_number'], np.arange(2500))
+        # Chunks do not depend on the size of the dataset
+        first = next(synthetic.iter_events(10 ** 8, chunksize=1000))
+        pd.testing.assert_frame_equal(first, next(synthetic.iter_events(1000, chunksize=1000)))
+        with self.assertRaises(ValueError):
+            next(synthetic.iter_events(10, chunksize=0))
+
+    def test_lichen_columns(self):
+        """Every column the lichens read has synthetic values"""
+        for name in ('sciencerun0', 'sciencerun1', 'postsr1', 'sciencerun2'):
+            try:
+                module = importlib.import_module('lax.lichens.' + name)
+            except ImportError as e:
+                self.skipTest('Cannot import lax.lichens.%s: %s' % (name, e))
+            for cut_set in ('AllEnergy', 'LowEnergyBackground'):
+                if hasattr(module, cut_set):
+                    missing = set(getattr(module, cut_set)().required_columns())
+                    missing -= set(synthetic.COLUMNS)
+                    self.assertEqual(missing, set(), '%s.%s' % (name, cut_set))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Test of lax/trees.py"""
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+import pandas as pd
+
+from lax import resources, trees
+from lax.lichens import sciencerun0
+
+try:
+    import sklearn.ensemble
+except ImportError:
+    sklearn = None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lax', 'data')
+GBDT = os.path.join(DATA_DIR, 'XENON1T_gradient_bdt_peak_classifier_02052018')
+
+# Features (s1, s1_area_fraction_top, s1_rise_time, s1_range_90p_area) and the
+# predict_proba of class 1 of the GBDT pickle evaluated by scikit-learn itself
+# (its trees unpickled with scikit-learn's Tree, not through lax.trees)
+GBDT_REFERENCE = [
+    (12.521, 0.979, 33.238, 119.544, 0.37691190545145437),
+    (26.939, 0.799, 15.469, 358.55, 0.8773637319921147),
+    (16.052, 0.461, 98.446, 53.712, 0.41969254792403116),
+    (12.296, 0.781, 97.269, 158.856, 0.5090225916003326),
+    (7.036, 0.118, 30.045, 30.056, 0.15705637737097256),
+    (19.579, 0.64, 23.465, 184.945, 0.5325666925895579),
+    (7.502, 0.143, 41.622, 49.057, 0.1662217471671266),
+    (60.75, 0.945, 43.352, 35.262, 0.7120155293041387),
+    (84.591, 0.522, 20.448, 123.536, 0.4443411133187511),
+    (5.846, 0.415, 49.113, 21.24, 0.39539247615275197),
+    (38.322, 0.265, 33.081, 262.464, 0.09147704347253773),
+    (11.423, 0.774, 66.878, 20.246, 0.5221758442424224),
+]
+
+
+def shipped_features(n, seed=0):
+    """Features of SingleElectronS2s, spanning its training domain"""
+    rng = np.random.RandomState(seed)
+    return np.column_stack([10 ** rng.uniform(0, 2.5, n), rng.uniform(0, 1, n),
+                            rng.gamma(4, 15, n), 10 ** rng.uniform(1.3, 3, n)])
+
+
+def traversed(ensemble, X):
+    """Scores of ensemble going down the trees node by node"""
+    scores = ensemble.value[ensemble.apply(X)].sum(axis=0)
+    if ensemble.kind == 'boosting':
+        scores = ensemble.init + ensemble.learning_rate * scores
+    return scores
+
+
+class TreesTestCase(unittest.TestCase):
+    """Test case for lax/trees.py
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.X = rng.normal(size=(2000, 4))
+        self.y = (self.X[:, 0] + self.X[:, 1] ** 2 + rng.normal(size=2000) > 1).astype(int)
+        self.y3 = np.digitize(self.X[:, 2] + self.X[:, 0], [-0.5, 0.5])
+        self.test = rng.normal(size=(3000, 4))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, model):
+        """Exported model, directly and through a pickle and an .npz file, matches model"""
+        filename = os.path.join(self.directory, 'model.pkl')
+        with open(filename, 'wb') as f:
+            pickle.dump(model, f)
+        expected = model.predict_proba(self.test)
+        for ensemble in (trees.TreeEnsemble.from_sklearn(model),
+                         trees.export(filename, os.path.join(self.directory, 'model.npz')),
+                         trees.load(os.path.join(self.directory, 'model.npz'))):
+            np.testing.assert_allclose(ensemble.predict_proba(self.test), expected,
+                                       rtol=0, atol=1e-12)
+        return ensemble
+
+    @unittest.skipIf(sklearn is None, 'Needs scikit-learn')
+    def test_forests(self):
+        deep = self.check(sklearn.ensemble.RandomForestClassifier(10, random_state=0).fit(self.X, self.y))
+        self.assertIsNone(deep._leaf_tables())
+        shallow = self.check(sklearn.ensemble.ExtraTreesClassifier(
+            10, max_depth=5, random_state=0).fit(self.X, self.y3))
+        self.assertIsNotNone(shallow._leaf_tables())
+
+    @unittest.skipIf(sklearn is None, 'Needs scikit-learn')
+    def test_boosting(self):
+        for y in (self.y, self.y3):
+            self.check(sklearn.ensemble.GradientBoostingClassifier(
+                n_estimators=20, random_state=0).fit(self.X, y))
+        self.check(sklearn.ensemble.GradientBoostingClassifier(
+            n_estimators=20, init='zero', random_state=0).fit(self.X, self.y))
+
+    def test_shipped_model(self):
+        """The exported SingleElectronS2s classifier matches its pickle, with either evaluation"""
+        ensemble = trees.load(GBDT + '.npz')
+        self.assertEqual(ensemble.kind, 'boosting')
+        self.assertEqual(len(ensemble.roots), 300)
+        X = np.column_stack([10 ** np.random.RandomState(1).uniform(0, 2.5, 1000),
+                             np.random.RandomState(2).uniform(0, 1, 1000),
+                             np.random.RandomState(3).gamma(4, 15, 1000),
+                             10 ** np.random.RandomState(4).uniform(1.3, 3, 1000)])
+        np.testing.assert_array_equal(ensemble.predict_proba(X),
+                                      trees.export(GBDT + '.pkl').predict_proba(X))
+        np.testing.assert_allclose(ensemble.decision_function(X), traversed(ensemble, X),
+                                   rtol=0, atol=1e-12)
+
+        reference = np.array(GBDT_REFERENCE)
+        np.testing.assert_allclose(ensemble.predict_proba(reference[:, :4])[:, 1], reference[:, 4],
+                                   rtol=0, atol=1e-12)
+
+        X[3, 2] = np.nan
+        proba = ensemble.predict_proba(X)
+        self.assertTrue(np.isnan(proba[3]).all())
+        self.assertFalse(np.isnan(proba[4]).any())
+
+    def check_bounds(self, ensemble, X, n_edges):
+        """Bounds of a grid hold every event of X"""
+        edges = trees.threshold_edges([ensemble], n_edges)
+        grid = trees.BoundsGrid(edges, *ensemble.proba_bounds(edges, column=0))
+        low, high = grid.lookup(X)
+        proba = ensemble.predict_proba(X)[:, 0]
+        self.assertTrue((low <= proba + 1e-12).all())
+        self.assertTrue((high >= proba - 1e-12).all())
+        self.assertTrue((low < high).any())
+        return grid
+
+    @unittest.skipIf(sklearn is None, 'Needs scikit-learn')
+    def test_bounds(self):
+        model = sklearn.ensemble.RandomForestClassifier(10, random_state=0).fit(self.X, self.y)
+        self.check_bounds(trees.TreeEnsemble.from_sklearn(model), self.test, 10)
+
+    def test_shipped_model_bounds(self):
+        grid = self.check_bounds(trees.load(GBDT + '.npz'), shipped_features(5000), 6)
+        filename = os.path.join(self.directory, 'grid.npz')
+        grid.key = 'test'
+        grid.save(filename)
+        loaded = trees.BoundsGrid.load(filename)
+        self.assertEqual(loaded.key, 'test')
+        np.testing.assert_array_equal(loaded.high, grid.high)
+        low, high = loaded.lookup([[1, np.nan, 1, 1]])
+        self.assertEqual((low[0], high[0]), (-np.inf, np.inf))
+
+    def test_grid_mode(self):
+        """SingleElectronS2s decides events with its grid as with its classifiers"""
+
+        class GridSingleElectronS2s(sciencerun0.SingleElectronS2s):
+            # The random forest is not shipped; both classifiers are the GBDT
+            forest_filename = GBDT + '.npz'
+            grid_filename = os.path.join(self.directory, 'grid.npz')
+            grid_edges = 8
+            grid = True
+
+        X = shipped_features(20000, seed=1)
+        X[:10, 2] = np.nan
+        df = pd.DataFrame(X, columns=sciencerun0.SingleElectronS2s.input_columns)
+        expected = sciencerun0.SingleElectronS2s()
+        expected.forest_filename = GBDT + '.npz'
+        try:
+            exact = expected.process(df.copy())
+            approximate = GridSingleElectronS2s().process(df.copy())
+            self.assertTrue(os.path.exists(os.path.join(self.directory, 'grid_8.npz')))
+            resources.clear()
+            cached = GridSingleElectronS2s().process(df.copy())
+            # Another number of edges is another grid, also while the first is loaded
+            finer = GridSingleElectronS2s()
+            finer.grid_edges = 12
+            finer.process(df.copy())
+            self.assertTrue(os.path.exists(os.path.join(self.directory, 'grid_12.npz')))
+            self.assertTrue(resources.load(finer.grid_path(), finer._load_grid).key.startswith('12 '))
+        finally:
+            resources.clear()
+        name = GridSingleElectronS2s().name()
+        np.testing.assert_array_equal(approximate[name], exact[expected.name()])
+        np.testing.assert_array_equal(cached[name], exact[expected.name()])
+        self.assertTrue(approximate[name].any())
+        self.assertFalse(approximate[name].all())
+
+    def test_unsafe_pickle(self):
+        filename = os.path.join(self.directory, 'other.pkl')
+        with open(filename, 'wb') as f:
+            pickle.dump(OrderedDict(a=1), f)
+        with self.assertRaises(pickle.UnpicklingError):
+            trees.read_sklearn_pickle(filename)
+        with self.assertRaises(ValueError):
+            trees.TreeEnsemble.from_sklearn(object())
+
+
+if __name__ == '__main__':
+    unittest.main()